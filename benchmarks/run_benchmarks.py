@@ -0,0 +1,421 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+# Run from the repository root: python -m benchmarks.run_benchmarks
+from benchmarks.stub_model import STUB_MODEL_PATH, install_stub
+from benchmarks.synthetic import make_blueprint, write_blueprint_pdf, write_blueprints
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SUITES = ('inference', 'quotation', 'report', 'app', 'startup')
+
+
+def summarize(times_s, items=1):
+    """Latency statistics for a list of wall-clock durations in seconds."""
+    ms = np.array(times_s) * 1000
+    median = float(np.median(ms))
+    return {
+        'runs': len(ms),
+        'mean_ms': float(ms.mean()),
+        'median_ms': median,
+        'min_ms': float(ms.min()),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'items_per_s': items / (median / 1000) if median else None,
+    }
+
+
+def measure(fn, repeat=5, warmup=1, items=1):
+    """Time `fn()` `repeat` times after `warmup` untimed calls."""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return summarize(times, items)
+
+
+def parse_size(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def bench_inference(args, results):
+    from src.inference import run_inference
+    from src.object_detection import detect_objects, iter_detections
+
+    # src.object_detection configures INFO logging on import
+    logging.getLogger().setLevel(logging.WARNING)
+    stub = install_stub(forward_ms=args.forward_ms)
+    for size in args.sizes:
+        width, height = parse_size(size)
+        directory = os.path.join('images', size)
+        blueprints = write_blueprints(directory, args.images, width, height, args.density)
+        paths = [path for path, _ in blueprints]
+        expected = int(sum(counts.sum() for _, counts in blueprints))
+
+        found = sum(len(run_inference(path, STUB_MODEL_PATH, use_cache=False)) for path in paths)
+        results[f'inference.run_inference.{size}.uncached'] = dict(
+            measure(lambda: [run_inference(path, STUB_MODEL_PATH, use_cache=False) for path in paths],
+                    args.repeat, items=len(paths)),
+            symbols_expected=expected, symbols_found=found)
+        results[f'inference.run_inference.{size}.cached'] = measure(
+            lambda: [run_inference(path, STUB_MODEL_PATH) for path in paths], args.repeat, items=len(paths))
+
+        def run_bytes():
+            from src.inference import run_inference_on_bytes
+            for path in paths:
+                with open(path, 'rb') as f:
+                    run_inference_on_bytes(f.read(), path, model_path=STUB_MODEL_PATH, use_cache=False)
+        results[f'inference.run_inference_on_bytes.{size}'] = measure(run_bytes, args.repeat, items=len(paths))
+
+        results[f'inference.run_inference.{size}.tiled'] = measure(
+            lambda: [run_inference(path, STUB_MODEL_PATH, use_cache=False, tile_size=640) for path in paths],
+            args.repeat, items=len(paths))
+        results[f'inference.detect_objects.{size}'] = measure(
+            lambda: detect_objects(directory, STUB_MODEL_PATH, use_cache=False), args.repeat, items=len(paths))
+        results[f'inference.iter_detections.{size}'] = measure(
+            lambda: list(iter_detections(directory, STUB_MODEL_PATH, use_cache=False, batch_size=8)),
+            args.repeat, items=len(paths))
+
+        try:
+            pdf_path = write_blueprint_pdf(os.path.join('images', f'set_{size}.pdf'), args.pdf_pages, width, height,
+                                           args.density)
+        except ImportError:
+            logging.warning("PyMuPDF not installed; skipping the PDF benchmark")
+        else:
+            results[f'inference.run_inference.{size}.pdf'] = measure(
+                lambda: run_inference(pdf_path, STUB_MODEL_PATH, use_cache=False, pdf_dpi=72),
+                args.repeat, items=args.pdf_pages)
+
+        bench_revision(size, paths[0], results, args.repeat)
+
+        if args.real_model and os.path.exists(args.real_model):
+            results[f'inference.real_model.{size}'] = measure(
+                lambda: [run_inference(path, args.real_model, use_cache=False, device='cpu') for path in paths],
+                args.repeat, items=len(paths))
+    results['inference.stub_calls'] = {'calls': stub.calls, 'frames': stub.frames}
+
+
+def bench_revision(size, path, results, repeat):
+    """Re-quote a sheet with one added symbol against its previous revision vs. from scratch."""
+    from benchmarks.synthetic import SYMBOL_COLORS
+    from src.revisions import RevisionStore, requote_revision
+
+    original = cv2.imread(path)
+    revised = original.copy()
+    center = (original.shape[1] // 2, original.shape[0] // 2)
+    cv2.circle(revised, center, 12, SYMBOL_COLORS[1], -1)
+    original_bytes = cv2.imencode('.png', original)[1].tobytes()
+    revised_bytes = cv2.imencode('.png', revised)[1].tobytes()
+    store = RevisionStore(os.path.join('revisions', size))
+    previous = requote_revision(original_bytes, 'original.png', model_path=STUB_MODEL_PATH, use_cache=False,
+                                store=store)['digest']
+
+    def requote(previous_digest):
+        return requote_revision(revised_bytes, 'revised.png', previous_digest=previous_digest,
+                                model_path=STUB_MODEL_PATH, use_cache=False, store=store)
+
+    incremental = requote(previous)
+    results[f'inference.revision.{size}.full'] = measure(lambda: requote(None), repeat)
+    results[f'inference.revision.{size}.incremental'] = dict(
+        measure(lambda: requote(previous), repeat),
+        changed_tiles=incremental['changed_tiles'], total_tiles=incremental['total_tiles'])
+
+
+def bench_quotation(args, results):
+    from src.counter_store import get_counter_store
+    from src.detections import Detections
+    from src.quotation_generator import QuotationGenerator
+
+    rng = np.random.default_rng(0)
+    for num_detections in (100, 10000):
+        detections = Detections(rng.integers(0, 3, num_detections), rng.random(num_detections),
+                                rng.random((num_detections, 4)) * 1000, rng.integers(0, 10, num_detections))
+        as_list = detections.to_list()
+        for backend in ('sqlite', 'log'):
+            for existing in args.counts:
+                counts_file = os.path.join('counts', f'{backend}_{existing}_{num_detections}.json')
+                os.makedirs('counts', exist_ok=True)
+                with open(counts_file, 'w') as f:
+                    json.dump({f'{i:064x}': int(i % 7) + 1 for i in range(existing)}, f)
+                start = time.perf_counter()
+                store = get_counter_store(counts_file, backend=backend)
+                import_ms = (time.perf_counter() - start) * 1000
+                generator = QuotationGenerator(counts_file=counts_file, counter_store=store)
+                name = f'quotation.{backend}.counts_{existing}.detections_{num_detections}'
+                results[name] = dict(measure(lambda: generator.generate_quotation(detections), args.repeat * 4),
+                                     import_ms=import_ms)
+                results[name + '.list_input'] = measure(lambda: generator.generate_quotation(as_list),
+                                                        args.repeat * 4)
+
+    # Same-class overlap suppression and per-room breakdown on a sheet-sized layout of symbol boxes
+    from src.spatial_index import suppress_overlaps
+    from src.tiling import nms
+
+    for num_detections in (1000, 10000):
+        corners = rng.random((num_detections, 2)) * 20000
+        boxes = np.concatenate((corners, corners + 20 + rng.random((num_detections, 2)) * 20), axis=1)
+        detections = Detections(rng.integers(0, 3, num_detections), rng.random(num_detections), boxes)
+        results[f'quotation.suppress_overlaps.grid.detections_{num_detections}'] = measure(
+            lambda: suppress_overlaps(detections, 0.5), args.repeat)
+        results[f'quotation.suppress_overlaps.greedy.detections_{num_detections}'] = measure(
+            lambda: nms(detections.boxes, detections.confidences, 0.5, class_ids=detections.class_ids), args.repeat)
+        regions = [{'name': f'Room {i}', 'rect': [x, y, x + 2000, y + 2000]}
+                   for i, (x, y) in enumerate((x, y) for y in range(0, 20000, 2000) for x in range(0, 20000, 2000))]
+        generator = QuotationGenerator(counts_file=os.path.join('counts', 'regions.json'))
+        results[f'quotation.regions_100.detections_{num_detections}'] = measure(
+            lambda: generator.generate_quotation(detections, regions=regions), args.repeat)
+
+
+def bench_report(args, results):
+    from src.artifact_store import ArtifactStore
+    from src.report_cache import ReportCache
+    from src.report_generator import ReportGenerator
+
+    os.makedirs('reports', exist_ok=True)
+    for num_items in (10, 1000, 10000):
+        quotation = {
+            'items': {i: i % 50 + 1 for i in range(num_items)},
+            'unit_prices': {i: 10.0 + i % 3 * 10 for i in range(num_items)},
+            'total_cost': 0.0,
+            'quotation_hash': f'{num_items:064x}',
+        }
+        path = os.path.join('reports', f'items_{num_items}.pdf')
+        results[f'report.generate_pdf.items_{num_items}'] = measure(
+            lambda: ReportGenerator(filename=path).generate_pdf(quotation), max(1, args.repeat // 2))
+
+    cache = ReportCache(ArtifactStore(os.path.join('reports', 'cache')))
+    quotation = {'items': {0: 3, 1: 5, 2: 2}, 'unit_prices': {0: 10.0, 1: 20.0, 2: 30.0}, 'total_cost': 190.0,
+                 'quotation_hash': 'f' * 64}
+    cache.get_or_render(quotation)
+    results['report.cache_hit'] = measure(lambda: cache.get_or_render(quotation), args.repeat * 20)
+
+    batch = [{'quotation': dict(quotation, quotation_hash=f'{i:064x}')} for i in range(args.report_batch)]
+    start = time.perf_counter()
+    cache.render_many(batch, workers=args.workers)
+    results['report.render_many'] = dict(summarize([time.perf_counter() - start], len(batch)),
+                                         workers=args.workers)
+
+
+def bench_app(args, results):
+    os.environ['AIPQS_MODEL_PATH'] = STUB_MODEL_PATH
+    install_stub(forward_ms=args.forward_ms)
+    from src.app import app
+
+    width, height = parse_size(args.sizes[0])
+    base, _ = make_blueprint(width, height, args.density, seed=123)
+
+    def unique_upload(i):
+        # Change a corner pixel so every request misses the detection cache
+        img = base.copy()
+        img[0, 0] = (i % 256, i // 256 % 256, 7)
+        return cv2.imencode('.png', img)[1].tobytes()
+
+    def run_load(name, concurrency, requests, send):
+        latencies, errors = [], 0
+
+        def worker(i):
+            client = app.test_client()
+            start = time.perf_counter()
+            ok = send(client, i)
+            return time.perf_counter() - start, ok
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for latency, ok in pool.map(worker, range(requests)):
+                latencies.append(latency)
+                errors += not ok
+        wall = time.perf_counter() - start
+        results[name] = dict(summarize(latencies), concurrency=concurrency, requests=requests, errors=errors,
+                             throughput_rps=requests / wall)
+
+    for concurrency in args.concurrency:
+        requests = max(args.requests, concurrency)
+        payloads = [unique_upload(concurrency * 1000 + i) for i in range(requests)]
+
+        def upload(client, i):
+            response = client.post('/', data={'blueprint': (_stream(payloads[i]), f'c{concurrency}_{i}.png'),
+                                              'tax_percent': '10', 'discount_percent': '0'},
+                                   content_type='multipart/form-data')
+            return response.status_code == 200
+
+        def finalize(client, i):
+            response = client.post('/finalize', data={'blueprint_filename': f'c{concurrency}_{i}.png',
+                                                      'tax_percent': '10', 'discount_percent': '0'})
+            return response.status_code == 302 and '/download/' in response.headers.get('Location', '')
+
+        def job(client, i):
+            response = client.post('/jobs', data={'blueprint': (_stream(payloads[i]), f'job_{i}.png')},
+                                   content_type='multipart/form-data')
+            if response.status_code != 202:
+                return False
+            status_url = response.get_json()['status_url']
+            while True:
+                status = client.get(status_url).get_json()['status']
+                if status in ('done', 'failed'):
+                    return status == 'done'
+                time.sleep(0.005)
+
+        run_load(f'app.upload.c{concurrency}', concurrency, requests, upload)
+        run_load(f'app.finalize.c{concurrency}', concurrency, requests, finalize)
+        # Fresh payloads so jobs are not served from the detection cache
+        payloads = [unique_upload(500000 + concurrency * 1000 + i) for i in range(requests)]
+        run_load(f'app.jobs.c{concurrency}', concurrency, requests, job)
+        run_load(f'app.stats.c{concurrency}', concurrency, requests * 4,
+                 lambda client, i: client.get('/inference/stats').status_code == 200)
+
+
+# Run in a fresh interpreter per measurement so nothing is already imported or cached
+_STARTUP_PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+from src import app
+imported = time.perf_counter() - start
+if os.environ['AIPQS_BENCH_STUB'] == '1':
+    from benchmarks.stub_model import install_stub
+    install_stub(app.MODEL_PATH, device=app.MODEL_DEVICE)
+app.warm_up()
+heavy = [name for name in ('torch', 'ultralytics', 'cv2', 'reportlab', 'pymupdf', 'onnxruntime') if name in sys.modules]
+print(json.dumps({'import_s': imported, 'ready_s': time.perf_counter() - start, 'ready': app.startup['ready'],
+                  'error': app.startup['error'], 'heavy_modules_after_ready': heavy}))
+"""
+
+
+def bench_startup(args, results):
+    # Cold start of a web worker: importing the app, then loading and warming up the model
+    real = os.path.exists(args.real_model)
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT, AIPQS_WARMUP_ON_IMPORT='0', AIPQS_BENCH_STUB='0' if real else '1',
+               AIPQS_MODEL_PATH=args.real_model if real else STUB_MODEL_PATH)
+    runs = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, '-c', _STARTUP_PROBE], env=env, capture_output=True, text=True,
+                             check=True).stdout
+        probe = json.loads(out.strip().splitlines()[-1])
+        probe['process_s'] = time.perf_counter() - start
+        runs.append(probe)
+    name = 'startup.real' if real else 'startup.stub'
+    results[f'{name}.import'] = summarize([run['import_s'] for run in runs])
+    results[f'{name}.ready'] = dict(summarize([run['ready_s'] for run in runs]), error=runs[-1]['error'])
+    results[f'{name}.process'] = summarize([run['process_s'] for run in runs])
+    results[f'{name}.heavy_modules'] = {'after_ready': runs[-1]['heavy_modules_after_ready']}
+
+
+def _stream(data):
+    import io
+    return io.BytesIO(data)
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True,
+                                timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+    }
+
+
+def compare(baseline, current, threshold=0.15):
+    """
+    List benchmarks whose median latency grew by more than `threshold` (a fraction).
+
+    Returns:
+        list of tuple: (name, baseline median ms, current median ms, ratio)
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name, {}).get('median_ms')
+        after = result.get('median_ms')
+        if before and after and after / before > 1 + threshold:
+            regressions.append((name, before, after, after / before))
+    return regressions
+
+
+def run(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix='aipqs_bench_')
+    os.makedirs(workdir, exist_ok=True)
+    # Uploads, caches and counters are created relative to the working directory
+    os.chdir(workdir)
+
+    results = {}
+    suites = {'inference': bench_inference, 'quotation': bench_quotation, 'report': bench_report, 'app': bench_app,
+              'startup': bench_startup}
+    for suite in args.suites:
+        print(f"Running {suite} benchmarks in {workdir}", file=sys.stderr)
+        start = time.perf_counter()
+        suites[suite](args, results)
+        print(f"  {suite} finished in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    config = {key: value for key, value in vars(args).items() if key not in ('output', 'compare')}
+    return {'meta': dict(environment(), config=config), 'results': results}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Offline CPU benchmarks for the detection-to-quotation pipeline")
+    parser.add_argument('--suites', type=str, nargs='+', default=list(SUITES), choices=SUITES,
+                        help='Benchmark suites to run')
+    parser.add_argument('--sizes', type=str, nargs='+', default=['2000x1400', '6000x4000'],
+                        help='Synthetic blueprint sizes, WIDTHxHEIGHT')
+    parser.add_argument('--density', type=float, default=40, help='Symbols per megapixel')
+    parser.add_argument('--images', type=int, default=8, help='Blueprints per size')
+    parser.add_argument('--pdf_pages', type=int, default=4, help='Pages in the synthetic PDF drawing set')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed repetitions per benchmark')
+    parser.add_argument('--forward_ms', type=float, default=0.0, help='Simulated forward-pass cost of the stub')
+    parser.add_argument('--real_model', type=str, default=os.path.join(REPO_ROOT, 'models', 'yolov8m_trained.pt'),
+                        help='Also benchmark these weights when the file exists')
+    parser.add_argument('--counts', type=int, nargs='+', default=[1000, 100000],
+                        help='Existing quotation counts to seed the counter store with')
+    parser.add_argument('--report_batch', type=int, default=20, help='Reports rendered by the batch benchmark')
+    parser.add_argument('--workers', type=int, default=2, help='Processes for batch report rendering')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16],
+                        help='Concurrent clients for the Flask route benchmarks')
+    parser.add_argument('--requests', type=int, default=32, help='Requests per route and concurrency level')
+    parser.add_argument('--workdir', type=str, default=None, help='Scratch directory (default: a new temp dir)')
+    parser.add_argument('--output', type=str, default=None, help='Write the JSON results to this file')
+    parser.add_argument('--compare', type=str, default=None, help='Baseline JSON to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='Allowed median slowdown before a benchmark is flagged, as a fraction')
+
+    args = parser.parse_args()
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    if args.compare:
+        args.compare = os.path.abspath(args.compare)
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        for name, before, after, ratio in regressions:
+            print(f"REGRESSION {name}: {before:.2f} ms -> {after:.2f} ms ({ratio:.2f}x)", file=sys.stderr)
+        if regressions:
+            raise SystemExit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.compare}", file=sys.stderr)
@@ -0,0 +1,67 @@
+from benchmarks.synthetic import SYMBOL_COLORS
+from src.detections import Detections
+from src.model_registry import get_registry
+import numpy as np
+import cv2
+import time
+
+STUB_MODEL_PATH = 'benchmarks/stub_model.pt'
+
+
+class StubYOLO:
+    """
+    Deterministic stand-in for a trained YOLO model.
+
+    Finds the colour-coded symbols drawn by benchmarks.synthetic with
+    connected components, so results are exact and repeatable without
+    weights or a GPU. `forward_ms` adds a fixed per-batch cost to mimic a
+    network forward pass. Returns Detections like the exported-model
+    backends, which the pipeline accepts anywhere an ultralytics Result is
+    expected.
+    """
+
+    def __init__(self, forward_ms=0.0, tolerance=40, min_area=20):
+        self.names = {0: 'switch', 1: 'light', 2: 'outlet'}
+        self.forward_ms = forward_ms
+        self.tolerance = tolerance
+        self.min_area = min_area
+        self.calls = 0
+        self.frames = 0
+
+    def __call__(self, images, conf=0.25, **kwargs):
+        if isinstance(images, np.ndarray) and images.ndim == 3:
+            images = [images]
+        self.calls += 1
+        self.frames += len(images)
+        if self.forward_ms:
+            time.sleep(self.forward_ms / 1000.0)
+        return [self._detect(img) for img in images]
+
+    def predict(self, images, **kwargs):
+        return self(images, **kwargs)
+
+    def to(self, device):
+        return self
+
+    def _detect(self, img):
+        parts = []
+        for class_id, color in SYMBOL_COLORS.items():
+            lower = np.clip(np.array(color) - self.tolerance, 0, 255).astype(np.uint8)
+            upper = np.clip(np.array(color) + self.tolerance, 0, 255).astype(np.uint8)
+            mask = cv2.inRange(img, lower, upper)
+            num, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+            stats = stats[1:num]
+            stats = stats[stats[:, cv2.CC_STAT_AREA] >= self.min_area]
+            if len(stats) == 0:
+                continue
+            x, y = stats[:, cv2.CC_STAT_LEFT], stats[:, cv2.CC_STAT_TOP]
+            boxes = np.stack([x, y, x + stats[:, cv2.CC_STAT_WIDTH], y + stats[:, cv2.CC_STAT_HEIGHT]], axis=1)
+            parts.append(Detections(np.full(len(boxes), class_id), np.full(len(boxes), 0.9), boxes))
+        return Detections.concat(parts)
+
+
+def install_stub(model_path=STUB_MODEL_PATH, forward_ms=0.0, device=None):
+    """Register a StubYOLO in the process-wide model registry under `model_path`."""
+    model = StubYOLO(forward_ms=forward_ms)
+    get_registry().register(model_path, model, device=device)
+    return model
@@ -0,0 +1,93 @@
+import numpy as np
+import cv2
+import os
+
+# Symbols are drawn in a pure colour per class so the stub model can find them exactly
+SYMBOL_COLORS = {
+    0: (255, 0, 0),   # switch: blue square (BGR)
+    1: (0, 0, 255),   # light: red circle
+    2: (0, 160, 0),   # outlet: green rectangle
+}
+
+
+def make_blueprint(width=2000, height=1400, density=40, symbol_size=24, seed=0):
+    """
+    Draw a synthetic blueprint: wall lines, room labels and coloured symbols.
+
+    Args:
+        width, height (int): Sheet size in pixels.
+        density (float): Symbols per megapixel.
+        symbol_size (int): Symbol edge length in pixels.
+        seed (int): RNG seed; the same arguments always give the same image.
+
+    Returns:
+        tuple: (BGR image, per-class symbol counts as an array indexed by class id)
+    """
+    rng = np.random.default_rng(seed)
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+
+    # Walls and room labels give the decoders and the model realistic clutter
+    for _ in range(max(4, width * height // 100000)):
+        x1, y1 = int(rng.integers(0, width)), int(rng.integers(0, height))
+        if rng.random() < 0.5:
+            x2, y2 = int(rng.integers(0, width)), y1
+        else:
+            x2, y2 = x1, int(rng.integers(0, height))
+        cv2.line(img, (x1, y1), (x2, y2), (40, 40, 40), int(rng.integers(2, 6)))
+    for i in range(max(1, width * height // 400000)):
+        org = (int(rng.integers(0, max(1, width - 200))), int(rng.integers(30, height)))
+        cv2.putText(img, f"ROOM {i + 1}", org, cv2.FONT_HERSHEY_SIMPLEX, 1.0, (60, 60, 60), 2)
+
+    count = int(round(density * width * height / 1e6))
+    counts = np.zeros(len(SYMBOL_COLORS), dtype=np.int64)
+    # Place symbols on a jittered grid so they never touch each other
+    cell = symbol_size * 3
+    cols, rows = max(1, width // cell), max(1, height // cell)
+    cells = rng.permutation(cols * rows)[:min(count, cols * rows)]
+    for index in cells:
+        class_id = int(rng.integers(0, len(SYMBOL_COLORS)))
+        x = int((index % cols) * cell + rng.integers(0, cell - symbol_size))
+        y = int((index // cols) * cell + rng.integers(0, cell - symbol_size))
+        color = SYMBOL_COLORS[class_id]
+        if class_id == 0:
+            cv2.rectangle(img, (x, y), (x + symbol_size, y + symbol_size), color, -1)
+        elif class_id == 1:
+            radius = symbol_size // 2
+            cv2.circle(img, (x + radius, y + radius), radius, color, -1)
+        else:
+            cv2.rectangle(img, (x, y + symbol_size // 4), (x + symbol_size, y + 3 * symbol_size // 4), color, -1)
+        counts[class_id] += 1
+    return img, counts
+
+
+def write_blueprints(directory, count=8, width=2000, height=1400, density=40, ext='.png', seed=0):
+    """
+    Write `count` synthetic blueprints to `directory`.
+
+    Returns:
+        list of tuple: (image path, per-class symbol counts)
+    """
+    os.makedirs(directory, exist_ok=True)
+    blueprints = []
+    for i in range(count):
+        img, counts = make_blueprint(width, height, density, seed=seed + i)
+        path = os.path.join(directory, f"blueprint_{width}x{height}_{i:03d}{ext}")
+        cv2.imwrite(path, img)
+        blueprints.append((path, counts))
+    return blueprints
+
+
+def write_blueprint_pdf(path, pages=4, width=2000, height=1400, density=40, seed=0):
+    """Write a multi-page PDF drawing set of synthetic blueprints (requires PyMuPDF)."""
+    import pymupdf
+
+    doc = pymupdf.open()
+    for i in range(pages):
+        img, _ = make_blueprint(width, height, density, seed=seed + i)
+        ok, png = cv2.imencode('.png', img)
+        # One image pixel per point, so rasterizing at 72 DPI reproduces the sheet
+        page = doc.new_page(width=width, height=height)
+        page.insert_image(page.rect, stream=png.tobytes())
+    doc.save(path)
+    doc.close()
+    return path
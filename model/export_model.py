@@ -0,0 +1,146 @@
+from ultralytics import YOLO
+import numpy as np
+import glob
+import os
+
+# Run from the repository root: python -m model.export_model
+from src.backends import load_exported_model, resolve_backend
+from src.detections import Detections
+
+EXPORT_FORMATS = ('onnx', 'openvino')
+
+
+def find_validation_images(dataset_path="datasets/part_1", limit=20):
+    # Prefer held-out images, fall back to the training split
+    for split in ("valid", "val", "test", "train"):
+        images = sorted(glob.glob(os.path.join(dataset_path, split, "images", "*")))
+        if images:
+            return images[:limit]
+    return []
+
+
+def box_iou(a, b):
+    """Pairwise IoU between (N, 4) and (M, 4) xyxy arrays."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def match_detections(reference, candidate, iou_threshold=0.9, conf_tolerance=0.05):
+    """
+    Greedily pair same-class boxes and count the ones that don't agree.
+
+    Returns:
+        dict: matched pairs, unmatched boxes on either side and the largest confidence gap.
+    """
+    matched, max_conf_gap = 0, 0.0
+    unmatched_ref = unmatched_cand = 0
+    for class_id in np.union1d(reference.class_ids, candidate.class_ids):
+        ref = reference[reference.class_ids == class_id]
+        cand = candidate[candidate.class_ids == class_id]
+        if len(ref) == 0 or len(cand) == 0:
+            unmatched_ref += len(ref)
+            unmatched_cand += len(cand)
+            continue
+        ious = box_iou(ref.boxes, cand.boxes)
+        class_matched = 0
+        for i in np.argsort(-ref.confidences):
+            j = int(np.argmax(ious[i]))
+            gap = abs(float(ref.confidences[i]) - float(cand.confidences[j]))
+            if ious[i, j] >= iou_threshold and gap <= conf_tolerance:
+                class_matched += 1
+                max_conf_gap = max(max_conf_gap, gap)
+                # Each candidate box can only be matched once
+                ious[:, j] = -1
+            else:
+                unmatched_ref += 1
+        matched += class_matched
+        unmatched_cand += len(cand) - class_matched
+    return {'matched': matched, 'unmatched_reference': unmatched_ref,
+            'unmatched_candidate': unmatched_cand, 'max_conf_gap': max_conf_gap}
+
+
+def validate_export(weights_path, exported_path, images, conf=0.25, iou_threshold=0.9, conf_tolerance=0.05):
+    """Compare an exported model's detections against the PyTorch weights on sample images."""
+    import cv2
+
+    reference_model = YOLO(weights_path)
+    exported_model = load_exported_model(exported_path, resolve_backend(exported_path))
+    totals = {'images': 0, 'matched': 0, 'unmatched_reference': 0, 'unmatched_candidate': 0, 'max_conf_gap': 0.0}
+    for image_path in images:
+        img = cv2.imread(image_path)
+        if img is None:
+            continue
+        reference = Detections.from_results(reference_model(img, conf=conf, verbose=False))
+        candidate = Detections.from_results(exported_model(img, conf=conf))
+        stats = match_detections(reference, candidate, iou_threshold, conf_tolerance)
+        totals['images'] += 1
+        for key in ('matched', 'unmatched_reference', 'unmatched_candidate'):
+            totals[key] += stats[key]
+        totals['max_conf_gap'] = max(totals['max_conf_gap'], stats['max_conf_gap'])
+        if stats['unmatched_reference'] or stats['unmatched_candidate']:
+            print(f"Mismatch on {image_path}: {stats}")
+    totals['passed'] = totals['unmatched_reference'] == 0 and totals['unmatched_candidate'] == 0
+    return totals
+
+
+def export_model(weights_path="models/yolov8m_trained.pt", formats=("onnx",), imgsz=640, dynamic=True,
+                 simplify=True, dataset_path="datasets/part_1", validate=True, num_images=20):
+    """
+    Export trained weights for CPU inference and check them against PyTorch.
+
+    Returns:
+        dict: format -> {'path': exported path, 'validation': stats or None}
+    """
+    if not os.path.exists(weights_path):
+        raise FileNotFoundError(f"Weights not found at: {weights_path}")
+
+    model = YOLO(weights_path)
+    images = find_validation_images(dataset_path, num_images) if validate else []
+    if validate and not images:
+        print(f"No validation images found under {dataset_path}; skipping parity check.")
+
+    exported = {}
+    for fmt in formats:
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {fmt}")
+        print(f"Exporting {weights_path} to {fmt} (imgsz={imgsz}, dynamic={dynamic})")
+        kwargs = {'format': fmt, 'imgsz': imgsz, 'dynamic': dynamic}
+        if fmt == 'onnx':
+            kwargs['simplify'] = simplify
+        path = str(model.export(**kwargs))
+        print(f"Exported model saved to {path}")
+
+        validation = None
+        if images:
+            validation = validate_export(weights_path, path, images)
+            print(f"Parity check for {fmt}: {validation}")
+        exported[fmt] = {'path': path, 'validation': validation}
+    return exported
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export trained YOLO weights to ONNX/OpenVINO for CPU inference")
+    parser.add_argument('--weights', type=str, default='models/yolov8m_trained.pt', help='Path to trained .pt weights')
+    parser.add_argument('--formats', type=str, nargs='+', default=['onnx'], choices=EXPORT_FORMATS,
+                        help='Export formats')
+    parser.add_argument('--imgsz', type=int, default=640, help='Model input size')
+    parser.add_argument('--static', action='store_true', help='Export with a fixed batch size of 1')
+    parser.add_argument('--dataset', type=str, default='datasets/part_1', help='Dataset used for the parity check')
+    parser.add_argument('--num_images', type=int, default=20, help='Images used for the parity check')
+    parser.add_argument('--no_validate', action='store_true', help='Skip the parity check against PyTorch')
+
+    args = parser.parse_args()
+
+    results = export_model(args.weights, formats=args.formats, imgsz=args.imgsz, dynamic=not args.static,
+                           dataset_path=args.dataset, validate=not args.no_validate, num_images=args.num_images)
+    failed = [fmt for fmt, info in results.items() if info['validation'] and not info['validation']['passed']]
+    if failed:
+        raise SystemExit(f"Exported detections differ from PyTorch for: {', '.join(failed)}")
@@ -0,0 +1,137 @@
+import numpy as np
+import glob
+import os
+
+# Run from the repository root: python -m model.quantize_model
+from src.backends import int8_model_path
+from src.batch_pipeline import letterbox
+
+
+def calibration_images(dataset_path="datasets/part_1", num_images=200, seed=0):
+    """Sample training images for activation-range calibration."""
+    images = sorted(glob.glob(os.path.join(dataset_path, "train", "images", "*")))
+    if not images:
+        raise FileNotFoundError(f"No training images found under {dataset_path}/train/images")
+    rng = np.random.default_rng(seed)
+    if len(images) > num_images:
+        images = sorted(rng.choice(images, size=num_images, replace=False).tolist())
+    return images
+
+
+class BlueprintCalibrationReader:
+    """
+    Feeds letterboxed blueprint images to ONNX Runtime's static quantizer.
+
+    Images are decoded one at a time as the calibrator asks for them, so
+    calibrating on a few hundred sheets doesn't hold them all in memory.
+    """
+
+    def __init__(self, image_paths, input_name, imgsz=640):
+        self.image_paths = list(image_paths)
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self._index = 0
+
+    def get_next(self):
+        import cv2
+
+        while self._index < len(self.image_paths):
+            img = cv2.imread(self.image_paths[self._index])
+            self._index += 1
+            if img is None:
+                continue
+            canvas, _, _ = letterbox(img, self.imgsz, interpolation=cv2.INTER_LINEAR)
+            batch = canvas[None, ..., ::-1].transpose(0, 3, 1, 2)
+            return {self.input_name: np.ascontiguousarray(batch, dtype=np.float32) / 255.0}
+        return None
+
+    def rewind(self):
+        self._index = 0
+
+
+def head_nodes(model):
+    """Names of the detection-head nodes that are left in float for accuracy."""
+    # YOLOv8 exports name nodes after their module path; the last module is the Detect head
+    module_ids = []
+    for node in model.graph.node:
+        parts = node.name.split('/')
+        if len(parts) > 2 and parts[1].startswith('model.') and parts[1][len('model.'):].isdigit():
+            module_ids.append(int(parts[1][len('model.'):]))
+    if not module_ids:
+        return []
+    head = f"/model.{max(module_ids)}/"
+    return [node.name for node in model.graph.node if node.name.startswith(head)]
+
+
+def quantize_model(fp32_onnx_path="models/yolov8m_trained.onnx", output_path=None, dataset_path="datasets/part_1",
+                   num_images=200, imgsz=640, per_channel=True, keep_head_fp32=True):
+    """
+    Statically quantize an exported FP32 ONNX model to INT8.
+
+    Activation ranges are calibrated on images from the training dataset.
+    Weights are quantized per channel, and the Detect head stays in FP32 by
+    default because box regression is the most precision-sensitive part of
+    the network.
+
+    Returns:
+        str: Path to the INT8 model.
+    """
+    import onnx
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    if not os.path.exists(fp32_onnx_path):
+        raise FileNotFoundError(f"FP32 ONNX model not found at {fp32_onnx_path}; run model.export_model first")
+    output_path = output_path or int8_model_path(fp32_onnx_path)
+
+    prepared_path = output_path + '.prep.onnx'
+    quant_pre_process(fp32_onnx_path, prepared_path)
+    model = onnx.load(prepared_path)
+    input_name = model.graph.input[0].name
+    excluded = head_nodes(model) if keep_head_fp32 else []
+
+    images = calibration_images(dataset_path, num_images)
+    print(f"Calibrating on {len(images)} images from {dataset_path}; {len(excluded)} head nodes kept in FP32")
+    quantize_static(
+        prepared_path,
+        output_path,
+        BlueprintCalibrationReader(images, input_name, imgsz),
+        quant_format=QuantFormat.QDQ,
+        per_channel=per_channel,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod.MinMax,
+        nodes_to_exclude=excluded,
+    )
+    os.remove(prepared_path)
+
+    # Carry over the class names and input size the ONNX backend reads from metadata
+    fp32_model = onnx.load(fp32_onnx_path, load_external_data=False)
+    int8_model = onnx.load(output_path)
+    del int8_model.metadata_props[:]
+    for prop in fp32_model.metadata_props:
+        int8_model.metadata_props.add(key=prop.key, value=prop.value)
+    int8_model.metadata_props.add(key='precision', value='int8')
+    onnx.save(int8_model, output_path)
+
+    print(f"INT8 model saved to {output_path} "
+          f"({os.path.getsize(fp32_onnx_path) / 1e6:.1f} MB -> {os.path.getsize(output_path) / 1e6:.1f} MB)")
+    return output_path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Statically quantize an exported YOLO ONNX model to INT8")
+    parser.add_argument('--model', type=str, default='models/yolov8m_trained.onnx', help='FP32 ONNX model')
+    parser.add_argument('--output', type=str, default=None, help='Output path (default: <model>_int8.onnx)')
+    parser.add_argument('--dataset', type=str, default='datasets/part_1', help='Dataset with train/images')
+    parser.add_argument('--num_images', type=int, default=200, help='Calibration images')
+    parser.add_argument('--imgsz', type=int, default=640, help='Model input size')
+    parser.add_argument('--per_tensor', action='store_true', help='Quantize weights per tensor instead of per channel')
+    parser.add_argument('--quantize_head', action='store_true', help='Also quantize the Detect head')
+
+    args = parser.parse_args()
+
+    quantize_model(args.model, args.output, args.dataset, args.num_images, args.imgsz,
+                   per_channel=not args.per_tensor, keep_head_fp32=not args.quantize_head)
@@ -0,0 +1,324 @@
+import numpy as np
+import cv2
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import yaml
+from concurrent.futures import ThreadPoolExecutor
+
+# Run from the repository root: python -m model.train_cache
+from src.detection_cache import hash_file
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the store layout or preprocessing changes so existing stores are rebuilt
+CACHE_VERSION = 2
+CACHE_DIRNAME = '.aipqs_cache'
+IMAGE_EXTENSIONS = ('.bmp', '.jpg', '.jpeg', '.png', '.tif', '.tiff', '.webp')
+
+
+def load_data_config(data_yaml):
+    """Parse a YOLO data.yaml; 'path' (default: the yaml's folder) is resolved against the yaml's folder."""
+    with open(data_yaml, 'r') as f:
+        data = yaml.safe_load(f)
+    root = os.path.join(os.path.dirname(os.path.abspath(data_yaml)), data.get('path') or '')
+    data['path'] = os.path.normpath(root)
+    return data
+
+
+def list_split_images(data, split):
+    """Absolute image paths of a split given as a directory, a .txt list of images, or a list of either."""
+    entries = data.get(split)
+    if entries is None:
+        return []
+    files = []
+    for entry in entries if isinstance(entries, list) else [entries]:
+        path = os.path.join(data['path'], entry)
+        if os.path.isdir(path):
+            for directory, _, names in os.walk(path):
+                files.extend(os.path.join(directory, name) for name in names
+                             if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS)
+        elif os.path.isfile(path):
+            base = os.path.dirname(path)
+            with open(path, 'r') as f:
+                files.extend(os.path.join(base, line.strip()) for line in f if line.strip())
+        else:
+            raise FileNotFoundError(f"Dataset split '{split}' not found at: {path}")
+    return sorted(os.path.abspath(f) for f in files)
+
+
+def label_path(image_path):
+    """The YOLO label file of an image: the last /images/ folder swapped for /labels/, extension .txt."""
+    images, labels = f"{os.sep}images{os.sep}", f"{os.sep}labels{os.sep}"
+    return os.path.splitext(labels.join(image_path.rsplit(images, 1)))[0] + '.txt'
+
+
+def relative_path(path, root):
+    """`path` relative to the dataset root, with '/' separators, as stored in manifests."""
+    return os.path.relpath(path, root).replace(os.sep, '/')
+
+
+def dataset_hash(files, imgsz, root, workers=8):
+    """
+    Content hash of a split: every image and label file, the target size and the store version.
+
+    Files are named by their path relative to the dataset `root`, so moving
+    the dataset keeps the hash while renaming or moving a file inside it
+    changes it.
+    """
+    def file_entry(path):
+        label = label_path(path)
+        label_digest = hash_file(label) if os.path.exists(label) else ''
+        return f"{relative_path(path, root)}:{hash_file(path)}:{label_digest}"
+
+    digest = hashlib.sha256(f"v{CACHE_VERSION}:{imgsz}".encode('utf-8'))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for entry in pool.map(file_entry, files):
+            digest.update(entry.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def read_labels(path, num_classes):
+    """
+    Validated rows of a YOLO label file as an (n, 5) float32 array of class, x, y, w, h.
+
+    Returns:
+        tuple: (rows, number of rows dropped for a bad class id or box)
+    """
+    if not os.path.exists(path):
+        return np.zeros((0, 5), dtype=np.float32), 0
+    rows = []
+    dropped = 0
+    with open(path, 'r') as f:
+        for line in f:
+            parts = line.split()
+            if not parts:
+                continue
+            try:
+                row = [float(value) for value in parts[:5]]
+            except ValueError:
+                dropped += 1
+                continue
+            # Segment labels list polygon points after the class; only boxes are cached
+            if len(parts) != 5 or not 0 <= row[0] < num_classes or row[0] != int(row[0]):
+                dropped += 1
+                continue
+            x, y, w, h = row[1:]
+            if not (w > 0 and h > 0 and 0 <= x - w / 2 + 1e-3 and x + w / 2 <= 1 + 1e-3
+                    and 0 <= y - h / 2 + 1e-3 and y + h / 2 <= 1 + 1e-3):
+                dropped += 1
+                continue
+            rows.append(row)
+    unique = np.unique(np.array(rows, dtype=np.float32).reshape(-1, 5), axis=0)
+    return unique, dropped + len(rows) - len(unique)
+
+
+class TrainingCache:
+    """
+    Memory-mapped store of one dataset split, resized for training.
+
+    Each image is resized so its long side is `imgsz` (as the YOLO loader
+    does) and written top-left into a fixed (imgsz, imgsz, 3) slot of
+    images.npy; shapes.npy holds the original and resized sizes, and labels
+    are concatenated into labels.npy with per-image offsets. The manifest
+    lists images relative to the dataset root, and `index` maps their
+    absolute paths under `root` to rows, so a moved dataset (its store moves
+    with it) is still covered. Arrays are
+    opened lazily with mmap, so data-loader workers share the page cache
+    instead of each decoding PNGs, and a pickled store reopens its maps in
+    the receiving process.
+    """
+
+    def __init__(self, directory, root):
+        self.directory = directory
+        self.root = root
+        with open(os.path.join(directory, 'manifest.json'), 'r') as f:
+            self.manifest = json.load(f)
+        self.files = self.manifest['files']
+        self.imgsz = self.manifest['imgsz']
+        resolve = lambda name: os.path.normpath(os.path.join(root, name))
+        # Unreadable images have an empty slot; datasets leave them out rather than decoding them again
+        self.rejected = {resolve(name) for name in self.manifest['rejected_images']}
+        self.index = {resolve(name): row for row, name in enumerate(self.files) if resolve(name) not in self.rejected}
+        self._arrays = {}
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_arrays'] = {}
+        return state
+
+    def _array(self, name):
+        array = self._arrays.get(name)
+        if array is None:
+            array = self._arrays[name] = np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode='r')
+        return array
+
+    def __len__(self):
+        return len(self.index)
+
+    def original_shape(self, row):
+        h0, w0 = self._array('shapes')[row][:2]
+        return int(h0), int(w0)
+
+    def image(self, row):
+        """A writable copy of a cached image, with its original (height, width)."""
+        h0, w0, h, w = self._array('shapes')[row]
+        return np.array(self._array('images')[row, :h, :w]), (int(h0), int(w0))
+
+    def labels(self, row):
+        offsets = self._array('offsets')
+        return np.array(self._array('labels')[offsets[row]:offsets[row + 1]])
+
+    def validate(self):
+        """Check the arrays against the manifest; raises ValueError on a truncated or mismatched store."""
+        count = len(self.files)
+        if self.manifest.get('version') != CACHE_VERSION:
+            raise ValueError(f"Store version {self.manifest.get('version')} is not {CACHE_VERSION}")
+        if self._array('images').shape != (count, self.imgsz, self.imgsz, 3):
+            raise ValueError("images.npy does not match the manifest")
+        if self._array('shapes').shape != (count, 4) or self._array('offsets').shape != (count + 1,):
+            raise ValueError("shapes.npy or offsets.npy does not match the manifest")
+        if self._array('labels').shape != (int(self._array('offsets')[-1]), 5):
+            raise ValueError("labels.npy does not match the manifest")
+
+
+def _load_resized(path, imgsz):
+    img = cv2.imread(path)
+    if img is None:
+        return None
+    h0, w0 = img.shape[:2]
+    r = imgsz / max(h0, w0)
+    if r != 1:
+        size = (min(imgsz, max(1, round(w0 * r))), min(imgsz, max(1, round(h0 * r))))
+        img = cv2.resize(img, size, interpolation=cv2.INTER_LINEAR if r > 1 else cv2.INTER_AREA)
+    return img, (h0, w0)
+
+
+def build_cache(data_yaml, split='train', imgsz=640, workers=None, cache_root=None):
+    """
+    Return the store for a dataset split, building it if the dataset changed.
+
+    The store directory is named by the split's content hash, so an edited,
+    added or removed image or label (or a different `imgsz`) builds a new
+    store and an unchanged dataset reuses the existing one after a check of
+    its manifest and array shapes. Older stores of the split are deleted
+    once the new one is complete. Unreadable images are left out and label
+    rows with a bad class id or box are dropped; both are counted in the
+    manifest.
+
+    Args:
+        data_yaml (str): Path to the YOLO data.yaml.
+        split (str): 'train' or 'val'.
+        imgsz (int): Training image size; images are cached with this long side.
+        workers (int or None): Threads hashing and decoding images (default: CPU count).
+        cache_root (str or None): Where stores live (default: .aipqs_cache in the dataset root).
+
+    Returns:
+        TrainingCache or None: None if the split lists no images.
+    """
+    data = load_data_config(data_yaml)
+    files = list_split_images(data, split)
+    if not files:
+        return None
+    workers = workers or os.cpu_count() or 1
+    names = data.get('names', {})
+    num_classes = int(data.get('nc', len(names)))
+    cache_root = cache_root or os.path.join(data['path'], CACHE_DIRNAME)
+
+    start = time.perf_counter()
+    content_hash = dataset_hash(files, imgsz, data['path'], workers)
+    directory = os.path.join(cache_root, f"{split}-{content_hash[:16]}")
+    if os.path.exists(os.path.join(directory, 'manifest.json')):
+        try:
+            store = TrainingCache(directory, data['path'])
+            if store.manifest['content_hash'] == content_hash:
+                store.validate()
+                logger.info(f"Using cached {split} split ({len(store)} images) from {directory}")
+                return store
+        except (ValueError, KeyError, OSError) as e:
+            logger.warning(f"Rebuilding invalid {split} cache at {directory}: {e}")
+
+    # Built in a temporary folder and renamed into place, so a crash never leaves a store that looks complete
+    tmp_directory = f"{directory}.{os.getpid()}.part"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    images = np.lib.format.open_memmap(os.path.join(tmp_directory, 'images.npy'), mode='w+', dtype=np.uint8,
+                                       shape=(len(files), imgsz, imgsz, 3))
+    shapes = np.zeros((len(files), 4), dtype=np.int32)
+    labels, rejected, dropped_rows = [], [], 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for row, (path, loaded) in enumerate(zip(files, pool.map(lambda f: _load_resized(f, imgsz), files))):
+            if loaded is None:
+                # The slot stays empty and the image is left out of the index
+                logger.warning(f"Skipping unreadable image: {path}")
+                rejected.append(relative_path(path, data['path']))
+                labels.append(np.zeros((0, 5), dtype=np.float32))
+                continue
+            img, (h0, w0) = loaded
+            h, w = img.shape[:2]
+            images[row, :h, :w] = img
+            shapes[row] = (h0, w0, h, w)
+            rows, dropped = read_labels(label_path(path), num_classes)
+            labels.append(rows)
+            dropped_rows += dropped
+    images.flush()
+    del images
+
+    offsets = np.zeros(len(files) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(rows) for rows in labels])
+    np.save(os.path.join(tmp_directory, 'shapes.npy'), shapes)
+    np.save(os.path.join(tmp_directory, 'offsets.npy'), offsets)
+    np.save(os.path.join(tmp_directory, 'labels.npy'), np.concatenate(labels))
+    manifest = {
+        'version': CACHE_VERSION,
+        'split': split,
+        'content_hash': content_hash,
+        'imgsz': imgsz,
+        'files': [relative_path(path, data['path']) for path in files],
+        'rejected_images': rejected,
+        'dropped_label_rows': dropped_rows,
+        'num_classes': num_classes,
+        'created': time.time(),
+    }
+    with open(os.path.join(tmp_directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_directory, directory)
+
+    for name in os.listdir(cache_root):
+        if name.startswith(f"{split}-") and os.path.join(cache_root, name) != directory and not name.endswith('.part'):
+            shutil.rmtree(os.path.join(cache_root, name), ignore_errors=True)
+
+    store = TrainingCache(directory, data['path'])
+    store.validate()
+    logger.info(f"Cached {len(store)} {split} images ({len(rejected)} unreadable, {dropped_rows} label rows "
+                f"dropped) in {time.perf_counter() - start:.1f}s at {directory}")
+    return store
+
+
+def prepare_dataset(data_yaml, imgsz=640, splits=('train', 'val'), workers=None):
+    """Build or reuse the stores of several splits, as {split: TrainingCache}."""
+    stores = {}
+    for split in splits:
+        store = build_cache(data_yaml, split, imgsz, workers)
+        if store is not None:
+            stores[split] = store
+    return stores
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build the memory-mapped training cache of a YOLO dataset")
+    parser.add_argument('dataset_path', type=str, help='Dataset folder containing data.yaml')
+    parser.add_argument('--imgsz', type=int, default=640, help='Training image size')
+    parser.add_argument('--workers', type=int, default=None, help='Threads hashing and decoding images')
+
+    args = parser.parse_args()
+    for split, store in prepare_dataset(os.path.join(args.dataset_path, 'data.yaml'), args.imgsz,
+                                        workers=args.workers).items():
+        print(f"{split}: {len(store)} images in {store.directory}")
@@ -1,5 +1,13 @@
 from ultralytics import YOLO
+from ultralytics.data import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.utils import LOGGER, colorstr
+import json
 import os
+import time
+
+# Run from the repository root: python -m model.train_yolo
+from model.train_cache import prepare_dataset
 
 def get_latest_model_path(models_dir="models", base_model_name="yolov8m_trained.pt"):
     # Find the latest model file based on modification time
@@ -10,8 +18,148 @@ def get_latest_model_path(models_dir="models", base_model_name="yolov8m_trained.
     latest_model = max(model_files, key=os.path.getmtime)
     return latest_model
 
-def train_yolo_model(dataset_path="datasets/part_1", model_save_path="models/yolov8m_trained.pt", 
-                     epochs=20, batch_size=16, imgsz=640, lr=0.01, fast_train=False):
+def default_workers(device, batch_size):
+    """
+    Data-loader workers for a training run.
+
+    With images memory-mapped, workers only augment. On GPU they get every
+    core but one (the training loop's); on CPU the forward and backward
+    passes need cores too, so workers get half.
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+    available = cpus - 1 if device == 'cuda' else cpus // 2
+    return max(1, min(available, batch_size, 8))
+
+class CachedYOLODataset(YOLODataset):
+    """
+    YOLODataset that reads images and labels from a TrainingCache.
+
+    Images the store rejected as unreadable are left out of the split. Any
+    other file missing from the store, or a store built for another image
+    size, falls back to the stock loader.
+    """
+
+    def __init__(self, *args, store=None, **kwargs):
+        self.store = store
+        super().__init__(*args, **kwargs)
+
+    def get_labels(self):
+        store = self.store
+        if store is not None:
+            rejected = [f for f in self.im_files if os.path.abspath(f) in store.rejected]
+            if rejected:
+                LOGGER.warning(f"{self.prefix}Leaving out {len(rejected)} images the training cache found unreadable")
+                self.im_files = [f for f in self.im_files if os.path.abspath(f) not in store.rejected]
+        covered = store is not None and all(os.path.abspath(f) in store.index for f in self.im_files)
+        if not covered or store.imgsz != self.imgsz:
+            if store is not None:
+                LOGGER.warning(f"{self.prefix}Training cache does not cover this split; decoding images from disk")
+            self.store = None
+            return super().get_labels()
+        labels = []
+        self._rows = []
+        for im_file in self.im_files:
+            row = store.index[os.path.abspath(im_file)]
+            rows = store.labels(row)
+            labels.append({
+                'im_file': im_file,
+                'shape': store.original_shape(row),
+                'cls': rows[:, 0:1],
+                'bboxes': rows[:, 1:],
+                'segments': [],
+                'keypoints': None,
+                'normalized': True,
+                'bbox_format': 'xywh',
+            })
+            self._rows.append(row)
+        LOGGER.info(f"{self.prefix}Reading {len(labels)} images from the training cache at {store.directory}")
+        return labels
+
+    def load_image(self, i, rect_mode=True):
+        if self.store is None or not rect_mode:
+            return super().load_image(i, rect_mode)
+        im, hw0 = self.store.image(self._rows[i])
+        if self.augment:
+            # Mosaic draws its partner images from this buffer
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                self.buffer.pop(0)
+        return im, hw0, im.shape[:2]
+
+class CachedDetectionTrainer(DetectionTrainer):
+    """DetectionTrainer whose datasets read from the stores in `stores` ({'train': ..., 'val': ...})."""
+
+    stores = {}
+
+    def build_dataset(self, img_path, mode="train", batch=None):
+        stride = max(int(self.model.stride.max() if self.model else 0), 32)
+        return CachedYOLODataset(
+            img_path=img_path,
+            imgsz=self.args.imgsz,
+            batch_size=batch,
+            augment=mode == "train",
+            hyp=self.args,
+            rect=self.args.rect or mode == "val",
+            cache=None,
+            single_cls=self.args.single_cls or False,
+            stride=stride,
+            pad=0.0 if mode == "train" else 0.5,
+            prefix=colorstr(f"{mode}: "),
+            task=self.args.task,
+            classes=self.args.classes,
+            data=self.data,
+            fraction=self.args.fraction if mode == "train" else 1.0,
+            store=self.stores.get(mode),
+        )
+
+class EpochTimer:
+    """
+    Per-epoch wall time and data-loader stall time, from trainer callbacks.
+
+    A stall is the time from the end of one training step (or the start of
+    the epoch) to the start of the next, which the loop spends waiting for
+    the data loader to hand over a batch.
+    """
+
+    def __init__(self):
+        self.epochs = []
+        self._epoch_start = self._batch_end = None
+        self._stall = 0.0
+
+    def attach(self, model):
+        model.add_callback('on_train_epoch_start', self.on_epoch_start)
+        model.add_callback('on_train_batch_start', self.on_batch_start)
+        model.add_callback('on_train_batch_end', self.on_batch_end)
+        model.add_callback('on_train_epoch_end', self.on_epoch_end)
+        model.add_callback('on_train_end', self.on_train_end)
+
+    def on_epoch_start(self, trainer):
+        self._epoch_start = self._batch_end = time.perf_counter()
+        self._stall = 0.0
+
+    def on_batch_start(self, trainer):
+        self._stall += time.perf_counter() - self._batch_end
+
+    def on_batch_end(self, trainer):
+        self._batch_end = time.perf_counter()
+
+    def on_epoch_end(self, trainer):
+        elapsed = time.perf_counter() - self._epoch_start
+        self.epochs.append({'epoch': trainer.epoch + 1, 'seconds': round(elapsed, 3),
+                            'stall_seconds': round(self._stall, 3)})
+        print(f"Epoch {trainer.epoch + 1}: {elapsed:.1f}s, data-loader stall {self._stall:.1f}s "
+              f"({self._stall / max(elapsed, 1e-9):.0%})")
+
+    def on_train_end(self, trainer):
+        total = sum(epoch['seconds'] for epoch in self.epochs)
+        stall = sum(epoch['stall_seconds'] for epoch in self.epochs)
+        print(f"Trained {len(self.epochs)} epochs in {total:.1f}s, data-loader stall {stall:.1f}s")
+        with open(os.path.join(trainer.save_dir, 'epoch_times.json'), 'w') as f:
+            json.dump({'epochs': self.epochs, 'total_seconds': round(total, 3), 'stall_seconds': round(stall, 3)}, f,
+                      indent=2)
+
+def train_yolo_model(dataset_path="datasets/part_1", model_save_path="models/yolov8m_trained.pt",
+                     epochs=20, batch_size=16, imgsz=640, lr=0.01, fast_train=False, use_cache=True, workers=None):
     # Verify dataset exists
     if not os.path.exists(dataset_path):
         raise FileNotFoundError(f"Dataset not found at: {dataset_path}")
@@ -36,28 +184,55 @@ def train_yolo_model(dataset_path="datasets/part_1", model_save_path="models/yol
         imgsz = min(imgsz, 320)
         print("Fast training mode enabled: reduced epochs, batch size, and image size.")
 
+    # Decode and resize the dataset once into memory-mapped arrays; rebuilt only when its content changes
+    trainer = None
+    if use_cache:
+        CachedDetectionTrainer.stores = prepare_dataset(data_yaml_path, imgsz)
+        trainer = CachedDetectionTrainer
+
+    workers = workers or default_workers(device, batch_size)
+    print(f"Using {workers} data-loader workers")
+    timer = EpochTimer()
+    timer.attach(model)
+
     # Disable resume training to avoid assertion error when starting fresh
     resume_training = False
 
     # Train the model with data augmentation (enabled by default in YOLOv8)
     results = model.train(
         data=data_yaml_path,
+        trainer=trainer,
         epochs=epochs,
         batch=batch_size,
         imgsz=imgsz,
         device=device,
         lr0=lr,
-        workers=4 if device == '0' else 2,
+        workers=workers,
         save=True,  # Saves best model automatically
-        patience=10,  # Early stopping patience 
+        patience=10,  # Early stopping patience
         resume=resume_training,  # Do not resume training to avoid errors
         amp=True,  # Enable mixed precision training for speedup
-        cache=False  # Disable data caching to avoid cache issues
+        cache=False  # Images come from the training cache above, not ultralytics' own cache
     )
 
     # Save the trained model
     model.save(model_save_path)
     print(f"Model saved to {model_save_path}")
+    return timer.epochs
 
 if __name__ == "__main__":
-    train_yolo_model()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fine-tune the YOLO model on a blueprint dataset")
+    parser.add_argument('--dataset_path', type=str, default='datasets/part_1', help='Dataset folder containing data.yaml')
+    parser.add_argument('--model_save_path', type=str, default='models/yolov8m_trained.pt', help='Where to save the model')
+    parser.add_argument('--epochs', type=int, default=20, help='Training epochs')
+    parser.add_argument('--batch_size', type=int, default=16, help='Images per batch')
+    parser.add_argument('--imgsz', type=int, default=640, help='Training image size')
+    parser.add_argument('--fast_train', action='store_true', help='Fewer epochs, smaller batches and images')
+    parser.add_argument('--no_cache', action='store_true', help='Decode images from disk every epoch')
+    parser.add_argument('--workers', type=int, default=None, help='Data-loader workers (default: sized to the CPU)')
+
+    args = parser.parse_args()
+    train_yolo_model(args.dataset_path, args.model_save_path, epochs=args.epochs, batch_size=args.batch_size,
+                     imgsz=args.imgsz, fast_train=args.fast_train, use_cache=not args.no_cache, workers=args.workers)
@@ -0,0 +1,172 @@
+from ultralytics import YOLO
+import numpy as np
+import json
+import os
+import time
+
+# Run from the repository root: python -m model.validate_quantized
+from model.export_model import find_validation_images, match_detections
+from src.backends import int8_model_path, load_exported_model, resolve_backend
+from src.detections import Detections
+from src.quotation_generator import QuotationGenerator
+
+CLASS_NAMES = {0: "switch", 1: "light", 2: "outlet"}
+
+
+def _rss_bytes():
+    # psutil ships with ultralytics
+    import psutil
+    return psutil.Process(os.getpid()).memory_info().rss
+
+
+def _load(model_path):
+    backend = resolve_backend(model_path)
+    if backend == 'pytorch':
+        return YOLO(model_path)
+    return load_exported_model(model_path, backend)
+
+
+def profile_model(model_path, images, conf=0.25, warmup=3):
+    """
+    Run one model over decoded images, timing each forward pass.
+
+    Returns:
+        tuple: (list of Detections per image, stats dict with latency and memory figures)
+    """
+    rss_before = _rss_bytes()
+    model = _load(model_path)
+    for img in images[:warmup]:
+        model(img, conf=conf, verbose=False)
+    rss_loaded = _rss_bytes()
+
+    detections, latencies = [], []
+    for img in images:
+        start = time.perf_counter()
+        results = model(img, conf=conf, verbose=False)
+        latencies.append(time.perf_counter() - start)
+        detections.append(Detections.from_results(results))
+
+    latencies_ms = np.array(latencies) * 1000
+    stats = {
+        'model_path': model_path,
+        'file_size_mb': os.path.getsize(model_path) / 1e6,
+        'rss_delta_mb': (rss_loaded - rss_before) / 1e6,
+        'latency_mean_ms': float(latencies_ms.mean()) if len(latencies_ms) else None,
+        'latency_median_ms': float(np.median(latencies_ms)) if len(latencies_ms) else None,
+        'latency_p95_ms': float(np.percentile(latencies_ms, 95)) if len(latencies_ms) else None,
+    }
+    del model
+    return detections, stats
+
+
+def evaluate_map(model_path, data_yaml, imgsz=640):
+    """mAP50 and mAP50-95 on the dataset's validation split, as computed by ultralytics."""
+    metrics = YOLO(model_path, task='detect').val(data=data_yaml, imgsz=imgsz, batch=1, device='cpu',
+                                                  plots=False, verbose=False)
+    return {'map50': float(metrics.box.map50), 'map50_95': float(metrics.box.map)}
+
+
+def compare_quotations(fp32_detections, int8_detections, pricing_rules):
+    """
+    Count the quotation line items (image, class) whose quantity differs between the two models.
+
+    Returns:
+        dict: per-class count totals, changed line items and the total cost difference.
+    """
+    num_classes = max(CLASS_NAMES) + 1
+    fp32_totals = np.zeros(num_classes, dtype=np.int64)
+    int8_totals = np.zeros(num_classes, dtype=np.int64)
+    prices = np.array([pricing_rules.get(class_id, 0.0) for class_id in range(num_classes)])
+    changed_items, changed_images, cost_delta = 0, 0, 0.0
+    for fp32, int8 in zip(fp32_detections, int8_detections):
+        fp32_counts = fp32.counts(num_classes)[:num_classes]
+        int8_counts = int8.counts(num_classes)[:num_classes]
+        fp32_totals += fp32_counts
+        int8_totals += int8_counts
+        differs = fp32_counts != int8_counts
+        changed_items += int(differs.sum())
+        changed_images += int(differs.any())
+        cost_delta += float(((int8_counts - fp32_counts) * prices).sum())
+    return {
+        'counts_fp32': {CLASS_NAMES[i]: int(fp32_totals[i]) for i in range(num_classes)},
+        'counts_int8': {CLASS_NAMES[i]: int(int8_totals[i]) for i in range(num_classes)},
+        'changed_line_items': changed_items,
+        'changed_quotations': changed_images,
+        'total_cost_delta': cost_delta,
+    }
+
+
+def validate_quantized(fp32_model_path="models/yolov8m_trained.onnx", int8_path=None,
+                       dataset_path="datasets/part_1", num_images=50, conf=0.25, imgsz=640, compute_map=True):
+    """
+    Compare an INT8 model against its FP32 source before shipping it.
+
+    Reports per-class switch/light/outlet counts, mAP, latency, memory and how
+    many quotation line items change on the dataset's validation images.
+
+    Returns:
+        dict: The comparison report.
+    """
+    import cv2
+
+    int8_path = int8_path or int8_model_path(fp32_model_path)
+    for path in (fp32_model_path, int8_path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Model not found at {path}")
+
+    image_paths = find_validation_images(dataset_path, num_images)
+    if not image_paths:
+        raise FileNotFoundError(f"No validation images found under {dataset_path}")
+    images = [img for img in (cv2.imread(path) for path in image_paths) if img is not None]
+    print(f"Comparing {fp32_model_path} and {int8_path} on {len(images)} images")
+
+    fp32_detections, fp32_stats = profile_model(fp32_model_path, images, conf)
+    int8_detections, int8_stats = profile_model(int8_path, images, conf)
+
+    report = {
+        'images': len(images),
+        'conf_threshold': conf,
+        'fp32': fp32_stats,
+        'int8': int8_stats,
+        'speedup': fp32_stats['latency_mean_ms'] / int8_stats['latency_mean_ms'],
+        'memory_saved_mb': fp32_stats['rss_delta_mb'] - int8_stats['rss_delta_mb'],
+        'size_saved_mb': fp32_stats['file_size_mb'] - int8_stats['file_size_mb'],
+        'quotation': compare_quotations(fp32_detections, int8_detections, QuotationGenerator().pricing_rules),
+    }
+
+    agreement = {'matched': 0, 'unmatched_reference': 0, 'unmatched_candidate': 0}
+    for fp32, int8 in zip(fp32_detections, int8_detections):
+        stats = match_detections(fp32, int8, iou_threshold=0.5, conf_tolerance=1.0)
+        for key in agreement:
+            agreement[key] += stats[key]
+    report['box_agreement'] = agreement
+
+    if compute_map:
+        data_yaml = os.path.abspath(os.path.join(dataset_path, "data.yaml"))
+        report['fp32']['map'] = evaluate_map(fp32_model_path, data_yaml, imgsz)
+        report['int8']['map'] = evaluate_map(int8_path, data_yaml, imgsz)
+        report['map50_drop'] = report['fp32']['map']['map50'] - report['int8']['map']['map50']
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare an INT8 quantized model against its FP32 source")
+    parser.add_argument('--fp32', type=str, default='models/yolov8m_trained.onnx', help='FP32 model (.pt or .onnx)')
+    parser.add_argument('--int8', type=str, default=None, help='INT8 model (default: <fp32>_int8.onnx)')
+    parser.add_argument('--dataset', type=str, default='datasets/part_1', help='Dataset with data.yaml')
+    parser.add_argument('--num_images', type=int, default=50, help='Images used for counts and latency')
+    parser.add_argument('--conf_threshold', type=float, default=0.25, help='Confidence threshold for detections')
+    parser.add_argument('--imgsz', type=int, default=640, help='Model input size')
+    parser.add_argument('--no_map', action='store_true', help='Skip the mAP evaluation')
+    parser.add_argument('--output', type=str, default=None, help='Write the JSON report to this file')
+
+    args = parser.parse_args()
+
+    report = validate_quantized(args.fp32, args.int8, args.dataset, args.num_images, args.conf_threshold,
+                                args.imgsz, compute_map=not args.no_map)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
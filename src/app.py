@@ -1,23 +1,279 @@
-from flask import Flask, request, render_template, send_file, redirect, url_for, flash
+from flask import Flask, Response, g, request, render_template, send_file, redirect, url_for, flash, jsonify
+import logging
 import os
-from scripts.inference import run_inference
+import threading
+import time
+import uuid
+from src.artifact_store import get_artifact_store
+from src.detection_cache import RAW_FLOOR_CONF
+from src import metrics
+from src.profiling import PROFILE_HEADER, PROFILING_ENABLED, SamplingProfiler, profile_store
+from src.jobs import JobManager, QueueFullError
 from src.quotation_generator import QuotationGenerator
-from src.report_generator import ReportGenerator
+from src.report_cache import get_report_cache, report_name
+from src.upload_stream import get_upload_writer, read_upload
 from werkzeug.utils import secure_filename
+import numpy as np
+
+# The inference stack (torch/ultralytics, OpenCV, model backends) is imported on first use or by the
+# warm-up thread, so the server can bind and answer health checks while it loads
+
+logger = logging.getLogger(__name__)
+# ready_s in /readyz is measured from here, once the imports above are done
+PROCESS_START = time.perf_counter()
 
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'pdf'}
+MODEL_PATH = os.environ.get('AIPQS_MODEL_PATH', 'models/yolov8m_trained.pt')
+MODEL_DEVICE = os.environ.get('AIPQS_DEVICE') or None
+# 'pytorch', 'onnx' or 'openvino'; unset infers it from MODEL_PATH
+MODEL_BACKEND = os.environ.get('AIPQS_BACKEND') or None
+# 'int8' serves the quantized ONNX model built by model/quantize_model.py
+if os.environ.get('AIPQS_PRECISION', 'fp32') == 'int8':
+    from src.backends import ONNX, int8_model_path
+    MODEL_PATH, MODEL_BACKEND = int8_model_path(MODEL_PATH), ONNX
+# Tile size for sliced inference on large scans; 0 runs the model on the whole sheet
+TILE_SIZE = int(os.environ.get('AIPQS_TILE_SIZE', 0)) or None
+# Coalesce concurrent requests into batched forward passes (see src/batching_server.py)
+MICRO_BATCH = os.environ.get('AIPQS_MICRO_BATCH', '0') == '1'
+# Decode large untiled uploads at reduced resolution down to this long side; 0 decodes at full size
+DECODE_MIN_SIZE = int(os.environ.get('AIPQS_DECODE_MIN_SIZE', 0)) or None
+# Default confidence threshold; requests may override it without rerunning the model
+CONF_THRESHOLD = float(os.environ.get('AIPQS_CONF_THRESHOLD', 0.15))
 
-app = Flask(__name__)
+# Templates live at the repository root; Flask resolves this relative to src/
+app = Flask(__name__, template_folder='../templates')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.secret_key = 'supersecretkey'  # Needed for flashing messages
 
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
+# Start-up progress reported by /readyz; 'ready' is only set once the model is loaded and warmed up
+startup = {'ready': False, 'error': None, 'model_load_s': None, 'warmup_s': None,
+           'ready_s': None, 'pid': os.getpid()}
+_ready = threading.Event()
+
+def load_model():
+    """Load the model weights into the registry without running them (safe before forking workers)."""
+    from src.model_registry import get_registry
+
+    registry = get_registry()
+    if registry.make_key(MODEL_PATH, MODEL_DEVICE, MODEL_BACKEND) in registry:
+        # Already loaded, e.g. by the master process before this worker was forked
+        return
+    if not os.path.exists(MODEL_PATH):
+        raise FileNotFoundError(f"Model weights not found at {MODEL_PATH}")
+    start = time.perf_counter()
+    registry.get(MODEL_PATH, device=MODEL_DEVICE, backend=MODEL_BACKEND)
+    startup['model_load_s'] = time.perf_counter() - start
+
+def warm_up():
+    """Load (if needed) and warm up the model, then mark this process ready."""
+    from src.model_registry import get_registry
+
+    try:
+        load_model()
+        start = time.perf_counter()
+        get_registry().get(MODEL_PATH, device=MODEL_DEVICE, backend=MODEL_BACKEND, warmup=True)
+        startup['warmup_s'] = time.perf_counter() - start
+        startup['ready_s'] = time.perf_counter() - PROCESS_START
+        startup['ready'] = True
+        _ready.set()
+        logger.info(f"Ready in {startup['ready_s']:.2f}s (pid {os.getpid()}, warm-up {startup['warmup_s']:.2f}s)")
+    except Exception as e:
+        startup['error'] = str(e)
+        logger.exception("Model warm-up failed")
+
+def start_warm_up():
+    """Warm up in the background so the process can answer health checks meanwhile."""
+    startup['pid'] = os.getpid()
+    thread = threading.Thread(target=warm_up, name='model-warmup', daemon=True)
+    thread.start()
+    return thread
+
+def wait_until_ready(timeout=None):
+    return _ready.wait(timeout)
+
+# src/serve.py loads the weights in the master process and warms up after forking instead
+if os.environ.get('AIPQS_WARMUP_ON_IMPORT', '1') == '1':
+    start_warm_up()
+
+# Background pipeline for POST /jobs; uploads beyond the queue limit are rejected with 503
+job_manager = JobManager(workers=int(os.environ.get('AIPQS_JOB_WORKERS', 2)),
+                         max_queue=int(os.environ.get('AIPQS_JOB_QUEUE', 16)))
+
+REQUEST_SECONDS = metrics.histogram('aipqs_request_seconds', 'HTTP request latency',
+                                    ('endpoint', 'method', 'status'))
+metrics.register_callback('aipqs_job_queue_depth', 'Jobs waiting for a worker',
+                          lambda: job_manager.stats()['queued'])
+metrics.register_callback('aipqs_jobs_running', 'Jobs currently being processed',
+                          lambda: job_manager.stats()['running'])
+metrics.register_callback('aipqs_upload_writes_pending', 'Uploads not yet persisted to disk',
+                          lambda: get_upload_writer().pending())
+metrics.register_callback('aipqs_micro_batch_queue_depth', 'Frames waiting for a micro-batch',
+                          lambda: {(name,): stats['queue_depth'] for name, stats in _batcher_stats().items()},
+                          ('model',))
+metrics.register_callback('aipqs_models_loaded', 'Models held by the model registry', lambda: _models_loaded())
+metrics.register_callback('aipqs_ready', 'Whether the model is loaded and warmed up', lambda: int(_ready.is_set()))
+metrics.register_callback('aipqs_report_cache_bytes', 'Size of the rendered report cache',
+                          lambda: get_report_cache().stats()['bytes'])
+metrics.register_callback('aipqs_artifact_store_bytes', 'Size of the upload and report artifact store',
+                          lambda: get_artifact_store().stats()['bytes'])
+
+SUMMARY_CLASS_NAMES = {
+    0: "switch",
+    1: "light",
+    2: "electrical outlet"
+}
+REPORT_CLASS_NAMES = {
+    0: "switches",
+    1: "lights",
+    2: "electrical outlets"
+}
+
+@app.before_request
+def start_request_timing():
+    g.request_start = time.perf_counter()
+    metrics.start_trace()
+    g.profiler = None
+    if PROFILING_ENABLED and request.headers.get(PROFILE_HEADER):
+        g.profiler = SamplingProfiler()
+        g.profiler.start()
+
+@app.after_request
+def record_request_timing(response):
+    timings = metrics.end_trace()
+    elapsed = time.perf_counter() - g.get('request_start', time.perf_counter())
+    REQUEST_SECONDS.observe(elapsed, request.endpoint or 'unknown', request.method, str(response.status_code))
+    # Per-stage breakdown for browser dev tools and load-test clients
+    server_timing = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items()]
+    server_timing.append(f"total;dur={elapsed * 1000:.2f}")
+    response.headers['Server-Timing'] = ', '.join(server_timing)
+    profiler = g.get('profiler')
+    if profiler is not None:
+        profiler.stop()
+        profile_id = profile_store.add(profiler)
+        response.headers['X-AIPQS-Profile-Id'] = profile_id
+        response.headers['X-AIPQS-Profile-Url'] = url_for('get_profile', profile_id=profile_id)
+    return response
+
+def _batcher_stats():
+    from src.batching_server import batcher_stats
+    return batcher_stats()
+
+def _models_loaded():
+    from src.model_registry import get_registry
+    return len(get_registry())
+
+def _near_duplicate_stats():
+    from src.near_duplicates import get_near_duplicate_index
+    index = get_near_duplicate_index()
+    return index.stats() if index is not None else None
+
+def _near_duplicate_of(digest):
+    """The earlier upload whose detections were reused for this one, if any."""
+    from src.near_duplicates import get_near_duplicate_index
+    index = get_near_duplicate_index()
+    return index.reuse_of(digest) if index is not None else None
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def summarize_quotation(quotation, tax_percent, discount_percent, class_names):
+    """Line items and totals shown to the user for a quotation."""
+    items = []
+    unit_prices = quotation.get('unit_prices', {})
+    for class_id, quantity in quotation.get('items', {}).items():
+        items.append({
+            'name': class_names.get(class_id, f"Class {class_id}"),
+            'quantity': quantity,
+            'unit_price': unit_prices.get(class_id, 0.0),
+            'total_price': unit_prices.get(class_id, 0.0) * quantity
+        })
+
+    # Calculate subtotal, tax, discount, and total for summary display
+    subtotal = sum(item['total_price'] for item in items)
+    tax_amount = subtotal * (tax_percent / 100.0)
+    discount_amount = subtotal * (discount_percent / 100.0)
+    total = subtotal + tax_amount - discount_amount
+    return {
+        'items': items,
+        'subtotal': subtotal,
+        'tax_amount': tax_amount,
+        'discount_amount': discount_amount,
+        'total': total
+    }
+
+def parse_conf_threshold(form):
+    """Confidence threshold posted with a form, clamped to [0, 1]; raises ValueError if malformed."""
+    return min(max(float(form.get('conf_threshold') or CONF_THRESHOLD), 0.0), 1.0)
+
+def detect_upload(data, filename, digest, conf_threshold=None, raw=False):
+    """
+    Run inference on an upload held in memory.
+
+    Raw detections are cached by content and model, so any threshold is
+    answered from the cache once the upload has been seen. With `raw=True`
+    the confidence-sorted Detections are returned for re-filtering.
+    """
+    from src.inference import run_inference_on_bytes
+
+    return run_inference_on_bytes(data, filename, digest=digest, model_path=MODEL_PATH,
+                                  conf_threshold=CONF_THRESHOLD if conf_threshold is None else conf_threshold,
+                                  device=MODEL_DEVICE, tile_size=TILE_SIZE, micro_batch=MICRO_BATCH,
+                                  backend=MODEL_BACKEND, decode_min_size=DECODE_MIN_SIZE, raw=raw)
+
+def confidence_profile(raw_detections, class_names):
+    """
+    Per-class detection confidences in descending order, for re-pricing in the browser.
+
+    The result page counts the confidences at or above its slider value
+    with a binary search, so moving the slider never calls the server.
+    """
+    profile = {}
+    for class_id in np.unique(raw_detections.class_ids).tolist():
+        # Masking keeps the descending order of the raw set
+        confidences = raw_detections.confidences[raw_detections.class_ids == class_id]
+        profile[class_id] = {'name': class_names.get(class_id, f"Class {class_id}"),
+                             'confidences': [round(conf, 6) for conf in confidences.tolist()]}
+    return profile
+
+def process_blueprint_job(job_id, data, filename, digest, tax_percent, discount_percent, conf_threshold=None):
+    """Detect -> quote -> report pipeline run by the job workers."""
+    detections = detect_upload(data, filename, digest, conf_threshold)
+    quotation = QuotationGenerator().generate_quotation(detections)
+
+    filename_pdf = get_report_cache().get_or_render(quotation, tax_rate=tax_percent / 100.0,
+                                                   discount_rate=discount_percent / 100.0,
+                                                   class_names=REPORT_CLASS_NAMES)
+
+    summary = summarize_quotation(quotation, tax_percent, discount_percent, SUMMARY_CLASS_NAMES)
+    summary.update({
+        'quotation_hash': quotation['quotation_hash'],
+        'download_count': quotation['download_count'],
+        'detections': len(detections),
+        'report_filename': filename_pdf
+    })
+    return summary
+
+def upload_name(filename):
+    """Name of an uploaded blueprint in the artifact store."""
+    return f"uploads/{filename}"
+
+def store_upload(filename, data, digest):
+    """Keep an upload in the artifact store, written by the background upload writer."""
+    get_artifact_store().add_bytes(upload_name(filename), data, digest, kind='upload', writer=get_upload_writer())
+
+def _adopt_legacy_report(filename):
+    # Reports rendered before the artifact store existed are moved into it on first download
+    for path in (os.path.join(app.config['UPLOAD_FOLDER'], 'reports', filename),
+                 os.path.join(app.config['UPLOAD_FOLDER'], filename)):
+        if filename.startswith('quotation') and filename.endswith('.pdf') and os.path.isfile(path):
+            get_artifact_store().add_file(report_name(filename), path, kind='report')
+            return get_report_cache().lookup(filename)
+    return None
+
 @app.route('/', methods=['GET', 'POST'])
 def upload_file():
     if request.method == 'POST':
@@ -30,57 +286,51 @@ def upload_file():
             return redirect(request.url)
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
 
-            # Get tax and discount percent from form
+            # Get tax and discount percent from form; a rejected form stores nothing
             try:
                 tax_percent = float(request.form.get('tax_percent', 10.0))
                 discount_percent = float(request.form.get('discount_percent', 0.0))
+                conf_threshold = parse_conf_threshold(request.form)
             except ValueError:
-                flash("Invalid tax or discount value")
+                flash("Invalid tax, discount or confidence value")
                 return redirect(request.url)
 
-            # Run inference
-            detections = run_inference(filepath)
+            # Keep the upload in memory and persist it off the request path; identical uploads share one file
+            data, digest = read_upload(file.stream)
+            store_upload(filename, data, digest)
 
-            # Generate quotation
+            # Run inference on the in-memory upload (raw detections cached by image content and model),
+            # then apply the threshold by slicing the confidence-sorted result
+            # De-duplicating the raw set keeps the result page's client-side re-pricing consistent with the quote
             qg = QuotationGenerator()
+            raw_detections = qg.deduplicate(detect_upload(data, filename, digest, conf_threshold, raw=True))
+            detections = raw_detections.above(conf_threshold).to_list()
+
+            # Generate quotation
             quotation = qg.generate_quotation(detections)
 
             # Prepare data for summary display
-            class_names = {
-                0: "switch",
-                1: "light",
-                2: "electrical outlet"
-            }
-            items = []
-            unit_prices = quotation.get('unit_prices', {})
-            for class_id, quantity in quotation.get('items', {}).items():
-                items.append({
-                    'name': class_names.get(class_id, f"Class {class_id}"),
-                    'quantity': quantity,
-                    'unit_price': unit_prices.get(class_id, 0.0),
-                    'total_price': unit_prices.get(class_id, 0.0) * quantity
-                })
-
-            # Calculate subtotal, tax, discount, and total for summary display
-            subtotal = sum(unit_prices.get(class_id, 0.0) * quantity for class_id, 
-                           quantity in quotation.get('items', {}).items())
-            tax_amount = subtotal * (tax_percent / 100.0)
-            discount_amount = subtotal * (discount_percent / 100.0)
-            total = subtotal + tax_amount - discount_amount
+            class_names = SUMMARY_CLASS_NAMES
+            summary = summarize_quotation(quotation, tax_percent, discount_percent, class_names)
+            items = summary['items']
+            subtotal = summary['subtotal']
+            tax_amount = summary['tax_amount']
+            discount_amount = summary['discount_amount']
+            total = summary['total']
 
             # Render preview without saving PDF
             return render_template('result.html', filename=None, items=items, subtotal=subtotal, 
                                    tax_amount=tax_amount, discount_amount=discount_amount, total=total, total_cost=total, 
                                    quotation=quotation, class_names=class_names, blueprint_filename=filename, 
-                                   tax_percent=tax_percent, discount_percent=discount_percent)
+                                   blueprint_digest=digest,
+                                   tax_percent=tax_percent, discount_percent=discount_percent,
+                                   conf_threshold=conf_threshold, floor_conf=min(conf_threshold, RAW_FLOOR_CONF),
+                                   confidence_profile=confidence_profile(raw_detections, class_names),
+                                   near_duplicate=_near_duplicate_of(digest))
 
     return render_template('upload.html')
 
-from flask import jsonify
-
 @app.route('/finalize', methods=['POST'])
 def finalize_quotation():
     data = request.form
@@ -88,41 +338,179 @@ def finalize_quotation():
     if not blueprint_filename:
         flash("Blueprint filename missing")
         return redirect(url_for('upload_file'))
+    try:
+        tax_percent = float(data.get('tax_percent', 10.0))
+        discount_percent = float(data.get('discount_percent', 0.0))
+        conf_threshold = parse_conf_threshold(data)
+    except ValueError:
+        flash("Invalid tax, discount or confidence value")
+        return redirect(url_for('upload_file'))
 
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], blueprint_filename)
-    if not os.path.exists(filepath):
+    # The result page carries the upload's digest, so another upload under the same filename can't be picked up
+    store = get_artifact_store()
+    digest = data.get('blueprint_digest') or store.digest(upload_name(blueprint_filename))
+    filepath = store.lookup_digest(digest) if digest else None
+    # The upload may still be queued on the background writer
+    if filepath is not None:
+        get_upload_writer().wait(filepath, timeout=30)
+    if filepath is None or not os.path.exists(filepath):
         flash("Blueprint file not found")
         return redirect(url_for('upload_file'))
 
-    # Run inference again (or ideally cache the previous result, but for simplicity rerun)
-    detections = run_inference(filepath)
+    # Served from the detection cache populated by the upload request; the store names files by
+    # their digest, so it isn't hashed again
+    with open(filepath, 'rb') as f:
+        blueprint_bytes = f.read()
+    detections = detect_upload(blueprint_bytes, blueprint_filename, digest, conf_threshold)
 
     # Generate quotation
     qg = QuotationGenerator()
     quotation = qg.generate_quotation(detections)
 
     # Prepare data for PDF generation
-    class_names = {
-        0: "switches",
-        1: "lights",
-        2: "electrical outlets"
-    }
+    class_names = REPORT_CLASS_NAMES
 
-    # Generate PDF report with unique filename
-    quotation_number = quotation.get('download_count', None)
-    filename_pdf = f"quotation_{quotation_number}.pdf" if quotation_number else "quotation.pdf"
-    pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], filename_pdf)
-    rg = ReportGenerator(filename=pdf_path)
-    rg.generate_pdf(quotation, class_names=class_names)
+    # The report is named after its content, so identical quotations share one rendered PDF
+    # and different quotations can never overwrite each other
+    filename_pdf = get_report_cache().get_or_render(quotation, tax_rate=tax_percent / 100.0,
+                                                   discount_rate=discount_percent / 100.0, class_names=class_names)
 
     flash("Quotation finalized and PDF generated. You can now download it.")
     return redirect(url_for('download_report', filename=filename_pdf))
 
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    file = request.files.get('blueprint')
+    if file is None or file.filename == '':
+        return jsonify({'error': 'No file uploaded under "blueprint"'}), 400
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'Unsupported file type'}), 400
+    try:
+        tax_percent = float(request.form.get('tax_percent', 10.0))
+        discount_percent = float(request.form.get('discount_percent', 0.0))
+        conf_threshold = parse_conf_threshold(request.form)
+    except ValueError:
+        return jsonify({'error': 'Invalid tax, discount or confidence value'}), 400
+
+    # Shed load before reading the upload when the queue is already full
+    stats = job_manager.stats()
+    if stats['queued'] >= stats['max_queue']:
+        return _queue_full_response()
+
+    job_key = uuid.uuid4().hex
+    filename = f"{job_key}_{secure_filename(file.filename)}"
+    data, digest = read_upload(file.stream)
+
+    try:
+        job_id = job_manager.submit(process_blueprint_job, job_key, data, filename, digest, tax_percent,
+                                    discount_percent, conf_threshold)
+    except QueueFullError:
+        return _queue_full_response()
+    store_upload(filename, data, digest)
+    return jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': url_for('job_status', job_id=job_id)
+    }), 202
+
+def _queue_full_response():
+    response = jsonify({'error': 'Server busy, try again shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    data = job.to_dict()
+    if data.get('result'):
+        data['result'] = dict(data['result'],
+                              report_url=url_for('download_report', filename=data['result']['report_filename']))
+    return jsonify(data)
+
+@app.route('/revisions', methods=['POST'])
+def submit_revision():
+    """
+    Quote a new revision of a named drawing, re-running inference only where it changed.
+
+    Form fields: 'blueprint' (raster image), 'drawing' (name shared by all
+    revisions of a sheet), optional 'previous_digest' to diff against a
+    specific revision instead of the drawing's latest, and the usual tax,
+    discount and confidence values.
+    """
+    from src.revisions import is_digest, requote_revision
+
+    file = request.files.get('blueprint')
+    drawing = request.form.get('drawing')
+    if file is None or file.filename == '' or not drawing:
+        return jsonify({'error': 'Upload a "blueprint" and name its "drawing"'}), 400
+    if not allowed_file(file.filename) or file.filename.lower().endswith('.pdf'):
+        return jsonify({'error': 'Revisions must be raster images'}), 400
+    previous_digest = request.form.get('previous_digest') or None
+    if previous_digest is not None and not is_digest(previous_digest):
+        return jsonify({'error': '"previous_digest" must be a 64-character lowercase hex digest'}), 400
+    try:
+        tax_percent = float(request.form.get('tax_percent', 10.0))
+        discount_percent = float(request.form.get('discount_percent', 0.0))
+        conf_threshold = parse_conf_threshold(request.form)
+    except ValueError:
+        return jsonify({'error': 'Invalid tax, discount or confidence value'}), 400
+
+    filename = secure_filename(file.filename)
+    data, digest = read_upload(file.stream)
+    store_upload(filename, data, digest)
+    result = requote_revision(data, filename, previous_digest=previous_digest,
+                              drawing=drawing, model_path=MODEL_PATH, conf_threshold=conf_threshold,
+                              device=MODEL_DEVICE, tile_size=TILE_SIZE or 640, backend=MODEL_BACKEND, digest=digest)
+    quotation = result['quotation']
+    summary = summarize_quotation(quotation, tax_percent, discount_percent, SUMMARY_CLASS_NAMES)
+    for item in (result['changes'] or {}).get('changed_items', []):
+        item['name'] = SUMMARY_CLASS_NAMES.get(item['class_id'], f"Class {item['class_id']}")
+    summary.update({key: result[key] for key in ('digest', 'previous_digest', 'mode', 'changed_tiles',
+                                                 'total_tiles', 'shift', 'changes')})
+    summary.update({'quotation_hash': quotation['quotation_hash'], 'download_count': quotation['download_count'],
+                    'detections': len(result['detections'])})
+    return jsonify(summary)
+
+@app.route('/inference/stats', methods=['GET'])
+def inference_stats():
+    return jsonify({'micro_batching': MICRO_BATCH, 'batchers': _batcher_stats(), 'jobs': job_manager.stats(),
+                    'reports': get_report_cache().stats(), 'artifacts': get_artifact_store().stats(),
+                    'near_duplicates': _near_duplicate_stats()})
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving HTTP."""
+    return jsonify({'status': 'alive', 'pid': os.getpid()})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: 200 only once the model is loaded and warmed up in this process."""
+    body = dict(startup, ready=_ready.is_set())
+    return jsonify(body), 200 if body['ready'] else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    profiler = profile_store.get(profile_id)
+    if profiler is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    # Summary first, then collapsed stacks for flame graph tools
+    return Response(profiler.summary() + '\n' + profiler.collapsed(), mimetype='text/plain')
+
 @app.route('/download/<filename>')
 def download_report(filename):
-    path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    if os.path.exists(path):
-        return send_file(path, as_attachment=True)
+    filename = secure_filename(filename)
+    path = get_report_cache().lookup(filename) or _adopt_legacy_report(filename)
+    if path is not None and os.path.exists(path):
+        # Flask resolves relative paths against the package directory, not the working directory;
+        # stored files are named by digest, so the download keeps the report's own name
+        return send_file(os.path.abspath(path), as_attachment=True, download_name=filename)
     else:
         flash("Report not found")
         return redirect(url_for('upload_file'))
@@ -0,0 +1,269 @@
+from src.detection_cache import hash_bytes, hash_file
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARTIFACT_DIR = os.environ.get('AIPQS_ARTIFACT_DIR', os.path.join('uploads', 'artifacts'))
+DEFAULT_MAX_BYTES = int(os.environ.get('AIPQS_ARTIFACT_MB', 2048)) * 1024 * 1024
+# Artifacts not read for this long are deleted regardless of the byte budget; 0 keeps them until space is needed
+DEFAULT_TTL = float(os.environ.get('AIPQS_ARTIFACT_TTL_DAYS', 30)) * 86400
+EVICT_INTERVAL = float(os.environ.get('AIPQS_ARTIFACT_EVICT_INTERVAL', 60))
+# Never evict what was written or read this recently, e.g. an upload waiting to be finalized
+MIN_AGE = 300
+
+
+class ArtifactStore:
+    """
+    Content-addressed, size-capped store for uploads and generated reports.
+
+    Files live once per SHA-256 digest under objects/ab/cd/<digest>, so
+    identical uploads or reports share one file however many names point at
+    them. Files already on disk (rendered reports, legacy uploads) are
+    hard-linked in rather than copied. A SQLite index next to the objects
+    maps names to digests, records sizes and access times, and keeps a
+    running byte total updated in the same transaction as each insert and
+    delete; a background thread deletes objects unread for `ttl` seconds and
+    then the least recently used ones until the store fits in `max_bytes`.
+    """
+
+    def __init__(self, root=DEFAULT_ARTIFACT_DIR, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL,
+                 evict_interval=EVICT_INTERVAL):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.evict_interval = evict_interval
+        self._tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(root, 'index.sqlite'), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS objects (digest TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+            "kind TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS objects_accessed ON objects (accessed)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS names (name TEXT PRIMARY KEY, digest TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS names_digest ON names (digest)")
+        # One row holding SUM(size) of objects, so adds never scan the table; seeded from it for older indexes
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)"
+        )
+        self._conn.execute("INSERT OR IGNORE INTO totals (id, bytes) SELECT 0, COALESCE(SUM(size), 0) FROM objects")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.evicted = 0
+
+    def object_path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest[2:4], digest)
+
+    def temp_path(self, suffix=''):
+        """A unique path inside the store, on the same filesystem as the objects, for building a file."""
+        return os.path.join(self._tmp_dir, f"{uuid.uuid4().hex}{suffix}")
+
+    def _reserve(self, digest, size, kind):
+        # Marks the object as just used before its file is checked or written. Eviction removes rows and files
+        # in one transaction, so afterwards the file is either safe from it or already gone and rewritten
+        now = time.time()
+        with self._lock:
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO objects (digest, size, kind, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (digest, size, kind, now, now)).rowcount
+            if inserted:
+                self._conn.execute("UPDATE totals SET bytes = bytes + ? WHERE id = 0", (size,))
+            else:
+                self._conn.execute("UPDATE objects SET accessed = ? WHERE digest = ?", (now, digest))
+            self._conn.commit()
+
+    def _name(self, name, digest):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO names (name, digest, created) VALUES (?, ?, ?)",
+                               (name, digest, time.time()))
+            self._conn.commit()
+        if self.max_bytes and self.total_bytes() > self.max_bytes:
+            self._wake.set()
+
+    def add_bytes(self, name, data, digest=None, kind='upload', writer=None):
+        """
+        Store `data` under `name`.
+
+        Bytes already in the store are not written again. With an UploadWriter
+        as `writer` the file is written off the calling thread; callers that
+        read it back should `writer.wait(path)` first.
+
+        Returns:
+            str: The content digest.
+        """
+        digest = digest or hash_bytes(data)
+        path = self.object_path(digest)
+        self._reserve(digest, len(data), kind)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if writer is not None:
+                writer.submit(path, data, digest)
+            else:
+                tmp_path = self.temp_path()
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+        self._name(name, digest)
+        self._start()
+        return digest
+
+    def add_file(self, name, source, kind='report', digest=None, keep_source=False):
+        """
+        Store an existing file under `name`.
+
+        The file is hard-linked into place (copied only across filesystems),
+        so adding it costs no data copy. If the content is already stored the
+        new file is dropped. Unless `keep_source`, `source` is removed.
+
+        Returns:
+            str: The content digest.
+        """
+        digest = digest or hash_file(source)
+        path = self.object_path(digest)
+        size = os.path.getsize(source)
+        self._reserve(digest, size, kind)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                os.link(source, path)
+            except FileExistsError:
+                pass
+            except OSError:
+                tmp_path = self.temp_path()
+                shutil.copyfile(source, tmp_path)
+                os.replace(tmp_path, path)
+        if not keep_source:
+            os.remove(source)
+        self._name(name, digest)
+        self._start()
+        return digest
+
+    def digest(self, name):
+        with self._lock:
+            row = self._conn.execute("SELECT digest FROM names WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def lookup(self, name):
+        """
+        Path of the file stored under `name`, marked as recently used, or None.
+
+        An upload still queued on the writer is returned too; its file exists
+        once the write finishes.
+        """
+        digest = self.digest(name)
+        return self.lookup_digest(digest) if digest else None
+
+    def lookup_digest(self, digest):
+        """Path of the stored file with this content digest, marked as recently used, or None."""
+        with self._lock:
+            updated = self._conn.execute("UPDATE objects SET accessed = ? WHERE digest = ?",
+                                         (time.time(), digest)).rowcount
+            self._conn.commit()
+        return self.object_path(digest) if updated else None
+
+    def _total(self):
+        return self._conn.execute("SELECT bytes FROM totals WHERE id = 0").fetchone()[0]
+
+    def total_bytes(self):
+        with self._lock:
+            return self._total()
+
+    def evict(self, now=None):
+        """
+        Delete expired objects, then least recently used ones while over budget.
+
+        Returns:
+            int: Bytes freed.
+        """
+        now = time.time() if now is None else now
+        cutoff = now - MIN_AGE
+        with self._lock:
+            # Rows and files go together, so an add racing with eviction never indexes a deleted file
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                victims = []
+                if self.ttl:
+                    victims = self._conn.execute(
+                        "SELECT digest, size FROM objects WHERE accessed < ?", (min(now - self.ttl, cutoff),)
+                    ).fetchall()
+                total = self._total() - sum(size for _, size in victims)
+                if self.max_bytes and total > self.max_bytes:
+                    expired = {digest for digest, _ in victims}
+                    for digest, size in self._conn.execute(
+                            "SELECT digest, size FROM objects WHERE accessed < ? ORDER BY accessed", (cutoff,)
+                    ).fetchall():
+                        if total <= self.max_bytes:
+                            break
+                        if digest not in expired:
+                            victims.append((digest, size))
+                            total -= size
+                for digest, _ in victims:
+                    self._conn.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+                    self._conn.execute("DELETE FROM names WHERE digest = ?", (digest,))
+                    try:
+                        os.remove(self.object_path(digest))
+                    except FileNotFoundError:
+                        pass
+                self._conn.execute("UPDATE totals SET bytes = bytes - ? WHERE id = 0",
+                                   (sum(size for _, size in victims),))
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        freed = sum(size for _, size in victims)
+        if victims:
+            self.evicted += len(victims)
+            logger.info(f"Evicted {len(victims)} artifacts ({freed / 1e6:.1f} MB freed)")
+        return freed
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None and (self.max_bytes or self.ttl):
+                self._thread = threading.Thread(target=self._evict_loop, name='artifact-evictor', daemon=True)
+                self._thread.start()
+
+    def _evict_loop(self):
+        while True:
+            # Woken early when an add pushes the store over budget
+            self._wake.wait(self.evict_interval)
+            self._wake.clear()
+            try:
+                self.evict()
+            except Exception:
+                logger.exception("Artifact eviction failed")
+
+    def stats(self, kind=None):
+        with self._lock:
+            if kind is None:
+                size = self._total()
+                count = self._conn.execute("SELECT COUNT(*) FROM objects").fetchone()[0]
+            else:
+                size, count = self._conn.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM objects WHERE kind = ?",
+                                                  (kind,)).fetchone()
+            names = self._conn.execute("SELECT COUNT(*) FROM names").fetchone()[0]
+        return {'objects': count, 'names': names, 'bytes': size, 'max_bytes': self.max_bytes,
+                'ttl_s': self.ttl, 'evicted': self.evicted}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_artifact_store():
+    """Return the process-wide artifact store, creating it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ArtifactStore()
+        return _store
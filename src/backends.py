@@ -0,0 +1,193 @@
+from src.batch_pipeline import letterbox, unletterbox_boxes
+from src.detections import Detections
+from src.tiling import nms
+import numpy as np
+import ast
+import cv2
+import glob
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+PYTORCH = 'pytorch'
+ONNX = 'onnx'
+OPENVINO = 'openvino'
+BACKENDS = (PYTORCH, ONNX, OPENVINO)
+PRECISIONS = ('fp32', 'int8')
+
+
+def resolve_backend(model_path, backend=None):
+    """Pick the execution backend from an explicit name or the exported model's file layout."""
+    if backend:
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+        return backend
+    if model_path.endswith('.onnx'):
+        return ONNX
+    if model_path.endswith('.xml') or model_path.rstrip('/\\').endswith('_openvino_model'):
+        return OPENVINO
+    return PYTORCH
+
+
+def int8_model_path(model_path):
+    """Where the INT8 ONNX model built from `model_path` (.pt or FP32 .onnx) is stored."""
+    return os.path.splitext(model_path)[0] + '_int8.onnx'
+
+
+def resolve_precision(model_path, precision=None):
+    """
+    Map a model path to the weights for the requested precision.
+
+    'fp32' (or None) returns `model_path` unchanged; 'int8' returns the
+    statically quantized ONNX model produced by model/quantize_model.py.
+    """
+    if precision in (None, 'fp32'):
+        return model_path
+    if precision != 'int8':
+        raise ValueError(f"Unknown precision '{precision}', expected 'fp32' or 'int8'")
+    if model_path.endswith('_int8.onnx'):
+        return model_path
+    quantized = int8_model_path(model_path)
+    if not os.path.exists(quantized):
+        raise FileNotFoundError(f"No INT8 model at {quantized}; build it with model/quantize_model.py")
+    return quantized
+
+
+def num_threads():
+    """Intra-op thread count for CPU backends, from AIPQS_NUM_THREADS (0/unset lets the runtime decide)."""
+    return int(os.environ.get('AIPQS_NUM_THREADS', 0)) or None
+
+
+class ExportedYOLO:
+    """
+    Runs an exported YOLOv8 detection graph and returns Detections per image.
+
+    Mirrors the parts of the ultralytics YOLO interface the pipeline uses:
+    `model(img_or_list, conf=..., iou=...)` and `model.names`. Pre-processing
+    (letterbox, BGR->RGB, NCHW, /255) and post-processing (class-aware NMS,
+    mapping boxes back to the source image) match ultralytics' defaults so
+    results line up with the PyTorch model.
+    """
+
+    def __init__(self, names, imgsz=640, dynamic_batch=True):
+        self.names = names
+        self.imgsz = imgsz
+        self.dynamic_batch = dynamic_batch
+
+    def __call__(self, images, conf=0.25, iou=0.7, max_det=300, **kwargs):
+        if isinstance(images, np.ndarray) and images.ndim == 3:
+            images = [images]
+        # ultralytics resizes with bilinear interpolation; match it for parity with PyTorch
+        prepared = [letterbox(img, self.imgsz, interpolation=cv2.INTER_LINEAR) for img in images]
+        batch = np.stack([canvas for canvas, _, _ in prepared])
+        batch = np.ascontiguousarray(batch[..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32) / 255.0
+
+        if self.dynamic_batch:
+            outputs = self._run(batch)
+        else:
+            outputs = np.concatenate([self._run(batch[i:i + 1]) for i in range(len(batch))])
+
+        results = []
+        for output, img, (_, scale, pad) in zip(outputs, images, prepared):
+            detections = self._decode(output, conf, iou, max_det)
+            detections.boxes = unletterbox_boxes(detections.boxes, scale, pad, img.shape)
+            results.append(detections)
+        return results
+
+    def predict(self, images, **kwargs):
+        return self(images, **kwargs)
+
+    def _run(self, batch):
+        raise NotImplementedError
+
+    @staticmethod
+    def _decode(output, conf, iou, max_det):
+        # YOLOv8 head: (4 + num_classes, anchors) with boxes as cx, cy, w, h
+        output = output.T
+        scores = output[:, 4:]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+        keep = confidences > conf
+        if not keep.any():
+            return Detections.empty()
+        xywh, class_ids, confidences = output[keep, :4], class_ids[keep], confidences[keep]
+        boxes = np.concatenate((xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2), axis=1)
+        order = nms(boxes, confidences, iou, class_ids=class_ids)[:max_det]
+        return Detections(class_ids[order], confidences[order], boxes[order])
+
+
+def _parse_names(names):
+    if isinstance(names, str):
+        names = ast.literal_eval(names)
+    return {int(k): v for k, v in names.items()}
+
+
+class OnnxYOLO(ExportedYOLO):
+    """YOLOv8 ONNX export executed with ONNX Runtime on CPU."""
+
+    def __init__(self, model_path, threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        imgsz = ast.literal_eval(metadata['imgsz'])[0] if 'imgsz' in metadata else 640
+        names = _parse_names(metadata['names']) if 'names' in metadata else {}
+        batch_dim = self.session.get_inputs()[0].shape[0]
+        super().__init__(names, imgsz=imgsz, dynamic_batch=not isinstance(batch_dim, int))
+
+    def _run(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class OpenVINOYOLO(ExportedYOLO):
+    """YOLOv8 OpenVINO IR export compiled for CPU."""
+
+    def __init__(self, model_path, threads=None):
+        import openvino as ov
+        import yaml
+
+        if os.path.isdir(model_path):
+            model_dir = model_path
+            model_path = glob.glob(os.path.join(model_dir, '*.xml'))[0]
+        else:
+            model_dir = os.path.dirname(model_path)
+
+        core = ov.Core()
+        model = core.read_model(model_path)
+        batch_dim = model.inputs[0].get_partial_shape()[0]
+        config = {'PERFORMANCE_HINT': 'LATENCY'}
+        if threads:
+            config['INFERENCE_NUM_THREADS'] = threads
+        self.compiled = core.compile_model(model, 'CPU', config)
+
+        names, imgsz = {}, 640
+        metadata_path = os.path.join(model_dir, 'metadata.yaml')
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as f:
+                metadata = yaml.safe_load(f)
+            names = _parse_names(metadata.get('names', {}))
+            imgsz = metadata.get('imgsz', [imgsz])[0]
+        super().__init__(names, imgsz=imgsz, dynamic_batch=batch_dim.is_dynamic)
+
+    def _run(self, batch):
+        return self.compiled(batch)[self.compiled.output(0)]
+
+
+def load_exported_model(model_path, backend):
+    """Load an exported model for a CPU backend with the configured thread count."""
+    threads = num_threads()
+    logger.info(f"Loading {backend} model {model_path} (threads={threads or 'auto'})")
+    if backend == ONNX:
+        return OnnxYOLO(model_path, threads=threads)
+    if backend == OPENVINO:
+        return OpenVINOYOLO(model_path, threads=threads)
+    raise ValueError(f"Not an exported-model backend: {backend}")
@@ -0,0 +1,132 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import logging
+import cv2
+
+logger = logging.getLogger(__name__)
+
+
+def letterbox(img, size=640, pad_value=114, interpolation=None):
+    """
+    Resize an image to fit a square canvas, preserving aspect ratio.
+
+    `interpolation` defaults to INTER_AREA when shrinking and INTER_LINEAR
+    when enlarging.
+
+    Returns:
+        tuple: (size x size image, scale, (pad_x, pad_y)) where original
+        coordinates map to canvas coordinates as `xy * scale + pad`.
+    """
+    height, width = img.shape[:2]
+    scale = min(size / width, size / height)
+    new_w, new_h = max(1, round(width * scale)), max(1, round(height * scale))
+    if (new_w, new_h) != (width, height):
+        if interpolation is None:
+            interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        img = cv2.resize(img, (new_w, new_h), interpolation=interpolation)
+    pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+    canvas = np.full((size, size, 3), pad_value, dtype=np.uint8)
+    canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = img
+    return canvas, scale, (pad_x, pad_y)
+
+
+def unletterbox_boxes(boxes, scale, pad, original_shape):
+    """Map (N, 4) xyxy boxes from letterboxed canvas coordinates back to the original image."""
+    pad_x, pad_y = pad
+    boxes = (boxes - np.array([pad_x, pad_y, pad_x, pad_y], dtype=np.float32)) / scale
+    height, width = original_shape[:2]
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+    return boxes
+
+
+class DecodedImage:
+    def __init__(self, path, canvas, scale, pad, original_shape, original=None):
+        self.path = path
+        self.canvas = canvas
+        self.scale = scale
+        self.pad = pad
+        self.original_shape = original_shape
+        # Only kept when the caller needs to draw on the full-resolution image
+        self.original = original
+
+
+def load_letterboxed(path, size=640, keep_original=False):
+    """Decode and letterbox one image, returning None if it cannot be read."""
+    img = cv2.imread(path)
+    if img is None:
+        return None
+    canvas, scale, pad = letterbox(img, size)
+    return DecodedImage(path, canvas, scale, pad, img.shape, img if keep_original else None)
+
+
+class PrefetchingDecoder:
+    """
+    Ordered, bounded read-ahead over a sequence of work items.
+
+    Items are pulled from `items` lazily. Those that `needs_decode` accepts are
+    decoded and letterboxed on a thread pool (OpenCV releases the GIL while
+    decoding); at most `prefetch` items are in flight, so memory stays bounded
+    no matter how many images the directory holds. Items come back in input
+    order via `next_batch`.
+    """
+
+    def __init__(self, items, size=640, workers=4, prefetch=32, keep_original=False, needs_decode=None):
+        self._items = iter(items)
+        self._size = size
+        self._prefetch = max(1, prefetch)
+        self._keep_original = keep_original
+        self._needs_decode = needs_decode or (lambda item: True)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='decode')
+        self._pending = deque()
+        self._exhausted = False
+
+    def _fill(self):
+        while not self._exhausted and len(self._pending) < self._prefetch:
+            item = next(self._items, None)
+            if item is None:
+                self._exhausted = True
+                break
+            future = None
+            if self._needs_decode(item):
+                future = self._pool.submit(load_letterboxed, item[0], self._size, self._keep_original)
+            self._pending.append((item, future))
+
+    def next_batch(self, batch_size):
+        """
+        Return the next run of items in input order.
+
+        Consecutive decoded items are grouped into a list of up to `batch_size`
+        (item, DecodedImage or None) pairs; an item that needed no decode is
+        returned on its own as [(item, None)]. Returns an empty list when done.
+        """
+        self._fill()
+        if not self._pending:
+            return []
+        item, future = self._pending.popleft()
+        if future is None:
+            return [(item, None)]
+        batch = [(item, future)]
+        while len(batch) < batch_size:
+            self._fill()
+            if not self._pending or self._pending[0][1] is None:
+                break
+            batch.append(self._pending.popleft())
+        results = [(item, future.result()) for item, future in batch]
+        # Keep decoding the next items while the caller runs the model on this batch
+        self._fill()
+        return results
+
+    def close(self):
+        for _, future in self._pending:
+            if future is not None:
+                future.cancel()
+        self._pending.clear()
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
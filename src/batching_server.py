@@ -0,0 +1,205 @@
+from concurrent.futures import Future
+from src.model_registry import get_model, get_registry, DEFAULT_BACKEND
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH = int(os.environ.get('AIPQS_MICRO_BATCH_SIZE', 8))
+DEFAULT_MAX_WAIT_MS = float(os.environ.get('AIPQS_MICRO_BATCH_WAIT_MS', 10))
+
+_STOP = object()
+
+
+class _Request:
+    def __init__(self, image, kwargs):
+        self.image = image
+        self.kwargs = kwargs
+        self.group = tuple(sorted((k, repr(v)) for k, v in kwargs.items()))
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    Coalesces single-image model calls from concurrent threads into batches.
+
+    A background thread takes the first waiting frame, then keeps collecting
+    frames for up to `max_wait_ms` or until `max_batch` are gathered, runs one
+    forward pass and hands each caller the Result for its own frame. Calls
+    with different predict arguments are never mixed in one batch.
+
+    Instances are callable like a YOLO model (`batcher(img)` or
+    `batcher([img, ...])`), so existing inference code can use them unchanged.
+    Once closed, calls run unbatched on the model instead of being queued.
+    """
+
+    def __init__(self, model, max_batch=DEFAULT_MAX_BATCH, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        self.model = model
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._carry = None
+        # Guards `_closed` so no frame is queued behind the stop marker
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._frames = 0
+        self._queue_delay_total = 0.0
+        self._queue_delay_max = 0.0
+        self._batch_sizes = {}
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    @property
+    def names(self):
+        return self.model.names
+
+    def __call__(self, images, **kwargs):
+        kwargs.pop('verbose', None)
+        single = not isinstance(images, (list, tuple))
+        requests = [_Request(img, kwargs) for img in ([images] if single else images)]
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                for req in requests:
+                    self._queue.put(req)
+        if closed:
+            # Replaced or stopped, e.g. after a reload, while the caller still held this batcher
+            return self.model([req.image for req in requests], verbose=False, **kwargs)
+        return [req.future.result() for req in requests]
+
+    def stats(self):
+        """Batch fill rate and queueing delay since the batcher started."""
+        with self._stats_lock:
+            batches = self._batches
+            return {
+                'batches': batches,
+                'frames': self._frames,
+                'max_batch': self.max_batch,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'mean_batch_size': self._frames / batches if batches else 0.0,
+                'fill_rate': self._frames / (batches * self.max_batch) if batches else 0.0,
+                'mean_queue_delay_ms': 1000.0 * self._queue_delay_total / self._frames if self._frames else 0.0,
+                'max_queue_delay_ms': 1000.0 * self._queue_delay_max,
+                'queue_depth': self._queue.qsize(),
+                'batch_size_histogram': dict(sorted(self._batch_sizes.items())),
+            }
+
+    def _next(self, timeout=None):
+        if self._carry is not None:
+            req, self._carry = self._carry, None
+            return req
+        return self._queue.get(timeout=timeout)
+
+    def close(self):
+        """Stop the batching thread once already queued frames are served."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+
+    def _collect(self):
+        first = self._next()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                req = self._next(timeout=remaining)
+            except queue.Empty:
+                break
+            if req is _STOP or req.group != first.group:
+                # Different predict arguments; start the next batch with it
+                self._carry = req
+                break
+            batch.append(req)
+        return batch
+
+    def _run(self):
+        try:
+            self._serve()
+        except Exception:
+            logger.exception("Micro-batcher stopped unexpectedly")
+        finally:
+            self._fail_leftovers()
+
+    def _serve(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            try:
+                results = self.model([req.image for req in batch], verbose=False, **batch[0].kwargs)
+            except Exception as e:
+                for req in batch:
+                    req.future.set_exception(e)
+                continue
+            for req, result in zip(batch, results):
+                req.future.set_result(result)
+            self._record(batch, started)
+
+    def _fail_leftovers(self):
+        # Nothing can be queued once closed, so whatever is left now would otherwise wait forever
+        with self._lock:
+            self._closed = True
+        leftovers = [self._carry] if self._carry is not None else []
+        self._carry = None
+        while True:
+            try:
+                leftovers.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for req in leftovers:
+            if req is not _STOP and not req.future.done():
+                req.future.set_exception(RuntimeError("Micro-batcher stopped before serving this frame"))
+
+    def _record(self, batch, started):
+        delays = [started - req.enqueued_at for req in batch]
+        with self._stats_lock:
+            self._batches += 1
+            self._frames += len(batch)
+            self._queue_delay_total += sum(delays)
+            self._queue_delay_max = max(self._queue_delay_max, max(delays))
+            self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(model_path, device=None, backend=DEFAULT_BACKEND, max_batch=DEFAULT_MAX_BATCH,
+                max_wait_ms=DEFAULT_MAX_WAIT_MS):
+    """
+    Return the shared micro-batcher for a model, creating it on first use.
+
+    The underlying model comes from the registry; if the registry has reloaded
+    the weights since the batcher was created, a new batcher is started.
+    """
+    model = get_model(model_path, device=device, backend=backend)
+    key = get_registry().make_key(model_path, device, backend)
+    with _batchers_lock:
+        batcher = _batchers.get(key)
+        if batcher is None or batcher.model is not model:
+            if batcher is not None:
+                batcher.close()
+            batcher = MicroBatcher(model, max_batch=max_batch, max_wait_ms=max_wait_ms)
+            _batchers[key] = batcher
+        return batcher
+
+
+def batcher_stats():
+    """Stats for every active batcher, keyed by model path."""
+    with _batchers_lock:
+        return {f"{path} ({backend}, device={device})": batcher.stats()
+                for (path, device, backend), batcher in _batchers.items()}
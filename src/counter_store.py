@@ -0,0 +1,266 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = os.environ.get('AIPQS_COUNTER_BACKEND', 'sqlite')
+
+
+class CounterStore:
+    """
+    Persistent map of quotation hash -> number of times it was issued.
+
+    `increment` must be atomic across threads and processes and cost the same
+    no matter how many quotations have been recorded.
+    """
+
+    def increment(self, key):
+        """Add one to `key` and return the new count."""
+        raise NotImplementedError
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def compact(self):
+        """Reclaim space; safe to call at any time."""
+
+    def close(self):
+        pass
+
+    def import_counts(self, counts):
+        """Seed the store from a {hash: count} dict, keeping the larger count on conflict."""
+        raise NotImplementedError
+
+
+class SQLiteCounterStore(CounterStore):
+    """Counter table in a WAL-mode SQLite database, shared safely by multiple processes."""
+
+    def __init__(self, path, checkpoint_every=1000):
+        self.path = path
+        self.checkpoint_every = checkpoint_every
+        self._conn = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            # Autocommit mode; transactions are opened explicitly with BEGIN IMMEDIATE
+            self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS quotation_counts (hash TEXT PRIMARY KEY, count INTEGER NOT NULL)"
+            )
+        return self._conn
+
+    def increment(self, key):
+        with self._lock:
+            conn = self._connection()
+            # The write lock is taken up front so the read-back sees our own increment
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("INSERT OR IGNORE INTO quotation_counts (hash, count) VALUES (?, 0)", (key,))
+                conn.execute("UPDATE quotation_counts SET count = count + 1 WHERE hash = ?", (key,))
+                count = conn.execute("SELECT count FROM quotation_counts WHERE hash = ?", (key,)).fetchone()[0]
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self._writes += 1
+            if self.checkpoint_every and self._writes % self.checkpoint_every == 0:
+                self._checkpoint(conn)
+            return count
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT count FROM quotation_counts WHERE hash = ?", (key,)
+            ).fetchone()
+            return row[0] if row else 0
+
+    def import_counts(self, counts):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT INTO quotation_counts (hash, count) VALUES (?, ?) "
+                    "ON CONFLICT(hash) DO UPDATE SET count = MAX(count, excluded.count)",
+                    list(counts.items())
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def compact(self):
+        with self._lock:
+            self._checkpoint(self._connection())
+
+    def _checkpoint(self, conn):
+        # Fold the WAL back into the main database so it doesn't grow without bound
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class _FileLock:
+    """Exclusive advisory lock on an open file, across processes."""
+
+    def __init__(self, f):
+        self.f = f
+
+    def __enter__(self):
+        if os.name == 'nt':
+            import msvcrt
+            self.f.seek(0)
+            msvcrt.locking(self.f.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if os.name == 'nt':
+            import msvcrt
+            self.f.seek(0)
+            msvcrt.locking(self.f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+
+
+class AppendLogCounterStore(CounterStore):
+    """
+    Counters kept as an append-only text log.
+
+    Each increment appends one '<hash> +1' line under an inter-process file
+    lock. Every process keeps an in-memory index and only replays the bytes
+    other processes appended since it last looked, so an increment costs a
+    small read and a single append. Once the log holds `compact_after` more
+    lines than there are distinct keys it is rewritten as one '<hash> =<count>'
+    snapshot line per key.
+    """
+
+    def __init__(self, path, compact_after=10000):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.compact_after = compact_after
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._offset = 0
+        self._lines = 0
+        self._inode = None
+
+    def increment(self, key):
+        with self._lock, open(self.lock_path, 'a+') as lock_file, _FileLock(lock_file):
+            self._catch_up()
+            count = self._counts.get(key, 0) + 1
+            with open(self.path, 'ab') as log:
+                log.write(f"{key} +1\n".encode('utf-8'))
+                self._offset = log.tell()
+            self._counts[key] = count
+            self._lines += 1
+            if self.compact_after and self._lines - len(self._counts) > self.compact_after:
+                self._rewrite()
+            return count
+
+    def get(self, key):
+        with self._lock, open(self.lock_path, 'a+') as lock_file, _FileLock(lock_file):
+            self._catch_up()
+            return self._counts.get(key, 0)
+
+    def import_counts(self, counts):
+        with self._lock, open(self.lock_path, 'a+') as lock_file, _FileLock(lock_file):
+            self._catch_up()
+            for key, count in counts.items():
+                self._counts[key] = max(self._counts.get(key, 0), int(count))
+            self._rewrite()
+
+    def compact(self):
+        with self._lock, open(self.lock_path, 'a+') as lock_file, _FileLock(lock_file):
+            self._catch_up()
+            self._rewrite()
+
+    def _catch_up(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._counts, self._offset, self._lines, self._inode = {}, 0, 0, None
+            return
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            # Another process compacted the log; replay it from the start
+            self._counts, self._offset, self._lines = {}, 0, 0
+            self._inode = stat.st_ino
+        if stat.st_size == self._offset:
+            return
+        with open(self.path, 'rb') as log:
+            log.seek(self._offset)
+            data = log.read()
+        # Only consume complete lines
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].decode('utf-8').splitlines():
+            key, _, op = line.partition(' ')
+            if op.startswith('='):
+                self._counts[key] = int(op[1:])
+            else:
+                self._counts[key] = self._counts.get(key, 0) + int(op)
+            self._lines += 1
+        self._offset += end
+
+    def _rewrite(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as tmp:
+            tmp.write(''.join(f"{key} ={count}\n" for key, count in self._counts.items()).encode('utf-8'))
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.replace(tmp_path, self.path)
+        stat = os.stat(self.path)
+        self._inode, self._offset, self._lines = stat.st_ino, stat.st_size, len(self._counts)
+        logger.info(f"Compacted counter log {self.path} to {len(self._counts)} entries")
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_counter_store(counts_file='quotation_counts.json', backend=DEFAULT_BACKEND):
+    """
+    Return the process-wide counter store for `counts_file`, opening it lazily.
+
+    The store lives next to `counts_file` with a backend-specific extension.
+    If a legacy JSON counts file exists it is imported once when the store is
+    first created.
+    """
+    base = os.path.splitext(counts_file)[0]
+    if backend == 'sqlite':
+        path = base + '.sqlite'
+    elif backend == 'log':
+        path = base + '.log'
+    else:
+        raise ValueError(f"Unknown counter store backend: {backend}")
+
+    key = (os.path.abspath(path), backend)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is not None:
+            return store
+        is_new = not os.path.exists(path)
+        store = SQLiteCounterStore(path) if backend == 'sqlite' else AppendLogCounterStore(path)
+        if is_new and counts_file.endswith('.json') and os.path.exists(counts_file):
+            with open(counts_file, 'r') as f:
+                legacy = json.load(f)
+            store.import_counts(legacy)
+            logger.info(f"Imported {len(legacy)} quotation counts from {counts_file} into {path}")
+        _stores[key] = store
+        return store
@@ -0,0 +1,210 @@
+from src.detections import Detections
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.environ.get('AIPQS_DETECTION_CACHE', os.path.join('uploads', 'detection_cache.sqlite'))
+# Raw detections are stored down to this confidence, so any request threshold above it is a slice
+RAW_FLOOR_CONF = float(os.environ.get('AIPQS_RAW_FLOOR_CONF', 0.01))
+# Bump when the raw layout or what it is computed from changes
+RAW_FORMAT = 1
+
+
+def hash_bytes(data):
+    """SHA-256 hex digest of an image's raw bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+_digest_memo = OrderedDict()
+_digest_lock = threading.Lock()
+
+
+def file_digest(path, max_entries=1024):
+    """
+    Content hash of a file, memoized on (path, size, mtime) so repeat lookups
+    of an unchanged upload skip re-reading and re-hashing it.
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _digest_lock:
+        digest = _digest_memo.get(memo_key)
+        if digest is not None:
+            _digest_memo.move_to_end(memo_key)
+            return digest
+    digest = hash_file(path)
+    _remember(memo_key, digest, max_entries)
+    return digest
+
+
+def remember_digest(path, digest, max_entries=1024):
+    """Record the hash of a file just written from memory so file_digest() doesn't re-read it."""
+    stat = os.stat(path)
+    _remember((os.path.abspath(path), stat.st_size, stat.st_mtime_ns), digest, max_entries)
+
+
+def _remember(memo_key, digest, max_entries):
+    with _digest_lock:
+        _digest_memo[memo_key] = digest
+        _digest_memo.move_to_end(memo_key)
+        while len(_digest_memo) > max_entries:
+            _digest_memo.popitem(last=False)
+
+
+def make_key(image_digest, model_id, conf_threshold, **params):
+    """
+    Build a cache key from the image content hash, the model identity and the
+    inference parameters that affect the detections.
+    """
+    parts = [image_digest, model_id, f"{float(conf_threshold):.6f}"]
+    for name in sorted(params):
+        parts.append(f"{name}={json.dumps(params[name], sort_keys=True)}")
+    return '|'.join(parts)
+
+
+def make_raw_key(image_digest, model_id, conf_threshold, **params):
+    """
+    Cache key for the raw detections that can answer `conf_threshold`.
+
+    Raw entries hold every detection down to RAW_FLOOR_CONF (lower only if a
+    caller asks for less), sorted by confidence and unfiltered by class, so
+    the threshold and class filter of a request are not part of the key.
+
+    Returns:
+        tuple: (key, floor confidence the raw detections must be computed at)
+    """
+    floor = min(float(conf_threshold), RAW_FLOOR_CONF)
+    return make_key(image_digest, model_id, floor, raw=RAW_FORMAT, **params), floor
+
+
+class DetectionCache:
+    """
+    Two-tier, content-addressed cache of detection results.
+
+    A bounded in-memory LRU sits in front of a SQLite table on disk, so repeat
+    lookups within a process are dictionary hits and results survive restarts.
+    Values are lists of detection dicts, or raw `Detections` (see
+    `make_raw_key`), which are stored as packed binary rows.
+    """
+
+    def __init__(self, db_path=DEFAULT_CACHE_PATH, max_memory_entries=256):
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS detections (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key):
+        """Return cached detections for `key`, or None on a miss."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+            row = self._connection().execute(
+                "SELECT value FROM detections WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            detections = _decode(row[0])
+            self._remember(key, detections)
+            self.hits += 1
+            return detections
+
+    def put(self, key, detections):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO detections (key, value) VALUES (?, ?)",
+                (key, _encode(detections))
+            )
+            conn.commit()
+            self._remember(key, detections)
+
+    def get_or_compute(self, key, compute):
+        """Return cached detections for `key`, calling `compute()` and storing its result on a miss."""
+        detections = self.get(key)
+        if detections is None:
+            detections = compute()
+            self.put(key, detections)
+        return detections
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            conn = self._connection()
+            conn.execute("DELETE FROM detections")
+            conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _remember(self, key, detections):
+        self._memory[key] = detections
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+
+def _encode(detections):
+    if isinstance(detections, Detections):
+        # Raw entries are stored as packed binary rows
+        return detections.to_bytes()
+    return json.dumps(detections, separators=(',', ':'))
+
+
+def _decode(value):
+    if isinstance(value, bytes):
+        return Detections.from_bytes(value)
+    detections = json.loads(value)
+    # JSON has no tuples; restore bbox to the shape inference returns
+    for det in detections:
+        if 'bbox' in det:
+            det['bbox'] = tuple(det['bbox'])
+    return detections
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_detection_cache():
+    """Return the process-wide detection cache, creating it on first use."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = DetectionCache()
+        return _default_cache
@@ -0,0 +1,167 @@
+import numpy as np
+
+# Packed row layout of `Detections.to_bytes`: 24 bytes per detection
+PACKED_DTYPE = np.dtype([('confidence', '<f4'), ('class_id', '<i2'), ('page', '<i2'), ('box', '<f4', (4,))])
+
+class Detections:
+    """
+    Columnar set of detections backed by NumPy arrays.
+
+    Attributes:
+        class_ids (np.ndarray): (N,) int64 class ids.
+        confidences (np.ndarray): (N,) float32 scores.
+        boxes (np.ndarray): (N, 4) float32 x1, y1, x2, y2 in image pixels.
+        pages (np.ndarray or None): (N,) int64 0-based PDF page per detection.
+
+    Filtering uses boolean masks over the columns, and `to_list` converts to
+    the list-of-dicts format the rest of the pipeline consumes.
+    """
+
+    __slots__ = ('class_ids', 'confidences', 'boxes', 'pages')
+
+    def __init__(self, class_ids, confidences, boxes, pages=None):
+        self.class_ids = np.asarray(class_ids, dtype=np.int64).reshape(-1)
+        self.confidences = np.asarray(confidences, dtype=np.float32).reshape(-1)
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.pages = None if pages is None else np.asarray(pages, dtype=np.int64).reshape(-1)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0), np.empty(0), np.empty((0, 4)))
+
+    @classmethod
+    def from_result(cls, result):
+        """Build from an ultralytics Result, copying its tensors to host memory once."""
+        if isinstance(result, cls):
+            # Exported-model backends already return Detections
+            return result
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return cls.empty()
+        return cls(boxes.cls.cpu().numpy(), boxes.conf.cpu().numpy(), boxes.xyxy.cpu().numpy())
+
+    @classmethod
+    def from_results(cls, results):
+        return cls.concat([cls.from_result(result) for result in results])
+
+    @classmethod
+    def from_list(cls, detections):
+        """Build from the list-of-dicts format ('class_id', 'confidence', 'bbox', optional 'page')."""
+        if isinstance(detections, cls):
+            return detections
+        if not detections:
+            return cls.empty()
+        class_ids = [det['class_id'] for det in detections]
+        confidences = [det.get('confidence', 1.0) for det in detections]
+        boxes = [det.get('bbox', (0, 0, 0, 0)) for det in detections]
+        pages = None
+        if 'page' in detections[0]:
+            pages = [det.get('page', 0) for det in detections]
+        return cls(class_ids, confidences, boxes, pages)
+
+    @classmethod
+    def concat(cls, parts):
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return cls.empty()
+        if len(parts) == 1:
+            return parts[0]
+        pages = None
+        if all(part.pages is not None for part in parts):
+            pages = np.concatenate([part.pages for part in parts])
+        return cls(np.concatenate([part.class_ids for part in parts]),
+                   np.concatenate([part.confidences for part in parts]),
+                   np.concatenate([part.boxes for part in parts]),
+                   pages)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Rebuild detections packed by `to_bytes`."""
+        rows = np.frombuffer(data, dtype=PACKED_DTYPE)
+        pages = rows['page'] if len(rows) and rows['page'][0] >= 0 else None
+        return cls(rows['class_id'], rows['confidence'], rows['box'], pages)
+
+    def __len__(self):
+        return len(self.class_ids)
+
+    def __getitem__(self, index):
+        """Select rows with a boolean mask, index array or slice."""
+        return Detections(self.class_ids[index], self.confidences[index], self.boxes[index],
+                          None if self.pages is None else self.pages[index])
+
+    def with_page(self, page):
+        return Detections(self.class_ids, self.confidences, self.boxes, np.full(len(self), page, dtype=np.int64))
+
+    def mask(self, conf_threshold=None, class_filter=None):
+        keep = np.ones(len(self), dtype=bool)
+        if conf_threshold is not None:
+            keep &= self.confidences >= conf_threshold
+        if class_filter is not None:
+            keep &= np.isin(self.class_ids, np.asarray(list(class_filter), dtype=np.int64))
+        return keep
+
+    def filter(self, conf_threshold=None, class_filter=None):
+        """Keep detections at or above `conf_threshold` whose class is in `class_filter`."""
+        if conf_threshold is None and class_filter is None:
+            return self
+        return self[self.mask(conf_threshold, class_filter)]
+
+    def sort_by_confidence(self):
+        """Reorder by descending confidence, the layout `above` relies on."""
+        return self[np.argsort(-self.confidences, kind='stable')]
+
+    def above(self, conf_threshold):
+        """
+        Detections at or above `conf_threshold`, for a set sorted by `sort_by_confidence`.
+
+        A binary search over the confidence column finds the cut, and the
+        result is a prefix slice, so no column is copied.
+        """
+        return self[:int(np.searchsorted(-self.confidences, -np.float32(conf_threshold), side='right'))]
+
+    def shift(self, dx, dy):
+        """Translate boxes, e.g. from tile to sheet coordinates."""
+        offset = np.array([dx, dy, dx, dy], dtype=np.float32)
+        return Detections(self.class_ids, self.confidences, self.boxes + offset, self.pages)
+
+    def scale(self, factor):
+        """Scale boxes, e.g. from a reduced-resolution decode back to full size."""
+        return Detections(self.class_ids, self.confidences, self.boxes * np.float32(factor), self.pages)
+
+    def counts(self, minlength=0):
+        """Per-class counts as an array indexed by class id."""
+        if len(self) == 0:
+            return np.zeros(minlength, dtype=np.int64)
+        return np.bincount(self.class_ids, minlength=minlength)
+
+    def to_bytes(self):
+        """Pack into fixed-size rows (see PACKED_DTYPE) for compact storage."""
+        rows = np.empty(len(self), dtype=PACKED_DTYPE)
+        rows['confidence'] = self.confidences
+        rows['class_id'] = self.class_ids
+        rows['page'] = -1 if self.pages is None else self.pages
+        rows['box'] = self.boxes
+        return rows.tobytes()
+
+    def to_list(self, names=None):
+        """
+        Convert to a list of detection dicts.
+
+        Args:
+            names (dict or None): If given, adds 'class_name' from this class id -> name map.
+        """
+        class_ids = self.class_ids.tolist()
+        confidences = self.confidences.tolist()
+        boxes = self.boxes.astype(np.int64).tolist()
+        pages = self.pages.tolist() if self.pages is not None else None
+        detections = []
+        for i, cls in enumerate(class_ids):
+            det = {'class_id': cls}
+            if names is not None:
+                det['class_name'] = names.get(cls, f"class_{cls}")
+            det['confidence'] = confidences[i]
+            det['bbox'] = tuple(boxes[i])
+            if pages is not None:
+                det['page'] = pages[i]
+            detections.append(det)
+        return detections
@@ -1,47 +1,216 @@
-from ultralytics import YOLO
+from src.backends import BACKENDS, ONNX, PRECISIONS, resolve_precision
+from src.batching_server import get_batcher
+from src.detections import Detections
+from src.detection_cache import RAW_FLOOR_CONF, get_detection_cache, file_digest, hash_bytes, make_raw_key
+from src.metrics import record_cache, stage
+from src.model_registry import get_model, model_identity
+from src.near_duplicates import get_near_duplicate_index, keep_reference, reuse_near_duplicate
+from src.pdf_ingest import is_pdf, iter_pdf_detections, DEFAULT_DPI
+from src.tiling import tiled_predict
+from src.upload_stream import decode_image
 import cv2
 import os
 
-def run_inference(image_path, model_path='models/yolov8m_trained.pt', conf_threshold=0.15):
-    # Load the trained YOLO model
-    model = YOLO(model_path)
+def run_inference(image_path, model_path='models/yolov8m_trained.pt', conf_threshold=0.15, device=None,
+                  use_cache=True, tile_size=None, tile_overlap=0.2, tile_batch_size=4, pdf_dpi=DEFAULT_DPI,
+                  pdf_workers=2, micro_batch=False, backend=None, precision=None, class_filter=None, raw=False):
+    """
+    Detect symbols in a blueprint image or multi-page PDF.
 
-    # Read the input image
-    img = cv2.imread(image_path)
-    if img is None:
+    The model runs once per image at a low floor confidence and every
+    detection is cached, sorted by confidence (see
+    src.detection_cache.make_raw_key). `conf_threshold` and `class_filter`
+    are applied by slicing that raw set, so changing them never reruns the
+    model. With `raw=True` the sorted, unfiltered Detections are returned
+    instead of a list of dicts.
+
+    PDF pages are rasterized at `pdf_dpi` in a pool of `pdf_workers` processes
+    while the model runs on earlier pages. Each PDF detection carries a
+    'page' key (0-based) so quotations can be broken down per sheet.
+
+    With `micro_batch`, frames from concurrent callers are coalesced into
+    shared forward passes by the model's MicroBatcher. `backend` selects
+    'pytorch', 'onnx' or 'openvino' execution and is inferred from the model
+    path when None. `precision='int8'` runs the statically quantized ONNX
+    model built next to `model_path` by model/quantize_model.py.
+    """
+    if not os.path.isfile(image_path):
         raise FileNotFoundError(f"Image not found at {image_path}")
 
-    # Run inference
-    results = model(img)
-
-    # Parse results
-    detections = []
-    for result in results:
-        for box in result.boxes:
-            cls = int(box.cls[0])
-            conf = float(box.conf[0])
-            if conf >= conf_threshold:
-                # Bounding box coordinates
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                detections.append({
-                    'class_id': cls,
-                    'confidence': conf,
-                    'bbox': (x1, y1, x2, y2)
-                })
+    def load_image():
+        img = cv2.imread(image_path)
+        if img is None:
+            raise FileNotFoundError(f"Image not found at {image_path}")
+        return img, 1
+
+    detections = _run_cached(image_path, lambda: file_digest(image_path), load_image, is_pdf(image_path),
+                             model_path, conf_threshold, device, use_cache, tile_size, tile_overlap,
+                             tile_batch_size, pdf_dpi, pdf_workers, micro_batch, backend, precision)
+    return detections if raw else refilter(detections, conf_threshold, class_filter)
+
+def run_inference_on_bytes(data, filename, digest=None, model_path='models/yolov8m_trained.pt', conf_threshold=0.15,
+                           device=None, use_cache=True, tile_size=None, tile_overlap=0.2, tile_batch_size=4,
+                           pdf_dpi=DEFAULT_DPI, pdf_workers=2, micro_batch=False, backend=None, precision=None,
+                           decode_min_size=None, class_filter=None, raw=False):
+    """
+    Detect symbols in an uploaded blueprint held in memory.
+
+    Same as `run_inference`, but decodes straight from `data` with
+    cv2.imdecode instead of re-reading a saved file. `filename` is only used
+    to recognise PDFs. Pass the `digest` computed while the upload streamed
+    in (see src.upload_stream.read_upload) to skip hashing it again; cache
+    entries are shared with `run_inference` on the saved file.
+
+    With `decode_min_size`, large untiled images are decoded at reduced
+    resolution (long side kept >= `decode_min_size`) and boxes are scaled
+    back to full-resolution coordinates.
+    """
+    if tile_size:
+        decode_min_size = None
+
+    def load_image():
+        img, factor = decode_image(data, decode_min_size)
+        if img is None:
+            raise ValueError(f"Could not decode image {filename}")
+        return img, factor
+
+    detections = _run_cached(data, lambda: digest or hash_bytes(data), load_image, is_pdf(filename), model_path,
+                             conf_threshold, device, use_cache, tile_size, tile_overlap, tile_batch_size, pdf_dpi,
+                             pdf_workers, micro_batch, backend, precision,
+                             extra_params={'decode_min_size': decode_min_size} if decode_min_size else None)
+    return detections if raw else refilter(detections, conf_threshold, class_filter)
+
+def refilter(raw_detections, conf_threshold=0.15, class_filter=None, names=None):
+    """
+    Apply a confidence threshold and class filter to raw detections as a list of dicts.
 
+    `raw_detections` must be sorted by confidence (as returned with
+    `raw=True`), so the threshold is a binary search and a prefix slice.
+    """
+    return raw_detections.above(conf_threshold).filter(class_filter=class_filter).to_list(names)
+
+def _run_cached(source, get_digest, load_image, pdf, model_path, conf_threshold, device, use_cache, tile_size,
+                tile_overlap, tile_batch_size, pdf_dpi, pdf_workers, micro_batch, backend, precision,
+                extra_params=None):
+    if precision == 'int8':
+        model_path, backend = resolve_precision(model_path, precision), ONNX
+
+    # Identical image bytes with the same model and settings give identical raw detections
+    floor = min(conf_threshold, RAW_FLOOR_CONF)
+    cache = get_detection_cache() if use_cache else None
+    if cache is not None:
+        params = {'tile_size': tile_size, 'tile_overlap': tile_overlap} if tile_size else {}
+        if pdf:
+            params['pdf_dpi'] = pdf_dpi
+        elif extra_params:
+            params.update(extra_params)
+        with stage('cache_lookup'):
+            digest, model_id = get_digest(), model_identity(model_path, backend)
+            key, floor = make_raw_key(digest, model_id, conf_threshold, **params)
+            detections = cache.get(key)
+        record_cache('detection', detections is not None)
+        if detections is not None:
+            return detections
+
+    index = get_near_duplicate_index() if cache is not None and not pdf else None
+    if not pdf:
+        with stage('decode'):
+            img, factor = load_image()
+    if index is not None:
+        # Re-exports and re-scans of an already processed sheet reuse its detections where they still match
+        with stage('near_duplicate'):
+            detections, gray = reuse_near_duplicate(
+                index, cache, digest, img, factor,
+                lambda candidate: make_raw_key(candidate, model_id, conf_threshold, **params)[0],
+                lambda: get_model(model_path, device=device, backend=backend), tile_size=tile_size,
+                tile_overlap=tile_overlap, tile_batch_size=tile_batch_size, conf_threshold=floor)
+        if detections is not None:
+            cache.put(key, detections)
+            return detections
+
+    with stage('model_load'):
+        if micro_batch:
+            model = get_batcher(model_path, device=device, backend=backend)
+        else:
+            # Fetch the trained YOLO model from the process-wide registry (loaded once)
+            model = get_model(model_path, device=device, backend=backend)
+
+    def detect(img):
+        return predict_detections(model, img, floor, tile_size=tile_size, tile_overlap=tile_overlap,
+                                  tile_batch_size=tile_batch_size)
+
+    if pdf:
+        pages = iter_pdf_detections(source, detect, dpi=pdf_dpi, workers=pdf_workers)
+        detections = Detections.concat([page_detections.with_page(page) for page, page_detections in pages])
+    else:
+        detections = detect(img)
+        if factor != 1:
+            detections = detections.scale(factor)
+    with stage('postprocess'):
+        detections = detections.sort_by_confidence()
+
+    if cache is not None:
+        cache.put(key, detections)
+    if index is not None:
+        index.add(digest, gray, img.shape[1] * factor, img.shape[0] * factor)
+        if isinstance(source, bytes):
+            keep_reference(digest, source)
+        else:
+            with open(source, 'rb') as f:
+                keep_reference(digest, f.read())
     return detections
 
+def predict_detections(model, img, conf_threshold=0.15, class_filter=None, tile_size=None, tile_overlap=0.2,
+                       tile_batch_size=4):
+    """Run a loaded model on a decoded BGR image and return columnar Detections."""
+    if tile_size:
+        # Slice large sheets into model-sized tiles so small symbols aren't lost to downsampling
+        with stage('forward'):
+            detections = tiled_predict(model, img, tile_size=tile_size, overlap=tile_overlap,
+                                       batch_size=tile_batch_size, conf_threshold=conf_threshold)
+    else:
+        # Copying results to host memory waits for the device, so it counts as forward time.
+        # The model gets the threshold too: ultralytics otherwise drops everything below 0.25
+        with stage('forward'):
+            detections = Detections.from_results(model(img, verbose=False, conf=conf_threshold))
+    # Thresholding and class filtering are single vectorized masks over the columns
+    with stage('postprocess'):
+        return detections.filter(conf_threshold=conf_threshold, class_filter=class_filter)
+
+def detect_image(model, img, conf_threshold=0.15, tile_size=None, tile_overlap=0.2, tile_batch_size=4):
+    """Run a loaded model on a decoded BGR image and return a list of detection dicts."""
+    return predict_detections(model, img, conf_threshold, tile_size=tile_size, tile_overlap=tile_overlap,
+                              tile_batch_size=tile_batch_size).to_list()
+
 if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser(description="Run YOLO inference on blueprint image")
-    parser.add_argument('image_path', type=str, help='Path to blueprint image')
+    parser.add_argument('image_path', type=str, help='Path to blueprint image or PDF')
     parser.add_argument('--model_path', type=str, default='models/yolov8n_fifth_epoch.pt', help='Path to trained YOLO model')
     parser.add_argument('--conf_threshold', type=float, default=0.25, help='Confidence threshold for detections')
+    parser.add_argument('--device', type=str, default=None, help="Device to run on, e.g. 'cpu' or 'cuda:0'")
+    parser.add_argument('--backend', type=str, default=None, choices=BACKENDS,
+                        help='Execution backend (default: inferred from the model file)')
+    parser.add_argument('--precision', type=str, default='fp32', choices=PRECISIONS,
+                        help='Model precision; int8 uses the quantized ONNX model next to --model_path')
+    parser.add_argument('--num_threads', type=int, default=None, help='CPU threads for ONNX/OpenVINO backends')
+    parser.add_argument('--no_cache', action='store_true', help='Bypass the detection cache')
+    parser.add_argument('--tile_size', type=int, default=None, help='Run tiled inference with this tile size in pixels')
+    parser.add_argument('--tile_overlap', type=float, default=0.2, help='Fractional overlap between tiles')
+    parser.add_argument('--tile_batch_size', type=int, default=4, help='Number of tiles per forward pass')
+    parser.add_argument('--pdf_dpi', type=int, default=DEFAULT_DPI, help='Rasterization DPI for PDF blueprints')
+    parser.add_argument('--pdf_workers', type=int, default=2, help='Worker processes rasterizing PDF pages')
 
     args = parser.parse_args()
+    if args.num_threads:
+        os.environ['AIPQS_NUM_THREADS'] = str(args.num_threads)
 
-    detections = run_inference(args.image_path, args.model_path, args.conf_threshold)
+    detections = run_inference(args.image_path, args.model_path, args.conf_threshold, device=args.device,
+                               use_cache=not args.no_cache, tile_size=args.tile_size,
+                               tile_overlap=args.tile_overlap, tile_batch_size=args.tile_batch_size,
+                               pdf_dpi=args.pdf_dpi, pdf_workers=args.pdf_workers, backend=args.backend,
+                               precision=args.precision)
     print("Detections:")
     for det in detections:
         print(det)
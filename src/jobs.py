@@ -0,0 +1,134 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at its depth limit."""
+
+
+class Job:
+    def __init__(self, job_id, fn, args, kwargs):
+        self.id = job_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if self.status == DONE:
+            data['result'] = self.result
+        elif self.status == FAILED:
+            data['error'] = self.error
+        return data
+
+
+class JobManager:
+    """
+    In-process job queue with a fixed pool of worker threads.
+
+    Submissions beyond `max_queue` waiting jobs are rejected with
+    QueueFullError so callers can shed load (e.g. HTTP 503) instead of piling
+    up requests until they time out. Finished jobs are kept for `result_ttl`
+    seconds so clients can poll for them.
+    """
+
+    def __init__(self, workers=2, max_queue=16, result_ttl=3600):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._running = 0
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue `fn(*args, **kwargs)` and return its job id without waiting for it to run."""
+        self.start()
+        self._purge()
+        job = Job(uuid.uuid4().hex, fn, args, kwargs)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise QueueFullError(f"Job queue is full ({self.max_queue} waiting)")
+        return job.id
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'running': self._running,
+                'max_queue': self.max_queue,
+                'workers': self.workers,
+                'tracked_jobs': len(self._jobs),
+            }
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                job.status = RUNNING
+                job.started_at = time.time()
+                self._running += 1
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+                status, error = DONE, None
+            except Exception as e:
+                logger.exception(f"Job {job.id} failed")
+                result, status, error = None, FAILED, str(e)
+            with self._lock:
+                job.result = result
+                job.error = error
+                job.status = status
+                job.finished_at = time.time()
+                self._running -= 1
+                # Drop references to the inputs once the job has finished
+                job.args = job.kwargs = None
+            self._queue.task_done()
+
+    def _purge(self):
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
@@ -1,14 +1,31 @@
 import os
-from src.object_detection import detect_objects
+from src.backends import BACKENDS
+from src.object_detection import IMAGE_EXTENSIONS, detect_objects, iter_detections
 from src.quotation_generator import QuotationGenerator
 from src.report_generator import ReportGenerator
+from src.spatial_index import load_regions
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import csv
+import json
+import logging
+import multiprocessing
+import queue
+import threading
+import time
 
-def main(image_path, model_path='models/yolov8n_trained.pt', output_dir='output'):
+logger = logging.getLogger(__name__)
+
+# Written to the output directory of a bulk run: one line per finished sheet, read back to resume
+PROGRESS_FILE = 'bulk_progress.jsonl'
+MANIFEST_EXTENSIONS = ('.txt', '.csv')
+
+def main(image_path, model_path='models/yolov8n_trained.pt', output_dir='output', use_cache=True, backend=None,
+         regions=None):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    # Run object detection
-    detections_dict = detect_objects(image_path, model_path)
+    # Run object detection (served from the detection cache for previously seen blueprints)
+    detections_dict = detect_objects(image_path, model_path, use_cache=use_cache, backend=backend)
 
     # Extract detections list for the single image
     detections = []
@@ -17,7 +34,7 @@ def main(image_path, model_path='models/yolov8n_trained.pt', output_dir='output'
 
     # Generate quotation
     qg = QuotationGenerator()
-    quotation = qg.generate_quotation(detections)
+    quotation = qg.generate_quotation(detections, regions=regions)
 
     # Generate PDF report with quotation number in filename
     quotation_number = quotation.get('download_count', None)
@@ -28,14 +45,244 @@ def main(image_path, model_path='models/yolov8n_trained.pt', output_dir='output'
 
     print(f"Quotation report generated at: {report_path}")
 
+def read_manifest(manifest_path):
+    """
+    Blueprint paths listed in a manifest, relative paths resolved against the manifest's folder.
+
+    A .txt manifest has one path per line; a .csv manifest has a 'path'
+    column, or the paths in its first column.
+    """
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, 'r', newline='') as f:
+        if manifest_path.lower().endswith('.csv'):
+            rows = list(csv.reader(f))
+            if rows and 'path' in rows[0]:
+                column = rows[0].index('path')
+                rows = rows[1:]
+            else:
+                column = 0
+            entries = [row[column] for row in rows if len(row) > column]
+        else:
+            entries = f.read().splitlines()
+    entries = [entry.strip() for entry in entries]
+    return [os.path.join(base, entry) for entry in entries if entry and not entry.startswith('#')]
+
+def resolve_inputs(input_path):
+    """Blueprint paths for a bulk run from a directory or a manifest file."""
+    if os.path.isdir(input_path):
+        return sorted(os.path.join(input_path, f) for f in os.listdir(input_path)
+                      if os.path.splitext(f)[1].lower() in IMAGE_EXTENSIONS)
+    return read_manifest(input_path)
+
+def _report_names(paths):
+    """Report filename per blueprint: its stem, numbered when stems repeat (stable for a given input order)."""
+    names, seen = {}, {}
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        seen[stem] = seen.get(stem, 0) + 1
+        names[path] = f"quotation_{stem}.pdf" if seen[stem] == 1 else f"quotation_{stem}_{seen[stem]}.pdf"
+    return names
+
+def _source_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+def _load_progress(progress_path):
+    done = {}
+    if not os.path.exists(progress_path):
+        return done
+    with open(progress_path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash; that sheet is simply redone
+                continue
+            done[entry['blueprint']] = entry
+    return done
+
+def _is_done(entry, path, output_dir):
+    # A sheet is skipped only if its report exists and the blueprint hasn't changed since
+    return (entry is not None and entry['source'] == _source_stamp(path)
+            and os.path.exists(os.path.join(output_dir, entry['report'])))
+
+def _render_sheet(path, quotation, tax_rate, discount_rate):
+    # Top-level so it can run in a worker process; the report appears under its final name only when complete
+    tmp_path = f"{path}.{os.getpid()}.part"
+    rg = ReportGenerator(filename=tmp_path, tax_rate=tax_rate, discount_rate=discount_rate)
+    rg.generate_pdf(quotation, quotation_number=quotation.get('download_count'))
+    os.replace(tmp_path, path)
+
+def run_bulk(input_path, model_path='models/yolov8n_trained.pt', output_dir='output', use_cache=True, backend=None,
+             resume=True, batch_size=8, decode_workers=4, render_workers=None, queue_size=16, tax_rate=0.1,
+             discount_rate=0.0, regions=None):
+    """
+    Quote every blueprint in a directory or manifest.
+
+    Decoding, inference, quotation and PDF rendering overlap: a thread
+    streams detections from `iter_detections` (which decodes ahead of
+    batched inference) into a bounded queue, the calling thread prices each
+    sheet with one shared QuotationGenerator, and reports are rendered in a
+    process pool with at most `queue_size` in flight. A slow stage therefore
+    holds the others back instead of letting work pile up in memory.
+
+    Every finished sheet is appended to bulk_progress.jsonl in `output_dir`.
+    With `resume`, sheets already listed there whose report exists and whose
+    blueprint is unchanged are skipped, so a run restarted after a crash
+    only redoes unfinished sheets. summary.csv and summary.json are written
+    at the end. With `regions`, every sheet is broken down by the same rooms
+    or zones (see QuotationGenerator.generate_quotation).
+
+    Returns:
+        dict: The summary written to summary.json.
+    """
+    paths = resolve_inputs(input_path)
+    os.makedirs(output_dir, exist_ok=True)
+    progress_path = os.path.join(output_dir, PROGRESS_FILE)
+    done = _load_progress(progress_path) if resume else {}
+    report_names = _report_names(paths)
+    todo = [path for path in paths if not _is_done(done.get(path), path, output_dir)]
+    logger.info(f"Bulk run: {len(paths)} blueprints, {len(paths) - len(todo)} already done")
+
+    start = time.perf_counter()
+    detected = queue.Queue(maxsize=queue_size)
+    finished = object()
+
+    def detect_stage():
+        try:
+            for path, detections in iter_detections(todo, model_path=model_path, batch_size=batch_size,
+                                                    decode_workers=decode_workers, use_cache=use_cache,
+                                                    backend=backend):
+                detected.put((path, detections))
+        except Exception as e:
+            logger.exception("Detection stage failed")
+            detected.put(e)
+        detected.put(finished)
+
+    detector = threading.Thread(target=detect_stage, name='bulk-detect', daemon=True)
+    detector.start()
+
+    qg = QuotationGenerator()
+    pending = {}
+    # Workers are spawned rather than forked: this process already runs decode and inference threads
+    spawn = multiprocessing.get_context('spawn')
+    with open(progress_path, 'a' if resume else 'w') as progress, \
+            ProcessPoolExecutor(max_workers=render_workers, mp_context=spawn) as pool:
+
+        def collect(futures):
+            for future in futures:
+                entry = pending.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Rendering the report for {entry['blueprint']} failed: {e}")
+                    continue
+                # One line per sheet, flushed before moving on, so a crash loses at most the sheets in flight
+                progress.write(json.dumps(entry) + '\n')
+                progress.flush()
+                done[entry['blueprint']] = entry
+
+        while True:
+            item = detected.get()
+            if item is finished:
+                break
+            if isinstance(item, Exception):
+                raise item
+            path, detections = item
+            quotation = qg.generate_quotation(detections, regions=regions)
+            report = report_names[path]
+            future = pool.submit(_render_sheet, os.path.join(output_dir, report), quotation, tax_rate, discount_rate)
+            pending[future] = {
+                'blueprint': path,
+                'source': _source_stamp(path),
+                'report': report,
+                'items': {str(class_id): quantity for class_id, quantity in quotation['items'].items()},
+                'subtotal': quotation['total_cost'],
+                'total': quotation['total_cost'] * (1 + tax_rate - discount_rate),
+                'quotation_hash': quotation['quotation_hash'],
+                'quotation_number': quotation['download_count'],
+            }
+            if 'region_items' in quotation:
+                pending[future]['region_items'] = quotation['region_items']
+            if len(pending) >= queue_size:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+        collect(list(pending))
+
+    elapsed = time.perf_counter() - start
+    processed = sum(1 for path in todo if path in done)
+    logger.info(f"Quoted {processed} blueprints in {elapsed:.1f}s ({processed / max(elapsed, 1e-9):.2f}/s)")
+    return write_summary(paths, done, output_dir)
+
+def write_summary(paths, done, output_dir):
+    """Write summary.csv (one row per sheet) and summary.json (rows plus grand totals) for a bulk run."""
+    sheets = [done[path] for path in paths if path in done]
+    missing = [path for path in paths if path not in done]
+    class_ids = sorted({int(class_id) for sheet in sheets for class_id in sheet['items']})
+    summary = {
+        'sheets': sheets,
+        'missing': missing,
+        'totals': {
+            'sheets': len(sheets),
+            'items': {str(class_id): sum(sheet['items'].get(str(class_id), 0) for sheet in sheets)
+                      for class_id in class_ids},
+            'subtotal': sum(sheet['subtotal'] for sheet in sheets),
+            'total': sum(sheet['total'] for sheet in sheets),
+        },
+    }
+    with open(os.path.join(output_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    with open(os.path.join(output_dir, 'summary.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['blueprint', 'report', 'quotation_number'] + [f"class_{class_id}" for class_id in class_ids]
+                        + ['subtotal', 'total'])
+        for sheet in sheets:
+            writer.writerow([sheet['blueprint'], sheet['report'], sheet['quotation_number']]
+                            + [sheet['items'].get(str(class_id), 0) for class_id in class_ids]
+                            + [f"{sheet['subtotal']:.2f}", f"{sheet['total']:.2f}"])
+    if missing:
+        logger.warning(f"{len(missing)} blueprints could not be quoted, e.g. {missing[0]}")
+    return summary
+
 if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser(description="Run full pipeline: detection, quotation, report generation")
-    parser.add_argument('image_path', type=str, help='Path to blueprint image')
+    parser.add_argument('image_path', type=str,
+                        help='Path to blueprint image, or a directory or manifest (.txt/.csv) for a bulk run')
     parser.add_argument('--model_path', type=str, default='models/yolov8n_trained.pt', help='Path to trained YOLO model')
     parser.add_argument('--output_dir', type=str, default='output', help='Directory to save the PDF report')
+    parser.add_argument('--no_cache', action='store_true', help='Bypass the detection cache')
+    parser.add_argument('--backend', type=str, default=None, choices=BACKENDS,
+                        help='Execution backend (default: inferred from the model file)')
+    parser.add_argument('--num_threads', type=int, default=None, help='CPU threads for ONNX/OpenVINO backends')
+    parser.add_argument('--batch_size', type=int, default=8, help='Images per forward pass in a bulk run')
+    parser.add_argument('--decode_workers', type=int, default=4, help='Threads decoding images in a bulk run')
+    parser.add_argument('--render_workers', type=int, default=None,
+                        help='Processes rendering PDF reports in a bulk run (default: CPU count)')
+    parser.add_argument('--queue_size', type=int, default=16, help='Sheets buffered between bulk stages')
+    parser.add_argument('--tax_rate', type=float, default=0.1, help='Tax rate printed on bulk reports')
+    parser.add_argument('--discount_rate', type=float, default=0.0, help='Discount rate printed on bulk reports')
+    parser.add_argument('--no_resume', action='store_true', help='Redo a bulk run from scratch')
+    parser.add_argument('--regions', type=str, default=None,
+                        help="JSON list of rooms/zones ({'name', 'polygon' or 'rect'}) to break quotations down by")
 
     args = parser.parse_args()
+    if args.num_threads:
+        os.environ['AIPQS_NUM_THREADS'] = str(args.num_threads)
+    regions = load_regions(args.regions) if args.regions else None
 
-    main(args.image_path, args.model_path, args.output_dir)
+    if os.path.isdir(args.image_path) or args.image_path.lower().endswith(MANIFEST_EXTENSIONS):
+        logging.basicConfig(level=logging.INFO)
+        summary = run_bulk(args.image_path, args.model_path, args.output_dir, use_cache=not args.no_cache,
+                           backend=args.backend, resume=not args.no_resume, batch_size=args.batch_size,
+                           decode_workers=args.decode_workers, render_workers=args.render_workers,
+                           queue_size=args.queue_size, tax_rate=args.tax_rate, discount_rate=args.discount_rate,
+                           regions=regions)
+        print(f"Quoted {summary['totals']['sheets']} blueprints, total ${summary['totals']['total']:.2f}; "
+              f"summary in {os.path.join(args.output_dir, 'summary.csv')}")
+    else:
+        main(args.image_path, args.model_path, args.output_dir, use_cache=not args.no_cache, backend=args.backend,
+             regions=regions)
@@ -0,0 +1,188 @@
+from contextlib import contextmanager
+import threading
+import time
+
+# Latency buckets in seconds, from sub-millisecond cache hits to multi-page PDF runs
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, rendered in Prometheus text format."""
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            index = 0
+            while index < len(self.buckets) and value > self.buckets[index]:
+                index += 1
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for labels, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                label_text = _format_labels(self.label_names + ('le',), labels + (le,))
+                lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {total}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class CallbackMetric:
+    """
+    Gauge or counter whose values are read from a callback at scrape time.
+
+    Used for state other components already track (queue depths, cache hit
+    counts), so the hot path doesn't pay for a second copy. The callback
+    returns a number, or a dict of label-value tuple -> number.
+    """
+
+    def __init__(self, name, help_text, fn, label_names=(), metric_type='gauge'):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.label_names = tuple(label_names)
+        self.metric_type = metric_type
+
+    def render(self):
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.metric_type}"]
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {float(value)}")
+        return lines
+
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def _register(metric):
+    with _metrics_lock:
+        return _metrics.setdefault(metric.name, metric)
+
+
+def histogram(name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram(name, help_text, label_names, buckets))
+
+
+def counter(name, help_text, label_names=()):
+    return _register(Counter(name, help_text, label_names))
+
+
+def register_callback(name, help_text, fn, label_names=(), metric_type='gauge'):
+    """Expose a value computed on scrape; re-registering a name replaces its callback."""
+    metric = CallbackMetric(name, help_text, fn, label_names, metric_type)
+    with _metrics_lock:
+        _metrics[name] = metric
+    return metric
+
+
+def render():
+    """All registered metrics in Prometheus text exposition format."""
+    with _metrics_lock:
+        metrics = list(_metrics.values())
+    lines = []
+    for metric in metrics:
+        try:
+            lines.extend(metric.render())
+        except Exception as e:
+            lines.append(f"# {metric.name} unavailable: {e}")
+    return '\n'.join(lines) + '\n'
+
+
+STAGE_SECONDS = histogram('aipqs_stage_seconds', 'Time spent in each pipeline stage', ('stage',))
+CACHE_REQUESTS = counter('aipqs_cache_requests_total', 'Cache lookups by cache and result', ('cache', 'result'))
+
+_local = threading.local()
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a pipeline stage, e.g. `with stage('decode'): ...`.
+
+    Durations go to the aipqs_stage_seconds histogram and, while a request
+    trace is active on this thread (see `start_trace`), into that request's
+    per-stage totals.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, name)
+        timings = getattr(_local, 'timings', None)
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache, 'hit' if hit else 'miss')
+
+
+def start_trace():
+    """Start collecting per-stage totals for the work done on this thread, e.g. one HTTP request."""
+    _local.timings = {}
+    return _local.timings
+
+
+def end_trace():
+    """Stop the trace started on this thread and return its {stage: seconds} totals."""
+    timings = getattr(_local, 'timings', None)
+    _local.timings = None
+    return timings or {}
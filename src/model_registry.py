@@ -0,0 +1,171 @@
+from collections import OrderedDict
+from src.backends import PYTORCH, resolve_backend, load_exported_model
+import numpy as np
+import threading
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = None  # inferred from the model path, see resolve_backend
+
+
+class _Entry:
+    def __init__(self, model, mtime):
+        self.model = model
+        self.mtime = mtime
+        self.warmed_up = False
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded YOLO models.
+
+    Models are keyed by (absolute path, device, backend) so each combination is
+    loaded exactly once. A model is transparently reloaded when the mtime of its
+    weights file changes, and the least recently used model is evicted once more
+    than `max_models` are held.
+    """
+
+    def __init__(self, max_models=2, warmup_size=640):
+        self.max_models = max_models
+        self.warmup_size = warmup_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # One lock per key so a slow load does not block lookups of other models
+        self._load_locks = {}
+
+    @staticmethod
+    def make_key(model_path, device=None, backend=DEFAULT_BACKEND):
+        return (os.path.abspath(model_path), device, resolve_backend(model_path, backend))
+
+    def get(self, model_path, device=None, backend=DEFAULT_BACKEND, warmup=False):
+        """
+        Return a loaded model, loading or reloading it if needed.
+
+        Args:
+            model_path (str): Path to the model weights.
+            device (str or None): Device to place the model on, e.g. 'cpu' or 'cuda:0'.
+            backend (str or None): 'pytorch', 'onnx' or 'openvino'; None infers it from the path.
+            warmup (bool): Run a dummy frame through the model after loading.
+
+        Returns:
+            The loaded model object.
+        """
+        key = self.make_key(model_path, device, backend)
+        mtime = self._weights_mtime(key[0])
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.mtime == mtime:
+                self._entries.move_to_end(key)
+                if not warmup or entry.warmed_up:
+                    return entry.model
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            # Another thread may have finished loading while we waited
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is None or entry.mtime != mtime:
+                if entry is not None:
+                    logger.info(f"Weights changed on disk, reloading model {key[0]}")
+                entry = _Entry(self._load(key), mtime)
+            if warmup and not entry.warmed_up:
+                self._warmup(entry.model, device)
+                entry.warmed_up = True
+
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                self._evict()
+            return entry.model
+
+    def preload(self, model_paths, device=None, backend=DEFAULT_BACKEND, warmup=True):
+        """Load (and by default warm up) a list of models ahead of the first request."""
+        for model_path in model_paths:
+            self.get(model_path, device=device, backend=backend, warmup=warmup)
+
+    def register(self, model_path, model, device=None, backend=DEFAULT_BACKEND):
+        """Insert an already constructed model (e.g. a stub for benchmarks) under `model_path`."""
+        key = self.make_key(model_path, device, backend)
+        entry = _Entry(model, self._weights_mtime(key[0]))
+        entry.warmed_up = True
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._load_locks.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def _evict(self):
+        while len(self._entries) > self.max_models:
+            key, _ = self._entries.popitem(last=False)
+            self._load_locks.pop(key, None)
+            logger.info(f"Evicted model {key[0]} ({key[2]}, device={key[1]}) from registry")
+
+    def _load(self, key):
+        model_path, device, backend = key
+        if backend != PYTORCH:
+            # Exported graphs run on CPU with their own runtime
+            return load_exported_model(model_path, backend)
+        # Imported on first load: ultralytics pulls in torch, which dominates process start-up
+        from ultralytics import YOLO
+
+        logger.info(f"Loading model {model_path} (device={device})")
+        model = YOLO(model_path)
+        if device is not None:
+            model.to(device)
+        return model
+
+    def _warmup(self, model, device=None):
+        dummy = np.zeros((self.warmup_size, self.warmup_size, 3), dtype=np.uint8)
+        kwargs = {'verbose': False}
+        if device is not None:
+            kwargs['device'] = device
+        model(dummy, **kwargs)
+
+    @staticmethod
+    def _weights_mtime(model_path):
+        try:
+            return os.path.getmtime(model_path)
+        except OSError:
+            # Hub names such as 'yolov8n.pt' are resolved by ultralytics itself
+            return None
+
+
+_registry = ModelRegistry(max_models=int(os.environ.get('AIPQS_MAX_MODELS', 2)))
+
+
+def get_registry():
+    return _registry
+
+
+def model_identity(model_path, backend=DEFAULT_BACKEND):
+    """
+    Stable identifier for a set of weights, used to key cached detections.
+
+    Combines the file name, size and mtime so retrained weights written to the
+    same path produce a different identity.
+    """
+    try:
+        stat = os.stat(model_path)
+        return f"{os.path.basename(model_path)}:{stat.st_size}:{stat.st_mtime_ns}:{resolve_backend(model_path, backend)}"
+    except OSError:
+        return f"{model_path}:{resolve_backend(model_path, backend)}"
+
+
+def get_model(model_path, device=None, backend=DEFAULT_BACKEND, warmup=False):
+    """Shortcut for looking up a model in the process-wide registry."""
+    return _registry.get(model_path, device=device, backend=backend, warmup=warmup)
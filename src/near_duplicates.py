@@ -0,0 +1,353 @@
+from src.artifact_store import get_artifact_store
+from src.metrics import record_cache
+from src.revisions import align, find_shift, splice_detections, thumbnail
+from src.tiling import tile_grid
+import numpy as np
+import cv2
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = os.environ.get('AIPQS_NEAR_DUPLICATE_INDEX', os.path.join('uploads', 'near_duplicates.sqlite'))
+# Largest perceptual-hash Hamming distance (out of 255 bits) worth verifying, e.g. 24; 0 disables
+# near-duplicate reuse
+MAX_DISTANCE = int(os.environ.get('AIPQS_NEAR_DUPLICATE_DISTANCE', 0))
+# Side of the DCT block the hash is taken from
+HASH_SIZE = 16
+# Verification thumbnails keep one pixel per THUMB_SCALE x THUMB_SCALE block, at most THUMB_MAX_SIDE wide
+THUMB_SCALE = 8
+THUMB_MAX_SIDE = 1024
+# Grey levels a thumbnail pixel may fall outside its reference neighbourhood before it counts as an edit
+VERIFY_THRESHOLD = 40
+
+
+def perceptual_hash(gray, hash_size=HASH_SIZE):
+    """
+    DCT-based perceptual hash of a grayscale image, as an int of hash_size**2 - 1 bits.
+
+    Low-frequency DCT coefficients of a 64x64 reduction are compared with
+    their median, so re-compression, re-export at another resolution and
+    scanner noise flip few bits while a different drawing flips about half.
+    """
+    small = cv2.resize(gray, (hash_size * 4, hash_size * 4), interpolation=cv2.INTER_AREA).astype(np.float32)
+    coefficients = cv2.dct(small)[:hash_size, :hash_size].flatten()[1:]  # drop the DC term
+    bits = coefficients > np.median(coefficients)
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over perceptual hashes for Hamming-radius queries.
+
+    Children are keyed by their distance to the parent, so by the triangle
+    inequality a query with radius r only descends into children whose key
+    lies within r of the query's distance to the node, which skips most of
+    the tree for small radii.
+    """
+
+    def __init__(self):
+        self._root = None
+        self.size = 0
+
+    def add(self, key, value):
+        self.size += 1
+        if self._root is None:
+            self._root = (key, [value], {})
+            return
+        node = self._root
+        while True:
+            distance = hamming(key, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (key, [value], {})
+                return
+            node = child
+
+    def search(self, key, max_distance):
+        """Return (distance, value) pairs within `max_distance` of `key`, nearest first."""
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(key, node[0])
+            if distance <= max_distance:
+                found.extend((distance, value) for value in node[1])
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        found.sort(key=lambda item: item[0])
+        return found
+
+
+def thumbnail_size(width, height):
+    scale = max(THUMB_SCALE, max(width, height) / THUMB_MAX_SIDE)
+    return max(1, round(width / scale)), max(1, round(height / scale))
+
+
+def verify(reference, gray, threshold=VERIFY_THRESHOLD):
+    """
+    Check that `gray` shows the same drawing as the `reference` thumbnail.
+
+    The new image is reduced to the reference's size and aligned to it with a
+    sub-pixel translation. It must then stay within `threshold` grey levels of
+    the reference's 3x3 neighbourhood everywhere, which absorbs compression,
+    noise and resampling but not an added or removed symbol.
+
+    Returns:
+        tuple or None: (dx, dy) in thumbnail pixels moving the reference onto
+            `gray`, or None if the drawings differ.
+    """
+    height, width = reference.shape
+    current = cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA)
+    shift = align(reference, current)
+    if shift is None:
+        return None
+    matrix = np.float32([[1, 0, -shift[0]], [0, 1, -shift[1]]])
+    aligned = cv2.warpAffine(current, matrix, (width, height), flags=cv2.INTER_LINEAR, borderValue=255)
+    kernel = np.ones((3, 3), np.uint8)
+    # Ignore the strip along the border that the shift moved in from outside the sheet
+    covered = cv2.warpAffine(np.full_like(current, 255), matrix, (width, height), flags=cv2.INTER_NEAREST)
+    covered = cv2.erode(covered, kernel) > 0
+    low = cv2.erode(reference, kernel).astype(np.int16) - threshold
+    high = cv2.dilate(reference, kernel).astype(np.int16) + threshold
+    aligned = aligned.astype(np.int16)
+    if np.any(((aligned < low) | (aligned > high)) & covered):
+        return None
+    return shift
+
+
+def map_detections(raw_detections, from_size, to_size, shift=(0, 0)):
+    """Scale detections of a `from_size` (width, height) image onto a `to_size` one, then move them by `shift`."""
+    scale_x, scale_y = to_size[0] / from_size[0], to_size[1] / from_size[1]
+    boxes = raw_detections.boxes * np.float32([scale_x, scale_y, scale_x, scale_y])
+    boxes += np.float32([shift[0], shift[1], shift[0], shift[1]])
+    boxes = np.clip(boxes, 0, np.float32([to_size[0], to_size[1], to_size[0], to_size[1]]))
+    return type(raw_detections)(raw_detections.class_ids, raw_detections.confidences, boxes, raw_detections.pages)
+
+
+def _reference_path(digest):
+    # The earlier upload itself, as kept by the artifact store; a write still queued doesn't count yet
+    path = get_artifact_store().lookup_digest(digest)
+    return path if path is not None and os.path.exists(path) else None
+
+
+def keep_reference(digest, data):
+    """Keep an indexed image in the artifact store, where later near-duplicates are checked against it."""
+    store = get_artifact_store()
+    if store.lookup_digest(digest) is None:
+        store.add_bytes(f"near_duplicates/{digest}", data, digest, kind='reference')
+
+
+class NearDuplicateIndex:
+    """
+    Perceptual-hash index over previously processed uploads.
+
+    Each upload's hash, size and a small verification thumbnail are kept in
+    SQLite next to the uploads folder; the hashes are also held in a BK-tree
+    for Hamming-radius lookups. Rows added by other worker processes are
+    picked up on the next lookup.
+    """
+
+    def __init__(self, db_path=DEFAULT_INDEX_PATH, max_distance=MAX_DISTANCE):
+        self.db_path = db_path
+        self.max_distance = max_distance
+        self._tree = BKTree()
+        self._digests = set()
+        self._last_rowid = 0
+        self._conn = None
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.reuses = 0
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS images (digest TEXT PRIMARY KEY, phash TEXT NOT NULL, "
+                "width INTEGER NOT NULL, height INTEGER NOT NULL, thumbnail BLOB NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS reuses (digest TEXT NOT NULL, matched_digest TEXT NOT NULL, "
+                "distance INTEGER NOT NULL, created REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS reuses_digest ON reuses (digest)")
+            self._conn.commit()
+        return self._conn
+
+    def _refresh(self):
+        rows = self._connection().execute(
+            "SELECT rowid, digest, phash FROM images WHERE rowid > ? ORDER BY rowid", (self._last_rowid,)
+        ).fetchall()
+        for rowid, digest, phash in rows:
+            if digest not in self._digests:
+                self._digests.add(digest)
+                self._tree.add(int(phash, 16), digest)
+            self._last_rowid = rowid
+
+    def add(self, digest, gray, width, height):
+        """Index an upload by its content digest; `gray` may be decoded at reduced resolution."""
+        phash = perceptual_hash(gray)
+        thumb = cv2.resize(gray, thumbnail_size(width, height), interpolation=cv2.INTER_AREA)
+        png = cv2.imencode('.png', thumb)[1].tobytes()
+        with self._lock:
+            if digest in self._digests:
+                return
+            conn = self._connection()
+            conn.execute("INSERT OR IGNORE INTO images (digest, phash, width, height, thumbnail) VALUES (?, ?, ?, ?, ?)",
+                         (digest, format(phash, 'x'), int(width), int(height), png))
+            conn.commit()
+            self._refresh()
+
+    def find(self, digest, gray, width, height, usable=None):
+        """
+        Find an earlier upload showing the same drawing.
+
+        Candidates within `max_distance` of the image's perceptual hash with
+        the same aspect ratio are verified against their thumbnails, nearest
+        first. `usable(digest)` can reject candidates, e.g. ones without
+        cached detections for the current model.
+
+        Returns:
+            dict or None: 'digest', 'distance', 'width', 'height', 'thumb_size' and 'shift'.
+        """
+        phash = perceptual_hash(gray)
+        with self._lock:
+            self.lookups += 1
+            self._refresh()
+            candidates = [(distance, candidate) for distance, candidate in self._tree.search(phash, self.max_distance)
+                          if candidate != digest]
+        for distance, candidate in candidates:
+            with self._lock:
+                row = self._connection().execute(
+                    "SELECT width, height, thumbnail FROM images WHERE digest = ?", (candidate,)
+                ).fetchone()
+            if row is None:
+                continue
+            match_width, match_height, png = row
+            if abs(match_width / match_height - width / height) > 0.01 * width / height:
+                continue
+            if usable is not None and not usable(candidate):
+                continue
+            reference = cv2.imdecode(np.frombuffer(png, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+            shift = verify(reference, gray)
+            if shift is not None:
+                return {'digest': candidate, 'distance': distance, 'width': match_width, 'height': match_height,
+                        'thumb_size': (reference.shape[1], reference.shape[0]), 'shift': shift}
+        return None
+
+    def record_reuse(self, digest, match):
+        with self._lock:
+            self.reuses += 1
+            conn = self._connection()
+            conn.execute("INSERT INTO reuses (digest, matched_digest, distance, created) VALUES (?, ?, ?, ?)",
+                         (digest, match['digest'], match['distance'], time.time()))
+            conn.commit()
+        logger.info(f"Reused detections of {match['digest'][:12]} for near-duplicate {digest[:12]} "
+                    f"(distance {match['distance']})")
+
+    def reuse_of(self, digest):
+        """The most recent reuse recorded for an upload, as {'matched_digest', 'distance'}, or None."""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT matched_digest, distance FROM reuses WHERE digest = ? ORDER BY created DESC LIMIT 1",
+                (digest,)
+            ).fetchone()
+        return {'matched_digest': row[0], 'distance': row[1]} if row else None
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            return {'indexed': self._tree.size, 'max_distance': self.max_distance, 'lookups': self.lookups,
+                    'reuses': self.reuses}
+
+
+def reuse_near_duplicate(index, cache, digest, img, factor, key_for, load_model, tile_size=None, tile_overlap=0.2,
+                         tile_batch_size=4, conf_threshold=0.0):
+    """
+    Detections of an image derived from a verified near-duplicate, or None.
+
+    The index only proposes a candidate: its thumbnail check cannot see a
+    symbol-sized edit on a large sheet. The candidate's original upload is
+    then diffed against `img` at the resolution `img` was decoded at, as for
+    a revision (see src.revisions.splice_detections). Tiled, the tiles that
+    differ are re-run through the model and the rest keep the earlier
+    detections; untiled, any difference means the model runs on the whole
+    image as usual.
+
+    Args:
+        index (NearDuplicateIndex): Index of earlier uploads.
+        cache (DetectionCache): Holds the earlier uploads' raw detections.
+        digest (str): Content hash of this image.
+        img (np.ndarray): This image, decoded at 1 / `factor` of its full resolution.
+        key_for (callable): Raw-detection cache key of a digest under the current settings.
+        load_model (callable): Returns the model, for re-running changed tiles.
+        tile_size, tile_overlap, tile_batch_size: Tiling of the current settings; None runs untiled.
+        conf_threshold (float): Floor confidence the model is run at.
+
+    Returns:
+        tuple: (sorted full-resolution Detections or None, grayscale image for `index.add`)
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    height, width = gray.shape[0] * factor, gray.shape[1] * factor
+    match = index.find(digest, gray, width, height,
+                       usable=lambda candidate: (cache.get(key_for(candidate)) is not None
+                                                 and _reference_path(candidate) is not None))
+    detections = None
+    if match is not None:
+        reference = cv2.imread(_reference_path(match['digest']) or '', cv2.IMREAD_GRAYSCALE)
+        previous = cache.get(key_for(match['digest']))
+        if reference is not None and previous is not None:
+            if reference.shape != gray.shape:
+                reference = cv2.resize(reference, (gray.shape[1], gray.shape[0]), interpolation=cv2.INTER_AREA)
+            # Earlier detections in this image's decoded frame, to diff against
+            previous = map_detections(previous, (match['width'], match['height']), (gray.shape[1], gray.shape[0]))
+            thumb = thumbnail(gray)
+            if tile_size:
+                windows = tile_grid(gray.shape[1], gray.shape[0], tile_size, tile_overlap)
+                spliced = splice_detections(img, gray, thumb, thumbnail(reference), previous, windows, load_model,
+                                            tile_batch_size, conf_threshold)
+                if spliced is not None:
+                    detections, _, changed_windows = spliced
+                    logger.info(f"Near-duplicate {digest[:12]}: {len(changed_windows)}/{len(windows)} tiles re-run")
+            else:
+                found = find_shift(thumbnail(reference), gray, thumb)
+                if found is not None and not found[1].any():
+                    detections = previous.shift(*found[0])
+    record_cache('near_duplicate', detections is not None)
+    if detections is None:
+        return None, gray
+    index.record_reuse(digest, match)
+    detections = detections.filter(conf_threshold=conf_threshold)
+    if factor != 1:
+        detections = detections.scale(factor)
+    return detections.sort_by_confidence(), gray
+
+
+_default_index = None
+_default_lock = threading.Lock()
+
+
+def get_near_duplicate_index():
+    """Return the process-wide near-duplicate index, or None if disabled (AIPQS_NEAR_DUPLICATE_DISTANCE=0)."""
+    global _default_index
+    if MAX_DISTANCE <= 0:
+        return None
+    with _default_lock:
+        if _default_index is None:
+            _default_index = NearDuplicateIndex()
+        return _default_index
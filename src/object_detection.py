@@ -1,4 +1,13 @@
-from ultralytics import YOLO
+from src.backends import BACKENDS
+from src.detection_cache import RAW_FLOOR_CONF, get_detection_cache, file_digest, make_key, make_raw_key
+from src.detections import Detections
+from src.metrics import record_cache, stage
+from src.inference import predict_detections, refilter
+from src.model_registry import get_model, model_identity
+from src.near_duplicates import get_near_duplicate_index, keep_reference, reuse_near_duplicate
+from src.pdf_ingest import is_pdf, iter_pdf_detections, DEFAULT_DPI
+from src.batch_pipeline import PrefetchingDecoder, unletterbox_boxes
+from src.tiling import tiled_predict, draw_boxes
 import cv2
 import os
 import logging
@@ -6,100 +15,347 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.pdf']
+
+def _resolve_image_paths(image_paths):
+    if isinstance(image_paths, str):
+        if os.path.isdir(image_paths):
+            return sorted(os.path.join(image_paths, f)
+                          for f in os.listdir(image_paths) if os.path.splitext(f)[1].lower() in IMAGE_EXTENSIONS)
+        return [image_paths]
+    if not isinstance(image_paths, list):
+        raise ValueError("image_paths must be a string or list of strings")
+    return image_paths
+
+# Class names per model identity, so cached detections can be labelled without loading the model
+_class_names = {}
+
+def _names_key(model_id):
+    return make_key('class_names', model_id, 0)
+
+def _cached_names(cache, model_id):
+    names = _class_names.get(model_id)
+    if names is None and cache is not None:
+        stored = cache.get(_names_key(model_id))
+        if stored is not None:
+            names = _class_names[model_id] = {class_id: name for class_id, name in stored}
+    return names
+
+def _remember_names(cache, model_id, names):
+    names = {int(class_id): name for class_id, name in dict(names).items()}
+    if _class_names.get(model_id) != names:
+        _class_names[model_id] = names
+        if cache is not None:
+            cache.put(_names_key(model_id), sorted(names.items()))
+    return names
+
 def detect_objects(image_paths, model_path='models/yolov8n_trained.pt', conf_threshold=0.25,
-                    class_filter=None, save_annotated=False, output_dir='output'):
+                    class_filter=None, save_annotated=False, output_dir='output', device=None, use_cache=True,
+                    tile_size=None, tile_overlap=0.2, tile_batch_size=4, pdf_dpi=DEFAULT_DPI, pdf_workers=2,
+                    backend=None):
     """
     Detect objects in one or multiple images using YOLO model.
 
     Args:
         image_paths (str or list): Path to image or list of image paths or directory containing images.
+            PDF drawing sets are rasterized page by page.
         model_path (str): Path to trained YOLO model.
         conf_threshold (float): Confidence threshold to filter detections.
         class_filter (list or None): List of class ids to keep. If None, keep all.
         save_annotated (bool): Whether to save annotated images with bounding boxes.
         output_dir (str): Directory to save annotated images if save_annotated is True.
+        device (str or None): Device to run the model on, e.g. 'cpu' or 'cuda:0'.
+        use_cache (bool): Reuse detections cached for identical image bytes. The cache holds the
+            raw, confidence-sorted detections, so other thresholds and class filters are answered
+            without rerunning the model. Ignored for images that need an annotated copy, since that
+            requires a forward pass.
+        tile_size (int or None): If set, run tiled inference with square tiles of this size,
+            which keeps small symbols on large sheets at full resolution.
+        tile_overlap (float): Fractional overlap between adjacent tiles.
+        tile_batch_size (int): Number of tiles per forward pass in tiled mode.
+        pdf_dpi (int): Rasterization resolution for PDF pages.
+        pdf_workers (int): Worker processes rasterizing PDF pages ahead of the model.
+        backend (str or None): 'pytorch', 'onnx' or 'openvino'; None infers it from model_path.
 
     Returns:
-        dict: Mapping image_path -> list of detections (dict with class_id, class_name, confidence, bbox)
+        dict: Mapping image_path -> list of detections (dict with class_id, class_name, confidence, bbox,
+            plus the 0-based page for PDFs)
     """
-    # Load the trained YOLO model
-    model = YOLO(model_path)
-
     # Prepare list of image paths
-    if isinstance(image_paths, str):
-        if os.path.isdir(image_paths):
-            exts = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
-            image_paths = [os.path.join(image_paths, f) 
-                           for f in os.listdir(image_paths) if os.path.splitext(f)[1].lower() in exts]
-        else:
-            image_paths = [image_paths]
-    elif not isinstance(image_paths, list):
-        raise ValueError("image_paths must be a string or list of strings")
+    image_paths = _resolve_image_paths(image_paths)
 
     if save_annotated and not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
+    cache = get_detection_cache() if use_cache and not save_annotated else None
+    model_id = model_identity(model_path, backend)
+    model = None
+    names = _cached_names(cache, model_id)
+    # Raw detections are cached per image and model, independent of the threshold and class filter
+    floor = min(conf_threshold, RAW_FLOOR_CONF)
+    params = {'tile_size': tile_size, 'tile_overlap': tile_overlap} if tile_size else {}
+    pdf_params = dict(params, pdf_dpi=pdf_dpi)
+
     results_dict = {}
 
+    index = get_near_duplicate_index() if cache is not None else None
+
     for img_path in image_paths:
-        img = cv2.imread(img_path)
+        key = None
+        if cache is not None and os.path.isfile(img_path):
+            digest = file_digest(img_path)
+            key, floor = make_raw_key(digest, model_id, conf_threshold,
+                                      **(pdf_params if is_pdf(img_path) else params))
+            with stage('cache_lookup'):
+                cached = cache.get(key)
+            record_cache('detection', cached is not None)
+            if cached is not None:
+                if names is None:
+                    with stage('model_load'):
+                        model = get_model(model_path, device=device, backend=backend)
+                    names = _remember_names(cache, model_id, model.names)
+                results_dict[img_path] = refilter(cached, conf_threshold, class_filter, names)
+                continue
+
+        if model is None:
+            # Fetch the trained YOLO model from the process-wide registry (loaded once)
+            with stage('model_load'):
+                model = get_model(model_path, device=device, backend=backend)
+            names = _remember_names(cache, model_id, model.names)
+
+        if is_pdf(img_path):
+            # Pages are rasterized in worker processes while the model runs on earlier ones;
+            # annotated copies are only written for raster images
+            def detect(page_img):
+                return predict_detections(model, page_img, floor, tile_size=tile_size, tile_overlap=tile_overlap,
+                                          tile_batch_size=tile_batch_size)
+
+            pages = iter_pdf_detections(img_path, detect, dpi=pdf_dpi, workers=pdf_workers)
+            raw = Detections.concat([page_detections.with_page(page) for page, page_detections in pages])
+            raw = raw.sort_by_confidence()
+            results_dict[img_path] = refilter(raw, conf_threshold, class_filter, names)
+            if key is not None:
+                cache.put(key, raw)
+            continue
+
+        with stage('decode'):
+            img = cv2.imread(img_path)
         if img is None:
             logger.warning(f"Image not found or cannot be read: {img_path}")
             continue
 
-        results = model(img)
-
-        detections = []
-        for result in results:
-            for box in result.boxes:
-                cls = int(box.cls[0])
-                conf = float(box.conf[0])
-                if conf < conf_threshold:
-                    continue
-                if class_filter is not None and cls not in class_filter:
-                    continue
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                class_name = model.names.get(cls, f"class_{cls}")
-                detections.append({
-                    'class_id': cls,
-                    'class_name': class_name,
-                    'confidence': conf,
-                    'bbox': (x1, y1, x2, y2)
-                })
+        if key is not None and index is not None:
+            # A re-export or re-scan of a sheet processed earlier reuses its detections where they still match
+            with stage('near_duplicate'):
+                raw, gray = reuse_near_duplicate(index, cache, digest, img, 1,
+                                                 lambda candidate: make_raw_key(candidate, model_id, conf_threshold,
+                                                                                **params)[0],
+                                                 lambda: model, tile_size=tile_size, tile_overlap=tile_overlap,
+                                                 tile_batch_size=tile_batch_size, conf_threshold=floor)
+            if raw is not None:
+                cache.put(key, raw)
+                results_dict[img_path] = refilter(raw, conf_threshold, class_filter, names)
+                continue
 
+        with stage('forward'):
+            if tile_size:
+                raw = tiled_predict(model, img, tile_size=tile_size, overlap=tile_overlap,
+                                    batch_size=tile_batch_size, conf_threshold=floor)
+            else:
+                raw = Detections.from_results(model(img, verbose=False, conf=floor))
+        with stage('postprocess'):
+            raw = raw.filter(conf_threshold=floor).sort_by_confidence()
+            columns = raw.above(conf_threshold).filter(class_filter=class_filter)
+            detections = columns.to_list(names)
         results_dict[img_path] = detections
+        if key is not None:
+            cache.put(key, raw)
+            if index is not None:
+                index.add(digest, gray, img.shape[1], img.shape[0])
+                with open(img_path, 'rb') as f:
+                    keep_reference(digest, f.read())
 
         if save_annotated:
-            annotated_img = results[0].plot()
-            save_path = os.path.join(output_dir, os.path.basename(img_path))
-            cv2.imwrite(save_path, annotated_img)
+            # Drawn from the thresholded columns; the model's own plot would include the raw floor detections
+            with stage('annotate'):
+                annotated_img = draw_boxes(img, columns, names)
+                save_path = os.path.join(output_dir, os.path.basename(img_path))
+                cv2.imwrite(save_path, annotated_img)
             logger.info(f"Saved annotated image to {save_path}")
 
     return results_dict
 
+def iter_detections(image_paths, model_path='models/yolov8n_trained.pt', conf_threshold=0.25,
+                    class_filter=None, batch_size=8, decode_workers=4, prefetch=32, imgsz=640,
+                    save_annotated=False, output_dir='output', device=None, use_cache=True,
+                    tile_size=None, tile_overlap=0.2, tile_batch_size=4, pdf_dpi=DEFAULT_DPI, pdf_workers=2,
+                    backend=None):
+    """
+    Stream detections for many images with pipelined decoding and batched inference.
+
+    A thread pool decodes and letterboxes up to `prefetch` images ahead of the
+    model, which is fed batches of `batch_size`. Results are yielded in input
+    order as soon as their batch finishes, so bulk runs over thousands of
+    sheets never accumulate a full results dict. PDFs and tiled images are
+    handled one at a time through `detect_objects`.
+
+    Args:
+        image_paths (str or list): Image path, list of paths or directory.
+        batch_size (int): Images per forward pass.
+        decode_workers (int): Threads decoding images ahead of the model.
+        prefetch (int): Maximum number of images decoded but not yet consumed.
+        imgsz (int): Model input size images are letterboxed to.
+        Remaining arguments are as for `detect_objects`.
+
+    Yields:
+        tuple: (image_path, list of detections)
+    """
+    image_paths = _resolve_image_paths(image_paths)
+    if save_annotated and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    cache = get_detection_cache() if use_cache and not save_annotated else None
+    model_id = model_identity(model_path, backend)
+    names = _cached_names(cache, model_id)
+    floor = min(conf_threshold, RAW_FLOOR_CONF)
+    # Letterboxing at `imgsz` here is a different preprocessing from the whole-image and tiled paths,
+    # so its raw detections are cached under their own keys
+    batch_params = {'pipeline': 'letterbox', 'imgsz': imgsz}
+    single_kwargs = dict(model_path=model_path, conf_threshold=conf_threshold, class_filter=class_filter,
+                         save_annotated=save_annotated, output_dir=output_dir, device=device,
+                         use_cache=use_cache, tile_size=tile_size, tile_overlap=tile_overlap,
+                         tile_batch_size=tile_batch_size, pdf_dpi=pdf_dpi, pdf_workers=pdf_workers,
+                         backend=backend)
+
+    def work_items():
+        for img_path in image_paths:
+            key = cached = None
+            # Letterboxed batches only apply to whole raster images; the rest go through detect_objects
+            batched = not tile_size and not is_pdf(img_path)
+            if batched and cache is not None and os.path.isfile(img_path):
+                with stage('cache_lookup'):
+                    key, _ = make_raw_key(file_digest(img_path), model_id, conf_threshold, **batch_params)
+                    cached = cache.get(key)
+                record_cache('detection', cached is not None)
+            yield img_path, key, cached, batched
+
+    model = None
+    needs_decode = lambda item: item[3] and item[2] is None
+    with PrefetchingDecoder(work_items(), size=imgsz, workers=decode_workers, prefetch=prefetch,
+                            keep_original=save_annotated, needs_decode=needs_decode) as decoder:
+        while True:
+            # Time the model waits on the decode threads
+            with stage('decode_wait'):
+                batch = decoder.next_batch(batch_size)
+            if not batch:
+                break
+            (img_path, key, cached, batched), _ = batch[0]
+            if not needs_decode(batch[0][0]):
+                # Cached, or a PDF or tiled sheet; images that failed to decode are handled with their batch below
+                if cached is not None:
+                    if names is None:
+                        with stage('model_load'):
+                            model = get_model(model_path, device=device, backend=backend)
+                        names = _remember_names(cache, model_id, model.names)
+                    yield img_path, refilter(cached, conf_threshold, class_filter, names)
+                else:
+                    yield img_path, detect_objects(img_path, **single_kwargs).get(img_path, [])
+                continue
+
+            readable = [(item, image) for item, image in batch if image is not None]
+            for item, image in batch:
+                if image is None:
+                    logger.warning(f"Image not found or cannot be read: {item[0]}")
+            if not readable:
+                continue
+            if model is None:
+                # Fetch the trained YOLO model from the process-wide registry (loaded once)
+                with stage('model_load'):
+                    model = get_model(model_path, device=device, backend=backend)
+                names = _remember_names(cache, model_id, model.names)
+            with stage('forward'):
+                results = model([image.canvas for _, image in readable], verbose=False, conf=floor)
+            for ((img_path, key, _, _), image), result in zip(readable, results):
+                with stage('postprocess'):
+                    raw = Detections.from_result(result).filter(conf_threshold=floor).sort_by_confidence()
+                    raw.boxes = unletterbox_boxes(raw.boxes, image.scale, image.pad, image.original_shape)
+                    columns = raw.above(conf_threshold).filter(class_filter=class_filter)
+                    detections = columns.to_list(names)
+                if key is not None:
+                    cache.put(key, raw)
+                if save_annotated:
+                    save_path = os.path.join(output_dir, os.path.basename(img_path))
+                    cv2.imwrite(save_path, draw_boxes(image.original, columns, names))
+                    logger.info(f"Saved annotated image to {save_path}")
+                yield img_path, detections
+
 if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser(description="Run object detection on images or directory")
-    parser.add_argument('input_path', type=str, help='Path to image file or directory of images')
+    parser.add_argument('input_path', type=str, help='Path to image/PDF file or directory of images')
     parser.add_argument('--model_path', type=str, default='models/yolov8n_trained.pt', help='Path to trained YOLO model')
     parser.add_argument('--conf_threshold', type=float, default=0.25, help='Confidence threshold for detections')
     parser.add_argument('--class_filter', type=int, nargs='*', default=None, help='List of class IDs to filter')
     parser.add_argument('--save_annotated', action='store_true', help='Save annotated images with bounding boxes')
     parser.add_argument('--output_dir', type=str, default='output', help='Directory to save annotated images')
+    parser.add_argument('--device', type=str, default=None, help="Device to run on, e.g. 'cpu' or 'cuda:0'")
+    parser.add_argument('--backend', type=str, default=None, choices=BACKENDS,
+                        help='Execution backend (default: inferred from the model file)')
+    parser.add_argument('--num_threads', type=int, default=None, help='CPU threads for ONNX/OpenVINO backends')
+    parser.add_argument('--no_cache', action='store_true', help='Bypass the detection cache')
+    parser.add_argument('--tile_size', type=int, default=None, help='Run tiled inference with this tile size in pixels')
+    parser.add_argument('--tile_overlap', type=float, default=0.2, help='Fractional overlap between tiles')
+    parser.add_argument('--tile_batch_size', type=int, default=4, help='Number of tiles per forward pass')
+    parser.add_argument('--pdf_dpi', type=int, default=DEFAULT_DPI, help='Rasterization DPI for PDF blueprints')
+    parser.add_argument('--pdf_workers', type=int, default=2, help='Worker processes rasterizing PDF pages')
+    parser.add_argument('--batch_size', type=int, default=None,
+                        help='Stream results using prefetching, batched inference with this batch size')
+    parser.add_argument('--decode_workers', type=int, default=4, help='Threads decoding images in batch mode')
 
     args = parser.parse_args()
+    if args.num_threads:
+        os.environ['AIPQS_NUM_THREADS'] = str(args.num_threads)
 
-    detections = detect_objects(
-        args.input_path,
-        model_path=args.model_path,
-        conf_threshold=args.conf_threshold,
-        class_filter=args.class_filter,
-        save_annotated=args.save_annotated,
-        output_dir=args.output_dir
-    )
+    if args.batch_size:
+        # Stream results as batches complete instead of collecting them all first
+        detections = iter_detections(
+            args.input_path,
+            model_path=args.model_path,
+            conf_threshold=args.conf_threshold,
+            class_filter=args.class_filter,
+            batch_size=args.batch_size,
+            decode_workers=args.decode_workers,
+            save_annotated=args.save_annotated,
+            output_dir=args.output_dir,
+            device=args.device,
+            use_cache=not args.no_cache,
+            tile_size=args.tile_size,
+            tile_overlap=args.tile_overlap,
+            tile_batch_size=args.tile_batch_size,
+            pdf_dpi=args.pdf_dpi,
+            pdf_workers=args.pdf_workers,
+            backend=args.backend
+        )
+    else:
+        detections = detect_objects(
+            args.input_path,
+            model_path=args.model_path,
+            conf_threshold=args.conf_threshold,
+            class_filter=args.class_filter,
+            save_annotated=args.save_annotated,
+            output_dir=args.output_dir,
+            device=args.device,
+            use_cache=not args.no_cache,
+            tile_size=args.tile_size,
+            tile_overlap=args.tile_overlap,
+            tile_batch_size=args.tile_batch_size,
+            pdf_dpi=args.pdf_dpi,
+            pdf_workers=args.pdf_workers,
+            backend=args.backend
+        ).items()
 
-    for img_path, dets in detections.items():
+    for img_path, dets in detections:
         print(f"Detections for {img_path}:")
         for det in dets:
             print(det)
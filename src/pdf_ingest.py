@@ -0,0 +1,148 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from src.artifact_store import get_artifact_store
+from src.metrics import stage
+import numpy as np
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DPI = 200
+# Smallest size of the rasterization pool shared by every PDF; callers asking for more workers grow it
+POOL_WORKERS = int(os.environ.get('AIPQS_PDF_WORKERS', 2))
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def is_pdf(path):
+    return os.path.splitext(path)[1].lower() == '.pdf'
+
+
+def _open(pdf_path):
+    try:
+        import pymupdf
+    except ImportError as e:
+        raise ImportError("PDF blueprints require PyMuPDF: pip install pymupdf") from e
+    if isinstance(pdf_path, (bytes, bytearray)):
+        # In-memory upload
+        return pymupdf.open(stream=pdf_path, filetype='pdf')
+    return pymupdf.open(pdf_path)
+
+
+def page_count(pdf_path):
+    with _open(pdf_path) as doc:
+        return doc.page_count
+
+
+def rasterize_page(pdf_path, page_number, dpi=DEFAULT_DPI):
+    """
+    Render a single PDF page to a BGR image array.
+
+    Opens the document itself so it can run in a worker process; MuPDF
+    documents cannot be shared between threads or processes.
+    """
+    with _open(pdf_path) as doc:
+        pix = doc.load_page(page_number).get_pixmap(dpi=dpi, alpha=False)
+        img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    if pix.n == 1:
+        return np.repeat(img, 3, axis=2)
+    # MuPDF renders RGB; the models expect OpenCV's BGR order
+    return np.ascontiguousarray(img[:, :, 2::-1])
+
+
+def get_rasterize_pool(workers=POOL_WORKERS):
+    """Return the process-wide rasterization pool, started on first use with at least `workers` processes."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers < workers:
+            if _pool is not None:
+                # Pages already queued on the smaller pool still finish
+                _pool.shutdown(wait=False)
+            _pool_workers = max(workers, POOL_WORKERS)
+            _pool = ProcessPoolExecutor(max_workers=_pool_workers)
+        return _pool
+
+
+def iter_pdf_pages(pdf_path, dpi=DEFAULT_DPI, workers=2, prefetch=None):
+    """
+    Lazily rasterize the pages of a PDF in page order.
+
+    Pages are rendered in the shared process pool (see `get_rasterize_pool`),
+    at most `prefetch` pages ahead of the consumer, so only a handful of
+    rasters are ever alive regardless of how many pages the drawing set has.
+    Tasks carry a path and a page number; PDF contents are written once to a
+    temporary file in the artifact store rather than sent with every page.
+
+    Args:
+        pdf_path (str or bytes): Path to the PDF, or its contents.
+        dpi (int): Rasterization resolution.
+        workers (int): Worker processes the pool needs. 0 renders inline in the calling process.
+        prefetch (int or None): Pages rendered ahead of consumption, defaults to `workers`.
+
+    Yields:
+        tuple: (page_number, BGR image array)
+    """
+    count = page_count(pdf_path)
+    if workers <= 0 or count == 1:
+        for page in range(count):
+            yield page, rasterize_page(pdf_path, page, dpi)
+        return
+
+    prefetch = max(1, prefetch if prefetch is not None else workers)
+    source, spilled = pdf_path, None
+    if isinstance(pdf_path, (bytes, bytearray)):
+        source = spilled = get_artifact_store().temp_path('.pdf')
+        with open(spilled, 'wb') as f:
+            f.write(pdf_path)
+    pending = deque()
+    try:
+        next_page = 0
+        while next_page < count or pending:
+            while next_page < count and len(pending) < prefetch + 1:
+                pool = get_rasterize_pool(workers)
+                pending.append((next_page, pool.submit(rasterize_page, source, next_page, dpi)))
+                next_page += 1
+            page, future = pending.popleft()
+            yield page, future.result()
+    finally:
+        # A consumer that stops early leaves pages queued; they are dropped rather than rendered
+        for _, future in pending:
+            future.cancel()
+        if spilled is not None:
+            try:
+                os.remove(spilled)
+            except OSError:
+                logger.warning(f"Could not remove temporary PDF {spilled}")
+
+
+def iter_pdf_detections(pdf_path, detect, dpi=DEFAULT_DPI, workers=2, prefetch=None):
+    """
+    Stream detections page by page, overlapping rasterization with inference.
+
+    Args:
+        pdf_path (str or bytes): Path to the PDF, or its contents.
+        detect (callable): Function mapping a BGR image to its detections.
+        dpi (int): Rasterization resolution.
+        workers (int): Rasterization worker processes.
+        prefetch (int or None): Pages rendered ahead of the model.
+
+    Yields:
+        tuple: (page_number, detections returned by `detect`)
+    """
+    pages = iter_pdf_pages(pdf_path, dpi=dpi, workers=workers, prefetch=prefetch)
+    while True:
+        # Time spent waiting on the rasterizer, i.e. not hidden behind inference
+        with stage('rasterize'):
+            page, img = next(pages, (None, None))
+        if img is None:
+            break
+        detections = detect(img)
+        name = os.path.basename(pdf_path) if isinstance(pdf_path, str) else 'uploaded PDF'
+        logger.info(f"{name} page {page + 1}: {len(detections)} detections")
+        # Drop the raster before the next page is pulled from the pool
+        del img
+        yield page, detections
@@ -0,0 +1,99 @@
+from collections import Counter, OrderedDict
+import os
+import sys
+import threading
+import time
+import uuid
+
+# Header-triggered profiling is opt-in per deployment
+PROFILING_ENABLED = os.environ.get('AIPQS_PROFILING', '0') == '1'
+PROFILE_HEADER = 'X-AIPQS-Profile'
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread at a fixed interval.
+
+    A background thread reads the target thread's frame from
+    `sys._current_frames()` every `interval` seconds, so the profiled code
+    runs unmodified and overhead is bounded by the sampling rate. Results are
+    collapsed stacks ('frame;frame;frame count'), the input format of common
+    flame graph tools.
+    """
+
+    def __init__(self, thread_id=None, interval=0.005, max_depth=64):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self.started_at = None
+        self.duration = 0.0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return '\n'.join(f"{stack} {count}" for stack, count in self.samples.most_common()) + '\n'
+
+    def summary(self, top=20):
+        """Innermost frames by share of samples."""
+        leaf = Counter()
+        for stack, count in self.samples.items():
+            leaf[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaf.values()) or 1
+        lines = [f"{self.duration * 1000:.1f} ms, {total} samples every {self.interval * 1000:.1f} ms"]
+        lines += [f"{count / total:6.1%}  {frame}" for frame, count in leaf.most_common(top)]
+        return '\n'.join(lines) + '\n'
+
+
+class ProfileStore:
+    """Keeps the most recent request profiles in memory for retrieval by id."""
+
+    def __init__(self, max_profiles=32):
+        self.max_profiles = max_profiles
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, profiler):
+        profile_id = uuid.uuid4().hex
+        with self._lock:
+            self._profiles[profile_id] = profiler
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+        return profile_id
+
+    def get(self, profile_id):
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+
+profile_store = ProfileStore()
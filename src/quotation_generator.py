@@ -1,9 +1,18 @@
+from src.counter_store import get_counter_store
+from src.detections import Detections
+from src.metrics import stage
+from src.spatial_index import assign_regions, suppress_overlaps
+import numpy as np
 import hashlib
 import json
 import os
 
+# Same-class boxes overlapping more than this (intersection over the smaller box) are counted once; 0 disables
+DUPLICATE_OVERLAP = float(os.environ.get('AIPQS_DUPLICATE_OVERLAP', 0))
+
 class QuotationGenerator:
-    def __init__(self, pricing_rules=None, counts_file='quotation_counts.json'):
+    def __init__(self, pricing_rules=None, counts_file='quotation_counts.json', counter_store=None,
+                 duplicate_overlap=DUPLICATE_OVERLAP):
         # Pricing rules: dict mapping class_id to price per unit
         if pricing_rules is None:
             self.pricing_rules = {
@@ -15,19 +24,40 @@ class QuotationGenerator:
             self.pricing_rules = pricing_rules
 
         self.counts_file = counts_file
-        # Load or initialize quotation counts
-        if os.path.exists(self.counts_file):
-            with open(self.counts_file, 'r') as f:
-                self.quotation_counts = json.load(f)
-        else:
-            self.quotation_counts = {}
+        # Quotation counts live in a shared store opened on first use; an existing
+        # counts_file in the old JSON format is imported into it once
+        self._counter_store = counter_store
+        self.duplicate_overlap = duplicate_overlap
+
+    @property
+    def counter_store(self):
+        if self._counter_store is None:
+            self._counter_store = get_counter_store(self.counts_file)
+        return self._counter_store
 
-    def generate_quotation(self, detections):
+    def deduplicate(self, detections):
+        """
+        Drop boxes that duplicate a more confident box of the same class, if `duplicate_overlap` is set.
+
+        The suppression is greedy in confidence order, so de-duplicating a
+        raw confidence-sorted set and then cutting it at a threshold gives
+        the same boxes as cutting first.
+        """
+        detections = Detections.from_list(detections)
+        if not self.duplicate_overlap:
+            return detections
+        with stage('deduplicate'):
+            return detections[suppress_overlaps(detections, self.duplicate_overlap, metric='ios')]
+
+    def generate_quotation(self, detections, regions=None):
         """
         Generate a bill of materials and total cost based on detections.
 
         Args:
-            detections (list of dict): Each dict contains 'class_id', 'confidence', 'bbox'
+            detections (Detections or list of dict): Each dict contains 'class_id', 'confidence',
+                'bbox' and, for multi-page PDF blueprints, the 0-based 'page' it was found on
+            regions (list of dict or None): Rooms or zones to break the quotation down by, each with
+                a 'name' and a 'polygon' or 'rect' in image pixels (see src.spatial_index.assign_regions)
 
         Returns:
             dict: {
@@ -35,35 +65,78 @@ class QuotationGenerator:
                 'total_cost': float,
                 'unit_prices': dict,
                 'quotation_hash': str,
-                'download_count': int
+                'download_count': int,
+                'page_items': {page: {class_id: quantity}},  # only for paged input
+                'region_items': [{'name': str, 'items': {class_id: quantity}, 'total_cost': float}]
+                    # only with regions; detections outside every region are listed last as 'Unassigned'
             }
         """
-        items = {}
-        for det in detections:
-            class_id = det['class_id']
-            items[class_id] = items.get(class_id, 0) + 1
+        detections = self.deduplicate(detections)
+        with stage('quotation'):
+            quotation = self._price(detections, regions)
 
-        total_cost = 0.0
-        for class_id, quantity in items.items():
-            price_per_unit = self.pricing_rules.get(class_id, 0.0)
-            total_cost += price_per_unit * quantity
+        # Update download count (atomic across threads and worker processes)
+        with stage('counter_io'):
+            quotation['download_count'] = self.counter_store.increment(quotation['quotation_hash'])
+        return quotation
 
-        # Generate a unique hash for the quotation based on items and total_cost
-        hash_input = json.dumps({'items': items, 'total_cost': total_cost}, sort_keys=True).encode('utf-8')
-        quotation_hash = hashlib.sha256(hash_input).hexdigest()
+    def _price(self, detections, regions=None):
+        # Count per class with a single bincount instead of a per-detection loop
+        counts = detections.counts()
+        items = {int(class_id): int(counts[class_id]) for class_id in np.flatnonzero(counts)}
+
+        page_items = {}
+        if detections.pages is not None and len(detections):
+            num_classes = len(counts)
+            page_counts = np.bincount(detections.pages * num_classes + detections.class_ids)
+            page_counts = np.pad(page_counts, (0, -len(page_counts) % num_classes)).reshape(-1, num_classes)
+            for page in np.flatnonzero(page_counts.any(axis=1)):
+                row = page_counts[page]
+                page_items[int(page)] = {int(class_id): int(row[class_id]) for class_id in np.flatnonzero(row)}
 
-        # Update download count
-        count = self.quotation_counts.get(quotation_hash, 0) + 1
-        self.quotation_counts[quotation_hash] = count
+        total_cost = self._cost(items)
 
-        # Save updated counts
-        with open(self.counts_file, 'w') as f:
-            json.dump(self.quotation_counts, f, indent=2)
+        # Generate a unique hash for the quotation based on items and total_cost
+        hashed = {'items': items, 'total_cost': total_cost}
+        region_items = None
+        if regions:
+            region_items = self._region_items(detections, regions, len(counts))
+            # The breakdown is printed on the report, so it is part of the quotation's identity
+            hashed['region_items'] = region_items
+        hash_input = json.dumps(hashed, sort_keys=True).encode('utf-8')
+        quotation_hash = hashlib.sha256(hash_input).hexdigest()
 
-        return {
+        quotation = {
             'items': items,
             'total_cost': total_cost,
             'unit_prices': self.pricing_rules,
             'quotation_hash': quotation_hash,
-            'download_count': count
+            'download_count': None
         }
+        if page_items:
+            quotation['page_items'] = page_items
+        if region_items is not None:
+            quotation['region_items'] = region_items
+        return quotation
+
+    def _cost(self, items):
+        total_cost = 0.0
+        for class_id, quantity in items.items():
+            price_per_unit = self.pricing_rules.get(class_id, 0.0)
+            total_cost += price_per_unit * quantity
+        return total_cost
+
+    def _region_items(self, detections, regions, num_classes):
+        # Region -1 (outside every region) is shifted to the last row of the count table
+        assigned = assign_regions(detections, regions)
+        assigned[assigned < 0] = len(regions)
+        num_classes = max(num_classes, 1)
+        region_counts = np.bincount(assigned * num_classes + detections.class_ids,
+                                    minlength=(len(regions) + 1) * num_classes).reshape(-1, num_classes)
+        names = [region.get('name', f"Region {i + 1}") for i, region in enumerate(regions)] + ['Unassigned']
+        region_items = []
+        for region_id in np.flatnonzero(region_counts.any(axis=1)):
+            row = region_counts[region_id]
+            items = {int(class_id): int(row[class_id]) for class_id in np.flatnonzero(row)}
+            region_items.append({'name': names[region_id], 'items': items, 'total_cost': self._cost(items)})
+        return region_items
@@ -0,0 +1,196 @@
+from src.artifact_store import ArtifactStore, get_artifact_store
+from src.metrics import record_cache
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def report_key(quotation_hash, tax_rate=0.1, discount_rate=0.0, company_info=None, client_info=None,
+               class_names=None, terms_and_conditions=None):
+    """
+    Content address of a rendered report.
+
+    Two reports with the same key are byte-for-byte interchangeable: the key
+    covers the quotation, everything else printed on the page and the
+    report template version.
+    """
+    from src.report_generator import TEMPLATE_VERSION
+
+    payload = json.dumps({
+        'quotation_hash': quotation_hash,
+        'tax_rate': round(float(tax_rate), 6),
+        'discount_rate': round(float(discount_rate), 6),
+        'company_info': company_info,
+        'client_info': client_info,
+        'class_names': {str(k): v for k, v in (class_names or {}).items()},
+        'terms': terms_and_conditions,
+        'template_version': TEMPLATE_VERSION,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def report_filename(key):
+    return f"quotation_{key}.pdf"
+
+
+def report_name(filename):
+    """Name of a report in the artifact store."""
+    return f"reports/{os.path.basename(filename)}"
+
+
+def _render_report(path, quotation, tax_rate, discount_rate, company_info, client_info, class_names,
+                   terms_and_conditions):
+    # Top-level so it can run in a worker process; reportlab is only imported once a report is rendered
+    from src.report_generator import ReportGenerator
+
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+    rg = ReportGenerator(filename=tmp_path, tax_rate=tax_rate, discount_rate=discount_rate,
+                         terms_and_conditions=terms_and_conditions)
+    rg.generate_pdf(quotation, class_names=class_names, company_info=company_info, client_info=client_info)
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+class ReportCache:
+    """
+    Content-addressed store of rendered quotation PDFs.
+
+    Reports are kept in an ArtifactStore under names derived from
+    `report_key`, so a repeat request for the same quotation, rates and
+    letterhead is an index lookup instead of a ReportLab render. The store
+    owns the byte budget: least recently served reports are evicted along
+    with old uploads, and a later request simply renders them again.
+    """
+
+    def __init__(self, store=None):
+        self.store = store if store is not None else get_artifact_store()
+        self._lock = threading.Lock()
+        self._render_locks = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, filename):
+        """Path of a cached report, marked as recently used, or None if it isn't cached."""
+        return self.store.lookup(report_name(filename))
+
+    def _store(self, filename, path):
+        self.store.add_file(report_name(filename), path, kind='report')
+
+    def get_or_render(self, quotation, tax_rate=0.1, discount_rate=0.0, company_info=None, client_info=None,
+                      class_names=None, terms_and_conditions=None):
+        """
+        Return the filename of the report for these inputs, rendering it on a miss.
+
+        Concurrent requests for the same report wait for a single render.
+        """
+        key = report_key(quotation['quotation_hash'], tax_rate, discount_rate, company_info, client_info,
+                         class_names, terms_and_conditions)
+        filename = report_filename(key)
+        if self.lookup(filename) is not None:
+            self.hits += 1
+            record_cache('report', True)
+            return filename
+        with self._lock:
+            render_lock = self._render_locks.setdefault(filename, threading.Lock())
+        with render_lock:
+            if self.lookup(filename) is not None:
+                self.hits += 1
+                record_cache('report', True)
+                return filename
+            self.misses += 1
+            record_cache('report', False)
+            path = self.store.temp_path('.pdf')
+            _render_report(path, quotation, tax_rate, discount_rate, company_info, client_info, class_names,
+                           terms_and_conditions)
+            self._store(filename, path)
+        with self._lock:
+            self._render_locks.pop(filename, None)
+        return filename
+
+    def render_many(self, jobs, workers=None):
+        """
+        Render a batch of reports in a process pool, e.g. for a month-end re-issue run.
+
+        Args:
+            jobs (list of dict): Keyword arguments for `get_or_render` ('quotation' plus optional
+                rates, company/client info, class names and terms).
+            workers (int or None): Worker processes, defaults to the CPU count.
+
+        Returns:
+            list of str: Report filenames in the order of `jobs`. Reports already cached are not re-rendered.
+        """
+        filenames, pending = [], {}
+        for job in jobs:
+            args = (job['quotation'], job.get('tax_rate', 0.1), job.get('discount_rate', 0.0),
+                    job.get('company_info'), job.get('client_info'), job.get('class_names'),
+                    job.get('terms_and_conditions'))
+            filename = report_filename(report_key(args[0]['quotation_hash'], *args[1:]))
+            filenames.append(filename)
+            if self.lookup(filename) is None and filename not in pending:
+                pending[filename] = args
+        self.hits += len(filenames) - len(pending)
+        self.misses += len(pending)
+
+        if pending:
+            logger.info(f"Rendering {len(pending)} of {len(filenames)} reports "
+                        f"({len(filenames) - len(pending)} cached)")
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                paths = {filename: self.store.temp_path('.pdf') for filename in pending}
+                futures = {filename: pool.submit(_render_report, paths[filename], *args)
+                           for filename, args in pending.items()}
+                for filename, future in futures.items():
+                    future.result()
+                    self._store(filename, paths[filename])
+        return filenames
+
+    def stats(self):
+        stats = self.store.stats(kind='report')
+        return {'reports': stats['objects'], 'bytes': stats['bytes'], 'max_bytes': self.store.max_bytes,
+                'hits': self.hits, 'misses': self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_report_cache():
+    """Return the process-wide report cache, kept in the shared artifact store."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ReportCache()
+        return _cache
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Render quotation reports in bulk into the report cache")
+    parser.add_argument('jobs_file', type=str,
+                        help="JSON list of {'quotation': ..., 'tax_rate': ..., 'discount_rate': ..., ...}")
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--cache_dir', type=str, default=None,
+                        help="Artifact store root (default: the app's, set by AIPQS_ARTIFACT_DIR)")
+
+    args = parser.parse_args()
+
+    with open(args.jobs_file, 'r') as f:
+        jobs = json.load(f)
+    for job in jobs:
+        # JSON object keys are strings; the report generator expects integer class ids
+        quotation = job['quotation']
+        for field in ('items', 'unit_prices'):
+            if field in quotation:
+                quotation[field] = {int(k): v for k, v in quotation[field].items()}
+        if 'class_names' in job:
+            job['class_names'] = {int(k): v for k, v in job['class_names'].items()}
+    # Rendered into the store the app serves downloads from, unless pointed elsewhere
+    cache = ReportCache(ArtifactStore(args.cache_dir)) if args.cache_dir else get_report_cache()
+    for filename in cache.render_many(jobs, workers=args.workers):
+        print(filename)
+    print(cache.stats())
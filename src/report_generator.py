@@ -3,6 +3,13 @@ from reportlab.pdfgen import canvas
 from reportlab.lib.units import inch
 from reportlab.platypus import Table, TableStyle
 from reportlab.lib import colors
+from collections import namedtuple
+from functools import lru_cache
+from itertools import islice
+from src.metrics import stage
+
+# Bump whenever the report layout changes so cached PDFs (src/report_cache.py) are re-rendered
+TEMPLATE_VERSION = 3
 
 class ReportGenerator:
     def __init__(self, filename='quotation.pdf', tax_rate=0.1, discount_rate=0.0, terms_and_conditions=None):
@@ -25,77 +32,31 @@ class ReportGenerator:
         """
         Generates a professional PDF report for the quotation.
 
+        The static parts of the page (header band, from/to blocks, terms) are
+        drawn once per document as a form XObject and stamped on each page;
+        only the item table and totals are drawn per report. Item rows are
+        streamed onto as many pages as they need, one page of rows at a time.
+
         Args:
-            quotation_data (dict): Output from QuotationGenerator.generate_quotation
+            quotation_data (dict): Output from QuotationGenerator.generate_quotation; item rows are
+                grouped under their room or zone when it has 'region_items'
             class_names (dict): Optional mapping from class_id to human-readable names
             company_info (dict): Information about the company (from)
             client_info (dict): Information about the client (to)
             quotation_number (int or None): Unique quotation number to display
         """
-        c = canvas.Canvas(self.filename, pagesize=letter)
-        width, height = letter
+        with stage('report_render'):
+            self._render(quotation_data, class_names, company_info, client_info, quotation_number)
 
-        # Title with background color
-        c.setFillColor(colors.HexColor("#003366"))
-        c.rect(0, height - inch, width, inch, fill=1)
-        c.setFillColor(colors.white)
-        c.setFont("Helvetica-Bold", 24)
-        c.drawString(1 * inch, height - 0.7 * inch, "Quotation Report")
-
-        # Display quotation number below title if provided
-        if quotation_number is not None:
-            c.setFont("Helvetica-Bold", 18)
-            c.setFillColor(colors.red)
-            c.drawString(1 * inch, height - 1.1 * inch, f"Quotation {quotation_number}")
-            c.setFillColor(colors.black)
-            c.setFont("Helvetica-Bold", 12)
-            c.drawString(1 * inch, height - 1.5 * inch, "From:")
-        else:
-            c.setFillColor(colors.black)
-            c.setFont("Helvetica-Bold", 12)
-            c.drawString(1 * inch, height - 1.5 * inch, "From:")
-        c.setFont("Helvetica", 10)
-        y = height - 1.7 * inch
-        if company_info:
-            for key, value in company_info.items():
-                c.drawString(1 * inch, y, f"{key}: {value}")
-                y -= 0.18 * inch
-        else:
-            c.drawString(1 * inch, y, "Your Company Name")
-            y -= 0.18 * inch
-            c.drawString(1 * inch, y, "Address Line 1")
-            y -= 0.18 * inch
-            c.drawString(1 * inch, y, "Address Line 2")
-            y -= 0.18 * inch
-            c.drawString(1 * inch, y, "Phone: XXX-XXX-XXXX")
-            y -= 0.18 * inch
-            c.drawString(1 * inch, y, "Email: info@company.com")
-            y -= 0.18 * inch
-
-        # Client Info (To)
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(4.5 * inch, height - 1.5 * inch, "To:")
-        c.setFont("Helvetica", 10)
-        y_client = height - 1.7 * inch
-        if client_info:
-            for key, value in client_info.items():
-                c.drawString(4.5 * inch, y_client, f"{key}: {value}")
-                y_client -= 0.18 * inch
-        else:
-            c.drawString(4.5 * inch, y_client, "Client Name")
-            y_client -= 0.18 * inch
-            c.drawString(4.5 * inch, y_client, "Client Address Line 1")
-            y_client -= 0.18 * inch
-            c.drawString(4.5 * inch, y_client, "Client Address Line 2")
-            y_client -= 0.18 * inch
-            c.drawString(4.5 * inch, y_client, "Phone: XXX-XXX-XXXX")
-            y_client -= 0.18 * inch
-            c.drawString(4.5 * inch, y_client, "Email: client@example.com")
-            y_client -= 0.18 * inch
+    def _render(self, quotation_data, class_names, company_info, client_info, quotation_number):
+        c = canvas.Canvas(self.filename, pagesize=letter)
+        template = _page_template(_freeze(company_info), _freeze(client_info), self.terms_and_conditions)
+        c.beginForm(TEMPLATE_FORM)
+        _replay(c, template.ops)
+        c.endForm()
 
         # Table of items
         items = quotation_data.get('items', {})
-        total_cost = quotation_data.get('total_cost', 0.0)
 
         if class_names is None:
             class_names = {}
@@ -103,49 +64,198 @@ class ReportGenerator:
         # Assume unit_prices are available in quotation_data or fallback to 0.0
         unit_prices = quotation_data.get('unit_prices', {})
 
-        data = [['Item', 'Quantity', 'Unit Price', 'Total Price']]
-        subtotal = 0.0
+        totals = {'subtotal': 0.0}
+        region_items = quotation_data.get('region_items')
+        if region_items:
+            rows = self._region_rows(region_items, class_names, unit_prices, totals)
+        else:
+            rows = self._item_rows(items, class_names, unit_prices, totals)
+        rows_per_page = _rows_per_page(template.table_top - template.table_bottom)
+
+        page = 1
+        self._start_page(c, page, quotation_number)
+        chunk = list(islice(rows, rows_per_page))
+        while True:
+            # Look one page ahead so only two pages of rows are held at a time
+            next_chunk = list(islice(rows, rows_per_page))
+            if not next_chunk:
+                break
+            self._draw_table(c, chunk, template.table_top)
+            page = self._next_page(c, page, quotation_number)
+            chunk = next_chunk
+
+        # Subtotal, taxes, discount, and total rows
+        summary = self._summary_rows(totals['subtotal'])
+        if len(chunk) + len(summary) > rows_per_page:
+            self._draw_table(c, chunk, template.table_top)
+            page = self._next_page(c, page, quotation_number)
+            chunk = []
+        self._draw_table(c, chunk + summary, template.table_top)
+
+        c.showPage()
+        c.save()
+
+    @staticmethod
+    def _item_rows(items, class_names, unit_prices, totals):
         for class_id, quantity in items.items():
             name = class_names.get(class_id, f"Class {class_id}")
             unit_price = unit_prices.get(class_id, 0.0)
             total_price = unit_price * quantity
-            subtotal += total_price
-            data.append([name, str(quantity), f"${unit_price:.2f}", f"${total_price:.2f}"])
+            totals['subtotal'] += total_price
+            yield [name, str(quantity), f"${unit_price:.2f}", f"${total_price:.2f}"]
 
-        # Subtotal, taxes, discount, and total rows
+    @classmethod
+    def _region_rows(cls, region_items, class_names, unit_prices, totals):
+        # Each room or zone gets a heading row, its line items and its own subtotal
+        for region in region_items:
+            region_totals = {'subtotal': 0.0}
+            yield [region['name'], '', '', '']
+            for name, *rest in cls._item_rows(region['items'], class_names, unit_prices, region_totals):
+                yield [f"    {name}", *rest]
+            yield ['', '', f"{region['name']} subtotal:", f"${region_totals['subtotal']:.2f}"]
+            totals['subtotal'] += region_totals['subtotal']
+
+    def _summary_rows(self, subtotal):
         tax_amount = subtotal * self.tax_rate
         discount_amount = subtotal * self.discount_rate
         total = subtotal + tax_amount - discount_amount
+        return [
+            ['', '', 'Subtotal:', f"${subtotal:.2f}"],
+            ['', '', f"Tax ({self.tax_rate*100:.0f}%):", f"${tax_amount:.2f}"],
+            ['', '', f"Discount ({self.discount_rate*100:.0f}%):", f"-${discount_amount:.2f}"],
+            ['', '', 'Total Cost:', f"${total:.2f}"],
+        ]
 
-        data.append(['', '', 'Subtotal:', f"${subtotal:.2f}"])
-        data.append(['', '', f"Tax ({self.tax_rate*100:.0f}%):", f"${tax_amount:.2f}"])
-        data.append(['', '', f"Discount ({self.discount_rate*100:.0f}%):", f"-${discount_amount:.2f}"])
-        data.append(['', '', 'Total Cost:', f"${total:.2f}"])
-
-        table = Table(data, colWidths=[3*inch, 1*inch, 1.25*inch, 1.25*inch])
-        style = TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), colors.HexColor("#003366")),
-            ('TEXTCOLOR',(0,0),(-1,0),colors.whitesmoke),
-            ('ALIGN',(1,1),(-1,-1),'CENTER'),
-            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0,0), (-1,0), 12),
-            ('GRID', (0,0), (-1,-1), 1, colors.black),
-            ('BACKGROUND', (0,1), (-1,-1), colors.HexColor("#f0f8ff")),
-        ])
-        table.setStyle(style)
-
-        # Position table
-        table.wrapOn(c, width, height)
-        table_height = 18 * len(data)  # Approx height
-        table.drawOn(c, 1 * inch, y_client - table_height - 0.5*inch)
-
-        # Terms and Conditions at the bottom
-        text = c.beginText()
-        text.setTextOrigin(1 * inch, 1 * inch)
-        text.setFont("Helvetica", 9)
-        for line in self.terms_and_conditions.split('\n'):
-            text.textLine(line)
-        c.drawText(text)
+    @staticmethod
+    def _start_page(c, page, quotation_number):
+        c.doForm(TEMPLATE_FORM)
+        width, height = letter
+        # Display quotation number below title if provided
+        if quotation_number is not None:
+            c.setFont("Helvetica-Bold", 18)
+            c.setFillColor(colors.red)
+            c.drawString(1 * inch, height - 1.1 * inch, f"Quotation {quotation_number}")
+        if page > 1:
+            c.setFillColor(colors.white)
+            c.setFont("Helvetica", 10)
+            c.drawRightString(width - 1 * inch, height - 0.7 * inch, f"Page {page}")
+        c.setFillColor(colors.black)
 
+    def _next_page(self, c, page, quotation_number):
         c.showPage()
-        c.save()
+        self._start_page(c, page + 1, quotation_number)
+        return page + 1
+
+    @staticmethod
+    def _draw_table(c, rows, top):
+        table = Table([TABLE_HEADER] + rows, colWidths=TABLE_COL_WIDTHS)
+        table.setStyle(TABLE_STYLE)
+        _, table_height = table.wrapOn(c, *letter)
+        table.drawOn(c, 1 * inch, top - table_height)
+
+
+TEMPLATE_FORM = 'quotation_template'
+TABLE_HEADER = ['Item', 'Quantity', 'Unit Price', 'Total Price']
+TABLE_COL_WIDTHS = [3*inch, 1*inch, 1.25*inch, 1.25*inch]
+TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0,0), (-1,0), colors.HexColor("#003366")),
+    ('TEXTCOLOR',(0,0),(-1,0),colors.whitesmoke),
+    ('ALIGN',(1,1),(-1,-1),'CENTER'),
+    ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+    ('BOTTOMPADDING', (0,0), (-1,0), 12),
+    ('GRID', (0,0), (-1,-1), 1, colors.black),
+    ('BACKGROUND', (0,1), (-1,-1), colors.HexColor("#f0f8ff")),
+])
+
+PageTemplate = namedtuple('PageTemplate', ['ops', 'table_top', 'table_bottom'])
+
+
+def _freeze(info):
+    # lru_cache keys must be hashable; dict order is part of the layout
+    return tuple(info.items()) if info else None
+
+
+@lru_cache(maxsize=32)
+def _page_template(company_info, client_info, terms_and_conditions):
+    """
+    Lay out the static part of the page once per (company, client, terms) configuration.
+
+    Returns:
+        PageTemplate: drawing operations to replay into the page form, and
+        the vertical band left for the item table.
+    """
+    width, height = letter
+    ops = [
+        ('fill', colors.HexColor("#003366")),
+        ('rect', 0, height - inch, width, inch),
+        ('fill', colors.white),
+        ('font', "Helvetica-Bold", 24),
+        ('text', 1 * inch, height - 0.7 * inch, "Quotation Report"),
+        ('fill', colors.black),
+    ]
+
+    def block(x, title, lines):
+        ops.append(('font', "Helvetica-Bold", 12))
+        ops.append(('text', x, height - 1.5 * inch, title))
+        ops.append(('font', "Helvetica", 10))
+        y = height - 1.7 * inch
+        for line in lines:
+            ops.append(('text', x, y, line))
+            y -= 0.18 * inch
+        return y
+
+    if company_info:
+        company_lines = [f"{key}: {value}" for key, value in company_info]
+    else:
+        company_lines = ["Your Company Name", "Address Line 1", "Address Line 2", "Phone: XXX-XXX-XXXX",
+                         "Email: info@company.com"]
+    if client_info:
+        client_lines = [f"{key}: {value}" for key, value in client_info]
+    else:
+        client_lines = ["Client Name", "Client Address Line 1", "Client Address Line 2", "Phone: XXX-XXX-XXXX",
+                        "Email: client@example.com"]
+    y = block(1 * inch, "From:", company_lines)
+    y_client = block(4.5 * inch, "To:", client_lines)
+
+    # Terms and Conditions at the bottom
+    terms_lines = terms_and_conditions.split('\n')
+    ops.append(('font', "Helvetica", 9))
+    ops.append(('lines', 1 * inch, 1 * inch, terms_lines))
+
+    # The table sits below both address blocks and stops above the terms block
+    table_top = min(y, y_client) - 0.5 * inch
+    table_bottom = 1 * inch + 9 * 1.2 * len(terms_lines) + 0.25 * inch
+    return PageTemplate(tuple(ops), table_top, table_bottom)
+
+
+def _replay(c, ops):
+    for op, *args in ops:
+        if op == 'fill':
+            c.setFillColor(args[0])
+        elif op == 'font':
+            c.setFont(*args)
+        elif op == 'rect':
+            c.rect(*args, fill=1)
+        elif op == 'text':
+            c.drawString(*args)
+        elif op == 'lines':
+            x, y, lines = args
+            text = c.beginText()
+            text.setTextOrigin(x, y)
+            text.setFont("Helvetica", 9)
+            for line in lines:
+                text.textLine(line)
+            c.drawText(text)
+
+
+@lru_cache(maxsize=8)
+def _rows_per_page(available_height):
+    """Item rows (plus the repeated header) that fit in `available_height`, measured once."""
+    sample = Table([TABLE_HEADER, TABLE_HEADER], colWidths=TABLE_COL_WIDTHS)
+    sample.setStyle(TABLE_STYLE)
+    _, two_rows = sample.wrap(*letter)
+    header = Table([TABLE_HEADER], colWidths=TABLE_COL_WIDTHS)
+    header.setStyle(TABLE_STYLE)
+    _, header_height = header.wrap(*letter)
+    row_height = two_rows - header_height
+    return max(1, int((available_height - header_height) // row_height))
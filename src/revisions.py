@@ -0,0 +1,432 @@
+from src.detection_cache import RAW_FLOOR_CONF, get_detection_cache, hash_bytes, make_raw_key
+from src.detections import Detections
+from src.metrics import stage
+from src.model_registry import get_model, model_identity
+from src.quotation_generator import QuotationGenerator
+from src.tiling import merge_tiles, predict_windows, tile_grid
+from src.upload_stream import decode_image
+import numpy as np
+import cv2
+import logging
+import os
+import re
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REVISION_DIR = os.environ.get('AIPQS_REVISION_DIR', os.path.join('uploads', 'revisions'))
+# One thumbnail pixel per THUMB_SCALE x THUMB_SCALE block of the sheet
+THUMB_SCALE = 4
+# Grey-level change of a thumbnail pixel that counts as an edit
+DIFF_THRESHOLD = 32
+# Revisions are stored under their SHA-256 content digest
+DIGEST_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+
+def is_digest(value):
+    """Whether `value` is a content digest (64 lowercase hex characters), safe to use in a path."""
+    return isinstance(value, str) and DIGEST_PATTERN.fullmatch(value) is not None
+
+
+class RevisionStore:
+    """
+    Per-revision state needed to diff the next revision of a drawing against it.
+
+    Each analysed sheet is kept as `<digest>.npz` (a grayscale thumbnail, the
+    sheet size, the inference settings and the raw detections), and
+    `drawings/<name>` holds the digest of a named drawing's latest revision.
+    """
+
+    def __init__(self, directory=DEFAULT_REVISION_DIR):
+        self.directory = directory
+
+    def save(self, digest, thumb, shape, settings, raw_detections):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, thumb=thumb, shape=np.asarray(shape, dtype=np.int64), settings=np.array(settings),
+                     detections=np.frombuffer(raw_detections.to_bytes(), dtype=np.uint8))
+        os.replace(tmp_path, self._path(digest))
+
+    def load(self, digest):
+        """Return the stored state of a revision as a dict, or None if it was never analysed."""
+        if not digest:
+            return None
+        try:
+            with np.load(self._path(digest)) as state:
+                return {
+                    'digest': digest,
+                    'thumb': state['thumb'],
+                    'shape': tuple(state['shape'].tolist()),
+                    'settings': str(state['settings']),
+                    'raw': Detections.from_bytes(state['detections'].tobytes()),
+                }
+        except FileNotFoundError:
+            return None
+
+    def latest(self, drawing):
+        try:
+            with open(self._drawing_path(drawing)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def set_latest(self, drawing, digest):
+        path = self._drawing_path(drawing)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(digest)
+        os.replace(tmp_path, path)
+
+    def _path(self, digest):
+        if not is_digest(digest):
+            raise ValueError(f"Not a revision digest: {digest!r}")
+        return os.path.join(self.directory, f"{digest}.npz")
+
+    def _drawing_path(self, drawing):
+        return os.path.join(self.directory, 'drawings', re.sub(r'[^A-Za-z0-9_.-]', '_', drawing))
+
+
+def thumbnail(img, scale=THUMB_SCALE):
+    """Grayscale, area-averaged thumbnail of a BGR sheet used for alignment and diffing."""
+    height, width = img.shape[:2]
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    size = (max(1, round(width / scale)), max(1, round(height / scale)))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+
+def align(previous, current, min_response=0.2):
+    """
+    Global translation between two revisions' thumbnails by phase correlation.
+
+    Returns:
+        tuple or None: (dx, dy) in thumbnail pixels moving `previous` onto
+            `current`, or None if the sheets differ in size or don't correlate.
+    """
+    if previous.shape != current.shape:
+        return None
+    if np.array_equal(previous, current):
+        return 0.0, 0.0
+    window = cv2.createHanningWindow(current.shape[::-1], cv2.CV_32F)
+    (dx, dy), response = cv2.phaseCorrelate(previous.astype(np.float32), current.astype(np.float32), window)
+    if response < min_response:
+        return None
+    return dx, dy
+
+
+def changed_mask(previous, gray, shift=(0, 0), threshold=DIFF_THRESHOLD):
+    """
+    Thumbnail-resolution mask of edits, in the previous revision's frame.
+
+    Args:
+        previous (np.ndarray): Thumbnail of the previous revision.
+        gray (np.ndarray): The new sheet in grayscale, at full resolution.
+        shift (tuple): Integer (dx, dy) in sheet pixels moving the previous revision onto the new one.
+        threshold (int): Grey-level change of a thumbnail pixel that counts as an edit.
+
+    Returns:
+        np.ndarray: Boolean mask; parts of the previous frame the new sheet doesn't cover count as edited.
+    """
+    dx, dy = shift
+    uncovered = False
+    if dx or dy:
+        # Move the new sheet into the previous frame with integer slicing, so an exact shift leaves
+        # the thumbnails identical outside real edits: pixel (x, y) there is (x + dx, y + dy) here
+        height, width = gray.shape
+        src = (slice(max(dy, 0), height + min(dy, 0)), slice(max(dx, 0), width + min(dx, 0)))
+        dst = (slice(max(-dy, 0), height + min(-dy, 0)), slice(max(-dx, 0), width + min(-dx, 0)))
+        aligned = np.full_like(gray, 255)
+        aligned[dst] = gray[src]
+        covered = np.zeros_like(gray)
+        covered[dst] = 255
+        uncovered = thumbnail(covered) < 255
+        gray = aligned
+    return (cv2.absdiff(previous, thumbnail(gray)) > threshold) | uncovered
+
+
+def find_shift(previous, gray, thumb, threshold=DIFF_THRESHOLD):
+    """
+    Integer sheet-pixel shift between two revisions and the resulting edit mask.
+
+    Phase correlation on the thumbnails gives the shift to within a sheet
+    pixel or so; the neighbouring integer shifts are tried and the one that
+    leaves the fewest edited pixels wins.
+
+    Returns:
+        tuple or None: ((dx, dy), mask), or None if the revisions can't be aligned.
+    """
+    estimate = align(previous, thumb)
+    if estimate is None:
+        return None
+    scale_x, scale_y = gray.shape[1] / thumb.shape[1], gray.shape[0] / thumb.shape[0]
+    center = (int(round(estimate[0] * scale_x)), int(round(estimate[1] * scale_y)))
+    best = (center, changed_mask(previous, gray, center, threshold))
+    if center != (0, 0) and best[1].mean() > 0.01:
+        for offset_x in (-1, 0, 1):
+            for offset_y in (-1, 0, 1):
+                shift = (center[0] + offset_x, center[1] + offset_y)
+                if shift != center:
+                    mask = changed_mask(previous, gray, shift, threshold)
+                    if mask.sum() < best[1].sum():
+                        best = (shift, mask)
+    return best
+
+
+def _changed_pixels(table, boxes, scale_x, scale_y):
+    """
+    Edited thumbnail pixels inside each (x1, y1, x2, y2) box, from the mask's summed-area table.
+
+    Parts of a box outside the mask count as edited.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    height, width = table.shape[0] - 1, table.shape[1] - 1
+    x1, y1 = np.floor(boxes[:, 0] / scale_x).astype(np.int64), np.floor(boxes[:, 1] / scale_y).astype(np.int64)
+    x2, y2 = np.ceil(boxes[:, 2] / scale_x).astype(np.int64), np.ceil(boxes[:, 3] / scale_y).astype(np.int64)
+    cx1, cx2 = np.clip(x1, 0, width), np.clip(x2, 0, width)
+    cy1, cy2 = np.clip(y1, 0, height), np.clip(y2, 0, height)
+    outside = (x2 - x1) * (y2 - y1) - (cx2 - cx1) * (cy2 - cy1)
+    return table[cy2, cx2] - table[cy1, cx2] - table[cy2, cx1] + table[cy1, cx1] + outside
+
+
+def _crosses_seam(boxes, windows):
+    """Whether each box straddles an edge of some tile window, i.e. some tile sees only part of it."""
+    windows = np.asarray(windows, dtype=np.float32).reshape(-1, 4)
+    crosses = np.zeros(len(boxes), dtype=bool)
+    for low, high, edges in ((0, 2, windows[:, 0::2]), (1, 3, windows[:, 1::2])):
+        edges = np.unique(edges)
+        crosses |= np.searchsorted(edges, boxes[:, low], side='right') < np.searchsorted(edges, boxes[:, high])
+    return crosses
+
+
+def splice_detections(img, gray, thumb, previous_thumb, previous_raw, windows, load_model, tile_batch_size=4,
+                      conf_threshold=0.0, threshold=DIFF_THRESHOLD):
+    """
+    Detections of a sheet from those of an earlier version of it, re-running the model only where it changed.
+
+    The sheets are aligned (see `find_shift`) and diffed at thumbnail
+    resolution. Only windows containing edited pixels go through the model;
+    earlier detections that don't touch an edit are shifted and reused.
+
+    Args:
+        img (np.ndarray): The new sheet, BGR at full resolution.
+        gray, thumb (np.ndarray): The new sheet in grayscale and its `thumbnail`.
+        previous_thumb (np.ndarray): `thumbnail` of the earlier sheet, of the same size as `thumb`.
+        previous_raw (Detections): Raw detections of the earlier sheet, in its pixel coordinates.
+        windows (list): Tile windows of the full tiled run (see src.tiling.tile_grid).
+        load_model (callable): Returns the model; only called if some window changed.
+
+    Returns:
+        tuple or None: (unsorted Detections, (dx, dy) shift, changed windows), or None if the
+            sheets can't be aligned.
+    """
+    with stage('revision_diff'):
+        found = find_shift(previous_thumb, gray, thumb, threshold)
+        if found is None:
+            return None
+        shift, mask = found
+        mask = mask.astype(np.uint8)
+        scale_x, scale_y = gray.shape[1] / thumb.shape[1], gray.shape[0] / thumb.shape[0]
+        if shift != (0, 0):
+            # Tiles cut a symbol differently once the sheet has moved, so one crossing a seam in either
+            # frame is re-detected like an edit
+            boxes = previous_raw.boxes[_crosses_seam(previous_raw.boxes, windows)
+                                       | _crosses_seam(previous_raw.boxes + np.float32(shift * 2), windows)]
+            for x1, y1, x2, y2 in boxes.tolist():
+                mask[int(y1 // scale_y):int(-(-y2 // scale_y)), int(x1 // scale_x):int(-(-x2 // scale_x))] = 1
+        # Grow edits a little so a symbol that shrank away from an erased part still touches it
+        mask = cv2.dilate(mask, np.ones((5, 5), np.uint8))
+        table = cv2.integral(mask)
+        # The mask is in the previous frame; new-sheet boxes are moved back by the shift to test them
+        offset = np.array([shift[0], shift[1], shift[0], shift[1]], dtype=np.float32)
+        counts = _changed_pixels(table, np.asarray(windows, dtype=np.float32) - offset, scale_x, scale_y)
+        changed_windows = [window for window, count in zip(windows, counts) if count]
+
+    fresh = Detections.empty()
+    if changed_windows:
+        with stage('model_load'):
+            model = load_model()
+        with stage('forward'):
+            fresh = predict_windows(model, img, changed_windows, tile_batch_size, conf_threshold)
+            if len(changed_windows) > 1:
+                fresh = merge_tiles(fresh)
+    with stage('postprocess'):
+        # A symbol touching an edit lies wholly inside some re-run tile, so it is re-detected there;
+        # everything else keeps its earlier detection
+        old = previous_raw[_changed_pixels(table, previous_raw.boxes, scale_x, scale_y) == 0].shift(*shift)
+        fresh = fresh[_changed_pixels(table, fresh.boxes - offset, scale_x, scale_y) > 0]
+        return Detections.concat([old, fresh]), shift, changed_windows
+
+
+def diff_quotations(previous_items, items, pricing_rules):
+    """
+    Line items whose quantity changed between two revisions.
+
+    Args:
+        previous_items, items (dict): class_id -> quantity of each revision.
+        pricing_rules (dict): class_id -> unit price.
+
+    Returns:
+        dict: {'changed_items': [{class_id, previous_quantity, quantity, delta, cost_delta}], 'total_cost_delta'}
+    """
+    changed = []
+    for class_id in sorted(set(previous_items) | set(items)):
+        before, after = previous_items.get(class_id, 0), items.get(class_id, 0)
+        if before != after:
+            changed.append({
+                'class_id': class_id,
+                'previous_quantity': before,
+                'quantity': after,
+                'delta': after - before,
+                'cost_delta': pricing_rules.get(class_id, 0.0) * (after - before),
+            })
+    return {'changed_items': changed, 'total_cost_delta': sum(item['cost_delta'] for item in changed)}
+
+
+def _item_counts(generator, raw_detections, conf_threshold):
+    # The same de-duplication as generate_quotation, without counting a quotation
+    counts = generator.deduplicate(raw_detections.above(conf_threshold)).counts()
+    return {int(class_id): int(counts[class_id]) for class_id in np.flatnonzero(counts)}
+
+
+def requote_revision(data, filename, previous_digest=None, drawing=None, model_path='models/yolov8m_trained.pt',
+                     conf_threshold=0.15, device=None, tile_size=640, tile_overlap=0.2, tile_batch_size=4,
+                     backend=None, digest=None, diff_threshold=DIFF_THRESHOLD, store=None, generator=None,
+                     use_cache=True):
+    """
+    Quote a revised blueprint, re-running the model only where the sheet changed.
+
+    The new sheet is aligned to the previous revision and only tiles
+    containing edits go through the model (see `splice_detections`). Falls back to a full tiled run when there is no usable
+    previous revision (none given, different sheet size or settings, or the
+    sheets don't correlate).
+
+    Args:
+        data (bytes): Encoded image of the new revision (raster formats only).
+        filename (str): Upload name, used to reject PDFs.
+        previous_digest (str or None): Content hash of the revision to diff against.
+        drawing (str or None): Drawing name; its latest revision is used when
+            `previous_digest` is None, and the new revision becomes the latest.
+        digest (str or None): Content hash of `data` if already known.
+        diff_threshold (int): Grey-level change of a thumbnail pixel that counts as an edit.
+        store (RevisionStore or None): Where revision state is kept.
+        generator (QuotationGenerator or None): Prices the new revision.
+        Remaining arguments are as for `src.inference.run_inference`.
+
+    Returns:
+        dict: 'digest', 'previous_digest', 'mode' ('incremental', 'full' or 'cached'),
+            'shift' (dx, dy in sheet pixels), 'changed_tiles', 'total_tiles', 'raw' (sorted
+            Detections), 'detections', 'quotation' and 'changes' (see `diff_quotations`; None
+            without a usable previous revision).
+    """
+    if filename.lower().endswith('.pdf'):
+        raise ValueError("Revision diffing works on raster sheets; quote PDF drawing sets with run_inference")
+    store = store or RevisionStore()
+    generator = generator or QuotationGenerator()
+    digest = digest or hash_bytes(data)
+    if previous_digest is None and drawing:
+        previous_digest = store.latest(drawing)
+
+    with stage('decode'):
+        img, _ = decode_image(data)
+    if img is None:
+        raise ValueError(f"Could not decode image {filename}")
+    height, width = img.shape[:2]
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    thumb = thumbnail(gray)
+
+    model_id = model_identity(model_path, backend)
+    key, floor = make_raw_key(digest, model_id, conf_threshold, tile_size=tile_size, tile_overlap=tile_overlap)
+    settings = f"{model_id}|{tile_size}|{tile_overlap}|{floor}"
+    windows = tile_grid(width, height, tile_size, tile_overlap)
+    previous = store.load(previous_digest)
+    if previous is not None and (previous['settings'] != settings or previous['shape'] != (height, width)):
+        logger.info(f"Revision {previous_digest[:12]} used other settings or sheet size; running in full")
+        previous = None
+
+    cache = get_detection_cache() if use_cache else None
+    raw = cache.get(key) if cache is not None else None
+    mode, shift, changed_windows = 'cached', (0, 0), []
+    if raw is None:
+        load_model = lambda: get_model(model_path, device=device, backend=backend)
+        spliced = None
+        if previous is not None:
+            spliced = splice_detections(img, gray, thumb, previous['thumb'], previous['raw'], windows, load_model,
+                                        tile_batch_size, floor, diff_threshold)
+        if spliced is not None:
+            mode = 'incremental'
+            raw, shift, changed_windows = spliced
+        else:
+            mode, changed_windows = 'full', windows
+            with stage('model_load'):
+                model = load_model()
+            with stage('forward'):
+                raw = predict_windows(model, img, windows, tile_batch_size, floor)
+                if len(windows) > 1:
+                    raw = merge_tiles(raw)
+        with stage('postprocess'):
+            raw = raw.filter(conf_threshold=floor).sort_by_confidence()
+        # Stitched detections can differ slightly from a full run, so only full runs fill the shared cache
+        if cache is not None and mode == 'full':
+            cache.put(key, raw)
+
+    if store.load(digest) is None:
+        store.save(digest, thumb, (height, width), settings, raw)
+    if drawing:
+        store.set_latest(drawing, digest)
+
+    detections = raw.above(conf_threshold).to_list()
+    quotation = generator.generate_quotation(detections)
+    changes = None
+    if previous is not None:
+        changes = diff_quotations(_item_counts(generator, previous['raw'], conf_threshold), quotation['items'],
+                                  generator.pricing_rules)
+    logger.info(f"Revision {digest[:12]}: {mode}, {len(changed_windows)}/{len(windows)} tiles re-run")
+    return {
+        'digest': digest,
+        'previous_digest': previous_digest,
+        'mode': mode,
+        'shift': shift,
+        'changed_tiles': len(changed_windows),
+        'total_tiles': len(windows),
+        'raw': raw,
+        'detections': detections,
+        'quotation': quotation,
+        'changes': changes,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import time
+
+    parser = argparse.ArgumentParser(description="Re-quote a revised blueprint, re-running inference only on changed tiles")
+    parser.add_argument('image_path', type=str, help='Path to the revised blueprint image')
+    parser.add_argument('--previous', type=str, default=None,
+                        help='Path to the previous revision (analysed first if it has no stored state)')
+    parser.add_argument('--drawing', type=str, default=None, help='Drawing name whose latest revision to diff against')
+    parser.add_argument('--model_path', type=str, default='models/yolov8m_trained.pt', help='Path to trained YOLO model')
+    parser.add_argument('--conf_threshold', type=float, default=0.15, help='Confidence threshold for detections')
+    parser.add_argument('--device', type=str, default=None, help="Device to run on, e.g. 'cpu' or 'cuda:0'")
+    parser.add_argument('--tile_size', type=int, default=640, help='Tile size in pixels')
+    parser.add_argument('--tile_overlap', type=float, default=0.2, help='Fractional overlap between tiles')
+    parser.add_argument('--diff_threshold', type=int, default=DIFF_THRESHOLD,
+                        help='Grey-level change of a thumbnail pixel that counts as an edit')
+
+    args = parser.parse_args()
+    options = dict(model_path=args.model_path, conf_threshold=args.conf_threshold, device=args.device,
+                   tile_size=args.tile_size, tile_overlap=args.tile_overlap, diff_threshold=args.diff_threshold)
+
+    previous_digest = None
+    if args.previous:
+        with open(args.previous, 'rb') as f:
+            previous_digest = requote_revision(f.read(), args.previous, **options)['digest']
+    with open(args.image_path, 'rb') as f:
+        start = time.perf_counter()
+        result = requote_revision(f.read(), args.image_path, previous_digest=previous_digest, drawing=args.drawing,
+                                  **options)
+    print(f"{result['mode']} run: {result['changed_tiles']}/{result['total_tiles']} tiles re-run, "
+          f"shift {result['shift']}, {time.perf_counter() - start:.2f}s")
+    if result['changes'] is not None:
+        print(json.dumps(result['changes'], indent=2))
@@ -0,0 +1,102 @@
+import gc
+import logging
+import os
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_BIND = os.environ.get('AIPQS_BIND', '0.0.0.0:8000')
+DEFAULT_WORKERS = int(os.environ.get('AIPQS_WORKERS', 2))
+DEFAULT_THREADS = int(os.environ.get('AIPQS_THREADS', 4))
+
+
+def _load_app():
+    """Import the Flask app without starting its warm-up thread and return the module."""
+    # Warm-up runs the model, which starts torch/OpenMP thread pools; those must not exist before fork
+    os.environ['AIPQS_WARMUP_ON_IMPORT'] = '0'
+    start = time.perf_counter()
+    from src import app as app_module
+    logger.info(f"Imported the app in {time.perf_counter() - start:.2f}s")
+    return app_module
+
+
+def _preload_model(app_module):
+    """
+    Load the model weights in the master so forked workers share them copy-on-write.
+
+    CUDA cannot be initialized before fork, so GPU workers load their own copy.
+    """
+    device = app_module.MODEL_DEVICE or ''
+    if device.startswith('cuda') or device.isdigit():
+        logger.info(f"Device {device} is loaded per worker after fork")
+        return
+    try:
+        start = time.perf_counter()
+        app_module.load_model()
+        logger.info(f"Loaded {app_module.MODEL_PATH} in the master in {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        # Workers retry and report the error on /readyz
+        logger.warning(f"Could not preload the model in the master: {e}")
+    # Move everything loaded so far out of the collector's generations: a collection would otherwise
+    # write to the header of every object and un-share the workers' copy-on-write pages
+    gc.freeze()
+
+
+def serve(bind=DEFAULT_BIND, workers=DEFAULT_WORKERS, threads=DEFAULT_THREADS, timeout=120):
+    """
+    Run the web app with pre-forked workers.
+
+    The master imports the app and loads the model once, then forks
+    `workers` processes that each warm the shared model up and report ready
+    on /readyz. Falls back to a single threaded werkzeug server where
+    gunicorn is unavailable (e.g. on Windows).
+    """
+    app_module = _load_app()
+    _preload_model(app_module)
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        from werkzeug.serving import run_simple
+
+        logger.warning("gunicorn is not installed; serving from a single process")
+        host, _, port = bind.rpartition(':')
+        app_module.start_warm_up()
+        run_simple(host or '0.0.0.0', int(port), app_module.app, threaded=True)
+        return
+
+    def post_fork(server, worker):
+        app_module.start_warm_up()
+
+    class Server(BaseApplication):
+        def load_config(self):
+            options = {
+                'bind': bind,
+                'workers': workers,
+                'threads': threads,
+                'worker_class': 'gthread',
+                'timeout': timeout,
+                'preload_app': True,
+                'post_fork': post_fork,
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app_module.app
+
+    Server().run()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve the web app with the model shared across pre-forked workers")
+    parser.add_argument('--bind', type=str, default=DEFAULT_BIND, help='Address to listen on (host:port)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Worker processes')
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS, help='Request threads per worker')
+    parser.add_argument('--timeout', type=int, default=120, help='Seconds before a silent worker is restarted')
+
+    args = parser.parse_args()
+    serve(args.bind, args.workers, args.threads, args.timeout)
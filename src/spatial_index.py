@@ -0,0 +1,231 @@
+import numpy as np
+import json
+
+# Grid cells default to this many median box sides, so a symbol touches at most a few cells
+CELL_BOXES = 2.0
+
+
+class GridIndex:
+    """
+    Uniform-grid spatial index over axis-aligned boxes.
+
+    Every box is registered in each grid cell its extent touches, and the
+    (cell, box) entries are kept sorted by cell in flat NumPy arrays. Boxes
+    can carry a group key (e.g. class and page) that is folded into the cell
+    key, so only boxes of the same group ever share a cell.
+
+    Attributes:
+        boxes (np.ndarray): (N, 4) float32 x1, y1, x2, y2.
+        cell_size (float): Side of a grid cell in box units.
+    """
+
+    def __init__(self, boxes, groups=None, cell_size=None):
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        n = len(self.boxes)
+        if cell_size is None:
+            sides = np.maximum(self.boxes[:, 2:] - self.boxes[:, :2], 1.0)
+            cell_size = float(np.median(sides)) * CELL_BOXES if n else 1.0
+        self.cell_size = max(float(cell_size), 1.0)
+        groups = np.zeros(n, dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+
+        cells = np.floor(self.boxes / self.cell_size).astype(np.int64)
+        self._origin = cells[:, :2].min(axis=0) if n else np.zeros(2, dtype=np.int64)
+        cells -= np.tile(self._origin, 2)
+        self._columns = int(cells[:, 2].max()) + 1 if n else 1
+        self._rows = int(cells[:, 3].max()) + 1 if n else 1
+
+        # One entry per (box, touched cell): expand each box's cell range
+        spans_x = cells[:, 2] - cells[:, 0] + 1
+        spans_y = cells[:, 3] - cells[:, 1] + 1
+        per_box = spans_x * spans_y
+        box_ids = np.repeat(np.arange(n), per_box)
+        offset = np.arange(len(box_ids)) - np.repeat(np.cumsum(per_box) - per_box, per_box)
+        cx = cells[box_ids, 0] + offset % spans_x[box_ids]
+        cy = cells[box_ids, 1] + offset // spans_x[box_ids]
+        keys = (groups[box_ids] * self._rows + cy) * self._columns + cx
+
+        order = np.argsort(keys, kind='stable')
+        self._keys = keys[order]
+        self._entries = box_ids[order]
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def candidate_pairs(self):
+        """
+        Pairs (i, j), i < j, of boxes sharing at least one cell and group.
+
+        Generated with array operations per cell rather than by comparing all
+        boxes pairwise; a superset of the overlapping pairs.
+
+        Returns:
+            np.ndarray: (P, 2) int64 box indices, unique.
+        """
+        if len(self._keys) < 2:
+            return np.empty((0, 2), dtype=np.int64)
+        starts = np.flatnonzero(np.r_[True, self._keys[1:] != self._keys[:-1]])
+        ends = np.r_[starts[1:], len(self._keys)]
+        group_end = np.repeat(ends, ends - starts)
+        positions = np.arange(len(self._keys))
+        # Each entry pairs with the entries after it in its cell
+        partners = group_end - positions - 1
+        left = np.repeat(positions, partners)
+        right = left + 1 + np.arange(len(left)) - np.repeat(np.cumsum(partners) - partners, partners)
+        a, b = self._entries[left], self._entries[right]
+        pairs = np.stack((np.minimum(a, b), np.maximum(a, b)), axis=1)
+        pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+        return np.unique(pairs, axis=0)
+
+    def query(self, x1, y1, x2, y2, group=0):
+        """Indices of boxes of `group` registered in the cells a rectangle touches (a superset of the hits)."""
+        if not len(self.boxes):
+            return np.empty(0, dtype=np.int64)
+        c1 = np.floor(np.array([x1, y1]) / self.cell_size).astype(np.int64) - self._origin
+        c2 = np.floor(np.array([x2, y2]) / self.cell_size).astype(np.int64) - self._origin
+        c1 = np.maximum(c1, 0)
+        c2 = np.minimum(c2, [self._columns - 1, self._rows - 1])
+        if np.any(c2 < c1):
+            return np.empty(0, dtype=np.int64)
+        found = []
+        for cy in range(c1[1], c2[1] + 1):
+            # Cells of one grid row are contiguous in key order
+            row_key = (group * self._rows + cy) * self._columns
+            lo = np.searchsorted(self._keys, row_key + c1[0], side='left')
+            hi = np.searchsorted(self._keys, row_key + c2[0], side='right')
+            found.append(self._entries[lo:hi])
+        return np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+
+
+def _overlaps(boxes, pairs, metric):
+    a, b = boxes[pairs[:, 0]], boxes[pairs[:, 1]]
+    w = np.maximum(0.0, np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0]))
+    h = np.maximum(0.0, np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1]))
+    inter = w * h
+    area_a = np.maximum(a[:, 2] - a[:, 0], 0) * np.maximum(a[:, 3] - a[:, 1], 0)
+    area_b = np.maximum(b[:, 2] - b[:, 0], 0) * np.maximum(b[:, 3] - b[:, 1], 0)
+    if metric == 'iou':
+        denom = area_a + area_b - inter
+    elif metric == 'ios':
+        denom = np.minimum(area_a, area_b)
+    else:
+        raise ValueError(f"Unknown overlap metric: {metric}")
+    return inter / np.maximum(denom, 1e-9)
+
+
+def _group_keys(detections):
+    # Boxes only interact with boxes of the same class on the same page
+    keys = detections.class_ids.copy()
+    if detections.pages is not None:
+        keys += detections.pages * (int(keys.max()) + 1 if len(keys) else 1)
+    return keys
+
+
+def suppress_overlaps(detections, threshold=0.5, metric='iou'):
+    """
+    Drop lower-confidence boxes that overlap a kept box of the same class.
+
+    Gives the same result as greedy per-class NMS (see src.tiling.nms) in
+    O(n log n): a grid index yields the few candidate pairs, their overlaps
+    are computed in one vectorized pass, and only pairs above `threshold`
+    are resolved in confidence order.
+
+    Args:
+        detections (Detections): Boxes to de-duplicate; pages are kept apart.
+        threshold (float): Overlap above which the lower-scored box is dropped.
+        metric (str): 'iou', or 'ios' (intersection over the smaller box), which
+            also catches a small duplicate box nested inside a larger one.
+
+    Returns:
+        np.ndarray: Boolean keep mask over `detections`.
+    """
+    n = len(detections)
+    keep = np.ones(n, dtype=bool)
+    if n < 2:
+        return keep
+    index = GridIndex(detections.boxes, _group_keys(detections))
+    pairs = index.candidate_pairs()
+    pairs = pairs[_overlaps(index.boxes, pairs, metric) > threshold]
+    if not len(pairs):
+        return keep
+
+    # Rank by descending confidence; ties keep input order like the greedy NMS
+    rank = np.empty(n, dtype=np.int64)
+    rank[np.argsort(-detections.confidences, kind='stable')] = np.arange(n)
+    swap = rank[pairs[:, 0]] > rank[pairs[:, 1]]
+    pairs[swap] = pairs[swap][:, ::-1]
+    # A box is dropped if any higher-ranked box it overlaps survives. Processing pairs by the rank of the
+    # lower box settles every higher box before it is consulted
+    pairs = pairs[np.argsort(rank[pairs[:, 1]], kind='stable')]
+    for higher, lower in pairs.tolist():
+        if keep[higher]:
+            keep[lower] = False
+    return keep
+
+
+def region_polygon(region):
+    """(K, 2) float polygon of a region given as {'polygon': [[x, y], ...]} or {'rect': [x1, y1, x2, y2]}."""
+    if 'polygon' in region:
+        polygon = np.asarray(region['polygon'], dtype=np.float64).reshape(-1, 2)
+        if len(polygon) < 3:
+            raise ValueError(f"Region {region.get('name')!r} needs at least 3 polygon points")
+        return polygon
+    if 'rect' in region:
+        x1, y1, x2, y2 = (float(v) for v in region['rect'])
+        return np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]])
+    raise ValueError(f"Region {region.get('name')!r} needs a 'polygon' or a 'rect'")
+
+
+def points_in_polygon(points, polygon):
+    """Even-odd ray casting for (N, 2) points against one polygon, vectorized over points and edges."""
+    x, y = points[:, 0:1], points[:, 1:2]
+    x1, y1 = polygon[:, 0], polygon[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    crosses = (y1 > y) != (y2 > y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    return np.count_nonzero(crosses & (x < x_cross), axis=1) % 2 == 1
+
+
+def assign_regions(detections, regions):
+    """
+    Region of every detection, by the centre of its box.
+
+    One grid index over the box centres serves every region: each region
+    only tests the centres in the cells under its bounding rectangle. A
+    detection inside several regions goes to the first one listed, so
+    region totals add up to the sheet total.
+
+    Args:
+        detections (Detections): Detections to place.
+        regions (list of dict): 'name', 'polygon' or 'rect', and optionally the 0-based 'page'
+            of a PDF set the region applies to (default: every page).
+
+    Returns:
+        np.ndarray: (N,) int64 index into `regions`, -1 for detections outside all of them.
+    """
+    assigned = np.full(len(detections), -1, dtype=np.int64)
+    if not len(detections) or not regions:
+        return assigned
+    centres = (detections.boxes[:, :2] + detections.boxes[:, 2:]) / 2
+    index = GridIndex(np.concatenate((centres, centres), axis=1),
+                      cell_size=max(float(np.ptp(centres, axis=0).max()) / 64, 1.0))
+    for region_id, region in enumerate(regions):
+        polygon = region_polygon(region)
+        (x1, y1), (x2, y2) = polygon.min(axis=0), polygon.max(axis=0)
+        candidates = index.query(x1, y1, x2, y2)
+        candidates = candidates[assigned[candidates] < 0]
+        if region.get('page') is not None and detections.pages is not None:
+            candidates = candidates[detections.pages[candidates] == int(region['page'])]
+        if len(candidates):
+            inside = points_in_polygon(centres[candidates].astype(np.float64), polygon)
+            assigned[candidates[inside]] = region_id
+    return assigned
+
+
+def load_regions(path):
+    """Regions from a JSON file: a list of {'name', 'polygon' or 'rect', optional 'page'}."""
+    with open(path, 'r') as f:
+        regions = json.load(f)
+    for region in regions:
+        region_polygon(region)
+    return regions
@@ -0,0 +1,190 @@
+from src.detections import Detections
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def tile_grid(width, height, tile_size=640, overlap=0.2):
+    """
+    Compute overlapping tile windows covering an image.
+
+    Every tile has the same size (tiles on the right/bottom edge are shifted
+    back inside the image) so they can be stacked into a batch. Images smaller
+    than a tile produce a single window covering the whole image.
+
+    Args:
+        width (int): Image width in pixels.
+        height (int): Image height in pixels.
+        tile_size (int): Side length of a square tile in pixels.
+        overlap (float): Fraction of the tile shared with its neighbour, in [0, 1).
+
+    Returns:
+        list of (x1, y1, x2, y2) tuples.
+    """
+    if not 0 <= overlap < 1:
+        raise ValueError("overlap must be in [0, 1)")
+    stride = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, stride))
+        positions.append(length - tile_size)
+        return positions
+
+    tile_w = min(tile_size, width)
+    tile_h = min(tile_size, height)
+    return [(x, y, x + tile_w, y + tile_h) for y in starts(height) for x in starts(width)]
+
+
+def nms(boxes, scores, iou_threshold=0.5, class_ids=None, metric='iou'):
+    """
+    Greedy non-maximum suppression over NumPy arrays.
+
+    Each iteration compares the best remaining box against all others at once,
+    so the cost is O(n * kept) array operations rather than a Python pair loop.
+
+    Args:
+        boxes (np.ndarray): (N, 4) array of x1, y1, x2, y2.
+        scores (np.ndarray): (N,) confidences.
+        iou_threshold (float): Overlap above which the lower-scored box is dropped.
+        class_ids (np.ndarray or None): If given, boxes only suppress boxes of the same class.
+        metric (str): 'iou' (intersection over union) or 'ios' (intersection over the
+            smaller box), the latter matches boxes cut in half by a tile seam.
+
+    Returns:
+        np.ndarray: Indices of kept boxes, ordered by descending score.
+    """
+    keep, _ = _greedy_suppress(boxes, scores, iou_threshold, class_ids, metric, merge=False)
+    return keep
+
+
+def merge_boxes(boxes, scores, iou_threshold=0.5, class_ids=None, metric='ios'):
+    """
+    Like `nms`, but each kept box is grown to the union of the boxes it suppressed.
+
+    Used to stitch symbols split across tile seams back into one full-size box.
+
+    Returns:
+        tuple: (kept indices, (K, 4) merged boxes)
+    """
+    return _greedy_suppress(boxes, scores, iou_threshold, class_ids, metric, merge=True)
+
+
+def _greedy_suppress(boxes, scores, threshold, class_ids, metric, merge):
+    if metric not in ('iou', 'ios'):
+        raise ValueError(f"Unknown NMS metric: {metric}")
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64), np.empty((0, 4), dtype=np.float32)
+
+    shifted = boxes
+    if class_ids is not None:
+        # Shift each class into its own coordinate range so classes never overlap
+        offset = boxes.max() + 1
+        shifted = boxes + (np.asarray(class_ids, dtype=np.float32) * offset)[:, None]
+
+    x1, y1, x2, y2 = shifted[:, 0], shifted[:, 1], shifted[:, 2], shifted[:, 3]
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    order = np.argsort(-np.asarray(scores), kind='stable')
+
+    keep = []
+    merged = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.maximum(0.0, np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]))
+        h = np.maximum(0.0, np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]))
+        inter = w * h
+        if metric == 'iou':
+            denom = areas[i] + areas[rest] - inter
+        else:
+            denom = np.minimum(areas[i], areas[rest])
+        overlap = inter / np.maximum(denom, 1e-9)
+        suppressed = overlap > threshold
+        if merge:
+            group = boxes[np.concatenate(([i], rest[suppressed]))]
+            merged.append(np.concatenate((group[:, :2].min(axis=0), group[:, 2:].max(axis=0))))
+        order = rest[~suppressed]
+
+    keep = np.asarray(keep, dtype=np.int64)
+    merged = np.asarray(merged, dtype=np.float32) if merge else boxes[keep]
+    return keep, merged
+
+
+def tiled_predict(model, img, tile_size=640, overlap=0.2, batch_size=4, conf_threshold=0.0,
+                  iou_threshold=0.5, metric='ios'):
+    """
+    Run a YOLO model over an image tile by tile and merge the results.
+
+    Tiles are zero-copy views into `img` and only `batch_size` of them are
+    handed to the model at a time, so tiling adds working memory bounded by
+    the batch rather than the sheet size. This does not bound peak memory:
+    OpenCV cannot decode part of an image, so the whole decoded sheet is in
+    RAM before tiling starts and peak use still grows with the sheet. Any
+    sliceable array works as `img`, e.g. an np.memmap, whose windows are
+    then read from disk only as their batch runs.
+
+    Args:
+        model: Loaded ultralytics YOLO model.
+        img (np.ndarray): HxWx3 BGR image.
+        tile_size (int): Tile side length in pixels.
+        overlap (float): Fractional overlap between adjacent tiles.
+        batch_size (int): Number of tiles per forward pass.
+        conf_threshold (float): Passed to the model; detections below it are dropped before merging.
+        iou_threshold (float): Overlap threshold for merging duplicates across seams.
+        metric (str): Overlap metric passed to `merge_boxes`.
+
+    Returns:
+        Detections: Merged detections in global image coordinates.
+    """
+    height, width = img.shape[:2]
+    windows = tile_grid(width, height, tile_size, overlap)
+    logger.debug(f"Tiled inference: {len(windows)} tiles of {tile_size}px over {width}x{height}")
+
+    detections = predict_windows(model, img, windows, batch_size, conf_threshold)
+    if len(windows) > 1:
+        detections = merge_tiles(detections, iou_threshold, metric)
+    return detections
+
+
+def predict_windows(model, img, windows, batch_size=4, conf_threshold=0.0):
+    """
+    Run a model on the given tile windows of `img`, without merging across seams.
+
+    Returns:
+        Detections: Per-tile detections shifted into global image coordinates.
+    """
+    parts = []
+    for start in range(0, len(windows), batch_size):
+        batch_windows = windows[start:start + batch_size]
+        tiles = [img[y1:y2, x1:x2] for x1, y1, x2, y2 in batch_windows]
+        results = model(tiles, verbose=False, conf=conf_threshold)
+        for (x1, y1, _, _), result in zip(batch_windows, results):
+            tile_detections = Detections.from_result(result).filter(conf_threshold=conf_threshold)
+            if len(tile_detections):
+                parts.append(tile_detections.shift(x1, y1))
+    return Detections.concat(parts)
+
+
+def merge_tiles(detections, iou_threshold=0.5, metric='ios'):
+    """Merge duplicates of symbols seen by more than one tile (see `merge_boxes`)."""
+    if len(detections) == 0:
+        return detections
+    keep, merged = merge_boxes(detections.boxes, detections.confidences, iou_threshold,
+                               class_ids=detections.class_ids, metric=metric)
+    return Detections(detections.class_ids[keep], detections.confidences[keep], merged)
+
+
+def draw_boxes(img, detections, names=None):
+    """Draw detection boxes onto a copy of `img` (used where no ultralytics Result is available)."""
+    import cv2
+
+    annotated = img.copy()
+    for cls, (x1, y1, x2, y2) in zip(detections.class_ids, detections.boxes.astype(int).tolist()):
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 0, 255), 2)
+        label = names.get(int(cls), f"class_{cls}") if names else str(cls)
+        cv2.putText(annotated, label, (x1, max(y1 - 4, 0)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+    return annotated
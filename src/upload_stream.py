@@ -0,0 +1,152 @@
+from src.detection_cache import remember_digest
+import numpy as np
+import hashlib
+import logging
+import os
+import queue
+import struct
+import threading
+
+logger = logging.getLogger(__name__)
+
+def read_upload(stream, chunk_size=1 << 20):
+    """
+    Read an upload stream into memory, hashing it as the chunks arrive.
+
+    Returns:
+        tuple: (bytes, SHA-256 hex digest), the digest matching hash_file() of the saved upload
+    """
+    digest = hashlib.sha256()
+    chunks = []
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        digest.update(chunk)
+        chunks.append(chunk)
+    return b''.join(chunks), digest.hexdigest()
+
+
+def image_size(data):
+    """(width, height) from a PNG or baseline/progressive JPEG header, or None if unknown."""
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+        return struct.unpack('>II', data[16:24])
+    if data[:2] != b'\xff\xd8':
+        return None
+    offset = 2
+    while offset + 9 < len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        length = struct.unpack('>H', data[offset + 2:offset + 4])[0]
+        # SOF0-SOF15, excluding DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack('>HH', data[offset + 5:offset + 9])
+            return width, height
+        offset += 2 + length
+    return None
+
+
+def decode_image(data, min_size=None):
+    """
+    Decode image bytes to a BGR array without touching the disk.
+
+    With `min_size`, JPEG/PNG sheets much larger than the model input are
+    decoded at 1/2, 1/4 or 1/8 resolution (libjpeg's DCT scaling makes this
+    far cheaper than a full decode) while keeping the long side at least
+    `min_size` pixels.
+
+    Returns:
+        tuple: (BGR image, factor by which the image was reduced)
+    """
+    import cv2
+
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if min_size:
+        size = image_size(data)
+        if size is not None:
+            # Reduced-resolution decode factors supported by cv2.imdecode
+            reduced = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                       (2, cv2.IMREAD_REDUCED_COLOR_2))
+            for factor, flag in reduced:
+                if max(size) // factor >= min_size:
+                    img = cv2.imdecode(buffer, flag)
+                    if img is not None:
+                        return img, factor
+                    break
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR), 1
+
+
+class UploadWriter:
+    """
+    Persists uploaded files from a background thread.
+
+    Requests hand the bytes over and return immediately; `wait` blocks until
+    a given path is on disk for code that needs to read it back. Files are
+    written to a temporary name and renamed, so readers never see a partial
+    upload.
+    """
+
+    def __init__(self, max_pending=64):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name='upload-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, path, data, digest=None):
+        """Queue `data` to be written to `path`; blocks only when `max_pending` writes are outstanding."""
+        self.start()
+        done = threading.Event()
+        with self._lock:
+            self._pending[os.path.abspath(path)] = done
+        self._queue.put((path, data, digest, done))
+        return done
+
+    def wait(self, path, timeout=None):
+        """Block until a queued write of `path` has finished. Returns False on timeout."""
+        with self._lock:
+            done = self._pending.get(os.path.abspath(path))
+        return done is None or done.wait(timeout)
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _worker(self):
+        while True:
+            path, data, digest, done = self._queue.get()
+            try:
+                tmp_path = path + '.part'
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                if digest is not None:
+                    # Spare later path-based cache lookups from re-hashing the file
+                    remember_digest(path, digest)
+            except Exception:
+                logger.exception(f"Failed to persist upload {path}")
+            finally:
+                with self._lock:
+                    if self._pending.get(os.path.abspath(path)) is done:
+                        del self._pending[os.path.abspath(path)]
+                done.set()
+                self._queue.task_done()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_upload_writer():
+    """Return the process-wide upload writer."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = UploadWriter()
+        return _writer
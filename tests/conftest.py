@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+# Keep caches, artifacts and the counter database out of the working tree; set before any src module reads them
+_state_dir = tempfile.mkdtemp(prefix='aipqs-tests-')
+os.environ.setdefault('AIPQS_DETECTION_CACHE', os.path.join(_state_dir, 'detections'))
+os.environ.setdefault('AIPQS_ARTIFACT_DIR', os.path.join(_state_dir, 'artifacts'))
+os.environ.setdefault('AIPQS_NEAR_DUPLICATE_INDEX', os.path.join(_state_dir, 'near_duplicates.sqlite'))
+os.environ.setdefault('AIPQS_WARMUP_ON_IMPORT', '0')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,17 @@
+from src.app import app, upload_name
+from src.artifact_store import get_artifact_store
+from benchmarks.synthetic import make_blueprint
+import cv2
+import io
+
+
+def test_invalid_form_stores_no_upload():
+    img, _ = make_blueprint(400, 300, 20, seed=3)
+    data = cv2.imencode('.png', img)[1].tobytes()
+    client = app.test_client()
+
+    response = client.post('/', data={'blueprint': (io.BytesIO(data), 'rejected_sheet.png'), 'tax_percent': 'ten'},
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 302
+    assert get_artifact_store().digest(upload_name('rejected_sheet.png')) is None
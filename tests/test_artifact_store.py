@@ -0,0 +1,33 @@
+from src.artifact_store import ArtifactStore
+import sqlite3
+
+
+def _summed(store):
+    return store._conn.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+
+
+def test_running_total_follows_adds_and_evictions(tmp_path):
+    store = ArtifactStore(str(tmp_path), max_bytes=0, ttl=0)
+    store.add_bytes('a', b'a' * 100)
+    store.add_bytes('a-again', b'a' * 100)
+    store.add_bytes('b', b'b' * 50)
+    assert store.total_bytes() == _summed(store) == 150
+    assert store.stats()['bytes'] == 150
+
+    store.max_bytes = 60
+    # Far enough ahead that nothing is too recent to evict
+    assert store.evict(now=1e12) == 100
+    assert store.total_bytes() == _summed(store) == 50
+    assert store.lookup('a') is None and store.lookup('b') is not None
+
+
+def test_running_total_is_seeded_for_existing_indexes(tmp_path):
+    store = ArtifactStore(str(tmp_path), max_bytes=0, ttl=0)
+    store.add_bytes('a', b'a' * 100)
+    store._conn.close()
+    conn = sqlite3.connect(str(tmp_path / 'index.sqlite'))
+    conn.execute("DROP TABLE totals")
+    conn.commit()
+    conn.close()
+
+    assert ArtifactStore(str(tmp_path), max_bytes=0, ttl=0).total_bytes() == 100
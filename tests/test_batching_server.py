@@ -0,0 +1,72 @@
+from src.batching_server import MicroBatcher
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import pytest
+
+
+class EchoModel:
+    """Returns each frame back as its result; blocks the first call until `release` is set."""
+
+    names = {0: 'frame'}
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.entered = threading.Event()
+        self.calls = []
+
+    def __call__(self, images, **kwargs):
+        self.calls.append(len(images))
+        self.entered.set()
+        self.release.wait(5)
+        return list(images)
+
+
+def test_queued_frames_are_served_before_close():
+    model = EchoModel()
+    batcher = MicroBatcher(model, max_batch=2, max_wait_ms=0)
+    with ThreadPoolExecutor(4) as pool:
+        first = pool.submit(batcher, 'a')
+        model.entered.wait(5)
+        rest = [pool.submit(batcher, frame) for frame in 'bcd']
+        while batcher.stats()['queue_depth'] < 3:
+            pass
+        batcher.close()
+        model.release.set()
+        assert first.result(5) == ['a']
+        assert [future.result(5) for future in rest] == [['b'], ['c'], ['d']]
+    batcher._thread.join(5)
+    assert not batcher._thread.is_alive()
+
+
+def test_closed_batcher_runs_calls_unbatched():
+    model = EchoModel()
+    model.release.set()
+    batcher = MicroBatcher(model)
+    batcher.close()
+    batcher._thread.join(5)
+
+    assert batcher(['x', 'y']) == ['x', 'y']
+    assert batcher._queue.qsize() == 0
+
+
+def test_leftover_frames_fail_when_the_thread_dies():
+    model = EchoModel()
+    batcher = MicroBatcher(model, max_batch=1, max_wait_ms=0)
+
+    def broken_record(batch, started):
+        raise RuntimeError('boom')
+
+    batcher._record = broken_record
+    with ThreadPoolExecutor(3) as pool:
+        first = pool.submit(batcher, 'a')
+        model.entered.wait(5)
+        rest = [pool.submit(batcher, frame) for frame in 'bc']
+        while batcher.stats()['queue_depth'] < 2:
+            pass
+        model.release.set()
+        assert first.result(5) == ['a']
+        for future in rest:
+            with pytest.raises(RuntimeError, match='stopped before serving'):
+                future.result(5)
+    # Later calls bypass the dead thread instead of hanging
+    assert batcher('d') == ['d']
@@ -0,0 +1,23 @@
+from src.main import run_bulk
+from benchmarks.stub_model import STUB_MODEL_PATH, install_stub
+from benchmarks.synthetic import write_blueprints
+import os
+
+
+def test_run_bulk_reports_only_unreadable_sheets_missing(tmp_path, monkeypatch):
+    # The quotation counter store lives in the working directory
+    monkeypatch.chdir(tmp_path)
+    install_stub()
+    blueprints = os.path.join(str(tmp_path), 'blueprints')
+    sheets = [path for path, _ in write_blueprints(blueprints, count=3, width=800, height=600, density=20)]
+    bad = os.path.join(blueprints, 'a_bad.png')
+    with open(bad, 'wb') as f:
+        f.write(b'not an image')
+
+    summary = run_bulk(blueprints, model_path=STUB_MODEL_PATH, output_dir=os.path.join(str(tmp_path), 'output'),
+                       use_cache=False, batch_size=4, render_workers=1)
+
+    assert [os.path.abspath(path) for path in summary['missing']] == [os.path.abspath(bad)]
+    assert sorted(os.path.abspath(sheet['blueprint']) for sheet in summary['sheets']) == \
+        sorted(os.path.abspath(path) for path in sheets)
+    assert summary['totals']['sheets'] == len(sheets)
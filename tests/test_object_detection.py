@@ -0,0 +1,34 @@
+from src.object_detection import iter_detections
+from benchmarks.stub_model import STUB_MODEL_PATH, install_stub
+from benchmarks.synthetic import write_blueprints
+import os
+
+
+def _write_unreadable(path):
+    with open(path, 'wb') as f:
+        f.write(b'not an image')
+    return path
+
+
+def test_unreadable_image_at_head_of_batch_keeps_the_rest(tmp_path):
+    install_stub()
+    sheets = [path for path, _ in write_blueprints(str(tmp_path), count=3, width=800, height=600, density=20)]
+    # Sorts first, so it heads the only batch
+    bad = _write_unreadable(os.path.join(str(tmp_path), 'a_bad.png'))
+
+    results = dict(iter_detections(str(tmp_path), model_path=STUB_MODEL_PATH, batch_size=4, use_cache=False))
+
+    assert sorted(results) == sorted(sheets)
+    assert bad not in results
+    assert all(results[path] for path in sheets)
+
+
+def test_unreadable_image_inside_batch_is_skipped(tmp_path):
+    install_stub()
+    sheets = [path for path, _ in write_blueprints(str(tmp_path), count=3, width=800, height=600, density=20)]
+    bad = _write_unreadable(os.path.join(str(tmp_path), 'blueprint_800x600_001a.png'))
+
+    paths = [sheets[0], sheets[1], bad, sheets[2]]
+    results = list(iter_detections(paths, model_path=STUB_MODEL_PATH, batch_size=2, use_cache=False))
+
+    assert [path for path, _ in results] == sheets
@@ -0,0 +1,56 @@
+from src.detection_cache import get_detection_cache, make_raw_key
+from src.detections import Detections
+from src.model_registry import model_identity
+from src.quotation_generator import QuotationGenerator
+from src.revisions import RevisionStore, requote_revision
+from benchmarks.stub_model import STUB_MODEL_PATH, install_stub
+from benchmarks.synthetic import SYMBOL_COLORS, make_blueprint
+import cv2
+
+
+def _encode(img):
+    return cv2.imencode('.png', img)[1].tobytes()
+
+
+def _revisions(seed):
+    img, _ = make_blueprint(1600, 1200, 40, seed=seed)
+    revised = img.copy()
+    cv2.rectangle(revised, (700, 500), (724, 524), SYMBOL_COLORS[0], -1)
+    return img, revised
+
+
+def test_incremental_results_are_not_cached_as_full_runs(tmp_path):
+    install_stub()
+    store = RevisionStore(str(tmp_path))
+    img, revised = _revisions(seed=11)
+    options = dict(model_path=STUB_MODEL_PATH, tile_size=640, store=store)
+
+    first = requote_revision(_encode(img), 'a.png', drawing='sheet', **options)
+    second = requote_revision(_encode(revised), 'b.png', drawing='sheet', **options)
+
+    assert first['mode'] == 'full'
+    assert second['mode'] == 'incremental'
+    cache = get_detection_cache()
+    model_id = model_identity(STUB_MODEL_PATH)
+    assert cache.get(make_raw_key(first['digest'], model_id, 0.15, tile_size=640, tile_overlap=0.2)[0]) is not None
+    assert cache.get(make_raw_key(second['digest'], model_id, 0.15, tile_size=640, tile_overlap=0.2)[0]) is None
+
+
+def test_changes_compare_deduplicated_quantities(tmp_path):
+    install_stub()
+    store = RevisionStore(str(tmp_path))
+    generator = QuotationGenerator(counts_file=str(tmp_path / 'counts.json'), duplicate_overlap=0.5)
+    img, _ = _revisions(seed=12)
+    options = dict(model_path=STUB_MODEL_PATH, tile_size=640, store=store, generator=generator, use_cache=False)
+    first = requote_revision(_encode(img), 'a.png', **options)
+
+    # An earlier revision whose raw detections hold a near-copy of one box, as overlapping tiles can produce
+    state = store.load(first['digest'])
+    raw = Detections.concat([state['raw'], state['raw'][:1].shift(1, 1)]).sort_by_confidence()
+    previous_digest = '0' * 64
+    store.save(previous_digest, state['thumb'], state['shape'], state['settings'], raw)
+
+    result = requote_revision(_encode(img), 'a.png', previous_digest=previous_digest, **options)
+
+    assert result['mode'] == 'incremental'
+    assert result['changes'] == {'changed_items': [], 'total_cost_delta': 0}
@@ -0,0 +1,25 @@
+from src.detections import Detections
+from src.spatial_index import suppress_overlaps
+from src.tiling import nms
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize('metric, threshold', [('iou', 0.3), ('iou', 0.5), ('ios', 0.6)])
+def test_suppress_overlaps_matches_greedy_nms(metric, threshold):
+    rng = np.random.default_rng(0)
+    for trial in range(60):
+        n = int(rng.integers(0, 300))
+        corners = rng.uniform(0, 800, (n, 2))
+        boxes = np.concatenate([corners, corners + rng.uniform(5, 60, (n, 2))], axis=1).astype(np.float32)
+        class_ids = rng.integers(0, 3, n)
+        scores = rng.uniform(0, 1, n).astype(np.float32)
+        if trial % 3 == 0:
+            # Ties in confidence must be broken the same way
+            scores = np.round(scores, 1)
+        detections = Detections(class_ids, scores, boxes)
+
+        expected = np.zeros(n, dtype=bool)
+        expected[nms(boxes, scores, threshold, class_ids=class_ids, metric=metric)] = True
+
+        np.testing.assert_array_equal(suppress_overlaps(detections, threshold, metric), expected)
@@ -0,0 +1,40 @@
+from model.train_cache import build_cache
+from benchmarks.synthetic import make_blueprint
+import numpy as np
+import cv2
+import os
+import shutil
+
+
+def _write_dataset(root):
+    images, labels = os.path.join(root, 'images', 'train'), os.path.join(root, 'labels', 'train')
+    os.makedirs(images)
+    os.makedirs(labels)
+    for i in range(3):
+        img, _ = make_blueprint(320, 240, 20, seed=i)
+        cv2.imwrite(os.path.join(images, f"sheet_{i}.png"), img)
+        with open(os.path.join(labels, f"sheet_{i}.txt"), 'w') as f:
+            f.write("0 0.5 0.5 0.1 0.1\n")
+    with open(os.path.join(images, 'broken.png'), 'wb') as f:
+        f.write(b'not an image')
+    with open(os.path.join(root, 'data.yaml'), 'w') as f:
+        f.write("path: .\ntrain: images/train\nnames:\n  0: switch\n")
+
+
+def test_moved_dataset_reuses_its_store(tmp_path):
+    original = str(tmp_path / 'original')
+    _write_dataset(original)
+    store = build_cache(os.path.join(original, 'data.yaml'), imgsz=160, workers=2)
+    assert len(store) == 3
+    assert store.rejected == {os.path.join(original, 'images', 'train', 'broken.png')}
+
+    moved = str(tmp_path / 'moved')
+    shutil.move(original, moved)
+    reused = build_cache(os.path.join(moved, 'data.yaml'), imgsz=160, workers=2)
+
+    assert os.path.basename(reused.directory) == os.path.basename(store.directory)
+    assert reused.manifest['created'] == store.manifest['created']
+    assert sorted(reused.index) == [os.path.join(moved, 'images', 'train', f"sheet_{i}.png") for i in range(3)]
+    assert reused.rejected == {os.path.join(moved, 'images', 'train', 'broken.png')}
+    row = reused.index[os.path.join(moved, 'images', 'train', 'sheet_1.png')]
+    assert np.allclose(reused.labels(row), [[0, 0.5, 0.5, 0.1, 0.1]])